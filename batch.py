@@ -0,0 +1,206 @@
+"""
+Apply a chain of toolkit operators to many images without the GUI.
+
+Examples:
+
+    python batch.py Images -c "median:5 | canny | equalize" -o output
+    python batch.py "Images/*.jpg" -c "gaussian_noise:20 | median:3" -o output -j 8 --report timings.json
+
+Available operators: median, average, gaussian, salt_pepper, gaussian_noise,
+uniform_noise, sobel, roberts, prewitt, canny, global_threshold,
+local_threshold, equalize, normalize, gamma, contrast_stretch, low_pass,
+high_pass.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import cv2
+
+from src.ImageStore import IMAGE_EXTENSIONS
+from src.Graph import Graph
+from src.Operators import OperatorChain, as_uint8
+from src.Precision import PRECISIONS, set_precision
+
+# Operator graph built once per worker process by the pool initializer
+_worker_graph = None
+
+
+def collect_inputs(patterns):
+    """
+    Expand directories and glob patterns into a sorted list of image files.
+    """
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+        else:
+            candidates = glob.glob(pattern, recursive=True)
+        paths.update(path for path in candidates
+                     if os.path.isfile(path) and path.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def _init_worker(chain_spec, precision="compact"):
+    global _worker_graph
+    set_precision(precision)
+    # Runs of point operators in the chain are fused into one pass, and their buffers reused from file to file
+    _worker_graph = Graph.from_chain(chain_spec)
+    # Each process handles one file at a time, so keep OpenCV from oversubscribing the cores
+    cv2.setNumThreads(1)
+
+
+def process_file(path, output_dir, extension, grey_flag=True):
+    """
+    Read, process and write one image.
+
+    Returns:
+        dict: The input and output paths, per-stage timings in seconds and an error message if it failed.
+    """
+    timings = []
+    result = {"input": path, "output": None, "timings": timings, "error": None}
+    try:
+        start = time.perf_counter()
+        image = cv2.imread(path, cv2.IMREAD_GRAYSCALE if grey_flag else cv2.IMREAD_COLOR)
+        if image is None:
+            raise FileNotFoundError(f"Failed to load image: {path}")
+        timings.append(("read", time.perf_counter() - start))
+
+        _worker_graph.set_source(image)
+        processed = as_uint8(_worker_graph.compute(timings=timings))
+
+        start = time.perf_counter()
+        output_path = os.path.join(output_dir, os.path.splitext(os.path.basename(path))[0] + extension)
+        if not cv2.imwrite(output_path, processed):
+            raise OSError(f"Failed to write image: {output_path}")
+        timings.append(("write", time.perf_counter() - start))
+        result["output"] = output_path
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+
+def run_batch(paths, chain_spec, output_dir, workers=None, extension=".png", grey_flag=True, on_result=None,
+              precision="compact"):
+    """
+    Process every path on a process pool, streaming results as files finish.
+
+    Only a bounded number of files is in flight at once, so very large
+    datasets do not queue every task up front.
+
+    Args:
+        paths (list): Input image paths.
+        chain_spec (str): Operator chain, e.g. "median:5 | canny".
+        output_dir (str): Directory the results are written to.
+        workers (int, optional): Number of worker processes, default is the CPU count.
+        extension (str): Output file extension, which selects the encoder.
+        grey_flag (bool): Load inputs as grayscale when True, as BGR otherwise.
+        on_result (callable, optional): Called with each result dict as soon as it is available.
+        precision (str): Precision policy of the workers, "compact" or "double" (see src.Precision).
+
+    Returns:
+        list: The result dicts in completion order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    results = []
+    pending = set()
+    path_iter = iter(paths)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(chain_spec, precision)) as executor:
+        while True:
+            for path in path_iter:
+                pending.add(executor.submit(process_file, path, output_dir, extension, grey_flag))
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+    return results
+
+
+def summarize(results):
+    """
+    Aggregate per-stage timings over all successful files.
+
+    Returns:
+        dict: stage label -> {"count", "total", "mean", "max"} in seconds.
+    """
+    summary = {}
+    for result in results:
+        if result["error"] is not None:
+            continue
+        for label, seconds in result["timings"]:
+            stage = summary.setdefault(label, {"count": 0, "total": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["total"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+    for stage in summary.values():
+        stage["mean"] = stage["total"] / stage["count"]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="Image files, directories or glob patterns")
+    parser.add_argument("-c", "--chain", required=True, help='Operator chain, e.g. "median:5 | canny | equalize"')
+    parser.add_argument("-o", "--output", required=True, help="Output directory")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--format", default="png", help="Output image format (default: png)")
+    parser.add_argument("--color", action="store_true", help="Load inputs in color instead of grayscale")
+    parser.add_argument("--precision", choices=sorted(PRECISIONS), default="compact",
+                        help="Float precision of intermediates (default: compact, float32)")
+    parser.add_argument("--report", help="Write per-file and per-stage timings to this JSON file")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print the summary")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = OperatorChain.parse(args.chain)
+        chain.check_channels(3 if args.color else 1)
+    except ValueError as e:
+        parser.error(str(e))
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("No input images found")
+
+    def report_file(result):
+        if result["error"] is not None:
+            print(f"FAILED {result['input']}: {result['error']}", file=sys.stderr)
+        elif not args.quiet:
+            total = sum(seconds for _, seconds in result["timings"])
+            stages = ", ".join(f"{label} {seconds * 1000:.1f}" for label, seconds in result["timings"])
+            print(f"{result['input']}: {total * 1000:.1f} ms ({stages})")
+
+    print(f"Processing {len(paths)} images with '{chain}'")
+    start = time.perf_counter()
+    results = run_batch(paths, args.chain, args.output, args.workers, "." + args.format.lstrip("."),
+                        grey_flag=not args.color, on_result=report_file, precision=args.precision)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results)
+    failures = sum(result["error"] is not None for result in results)
+    print(f"\n{len(results) - failures} succeeded, {failures} failed in {elapsed:.2f} s "
+          f"({len(results) / elapsed:.1f} images/s)")
+    print(f"{'stage':<24}{'mean (ms)':>12}{'max (ms)':>12}{'total (s)':>12}")
+    for label, stage in summary.items():
+        print(f"{label:<24}{stage['mean'] * 1000:>12.2f}{stage['max'] * 1000:>12.2f}{stage['total']:>12.2f}")
+
+    if args.report:
+        with open(args.report, "w") as report_file_handle:
+            json.dump({"chain": str(chain), "elapsed": elapsed, "stages": summary, "files": results},
+                      report_file_handle, indent=2)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
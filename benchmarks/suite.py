@@ -0,0 +1,325 @@
+"""
+Benchmark every toolkit operator over a grid of image sizes, dtypes and kernel sizes.
+
+Each operator runs on synthetic images and reports its best wall time
+over a few repeats, its throughput in megapixels per second and the peak
+memory it allocated through numpy (tracked with tracemalloc in a separate
+run, so tracing does not slow the timed runs). OpenCV's internal scratch
+buffers are not visible to tracemalloc, only the arrays it returns.
+
+Run from the repository root:
+
+    python -m benchmarks.suite --sizes 512 2048 --dtypes uint8 float32 --kernels 3 9 -o current.json
+    python -m benchmarks.suite --operators "edge.*" "filter.median" --baseline baseline.json
+    python -m benchmarks.suite --compare baseline.json current.json --threshold 0.15
+
+With --baseline, or in --compare mode, every case that got slower (or
+allocates more) than the baseline by more than the threshold is listed
+and the exit status is 1.
+
+With --precisions compact double, every case runs under both precision
+policies (see src.Precision) and a memory report lists each operator's
+peak allocation under both and the reduction of the compact policy:
+
+    python -m benchmarks.suite --sizes 2048 --shape 4000 6000 --precisions compact double
+"""
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+
+from benchmarks.canny_benchmark import synthetic_image
+from src.Decoding import Decoding
+from src.Edge_Detector import EdgeDetector
+from src.Filters import Filter
+from src.Histogram import get_histograms
+from src.Hybrid import FrequencyMaskCache, Hybrid
+from src.Noise import Noise
+from src.Precision import PRECISIONS, get_precision, set_precision
+from src.Thresholding import thresholding
+
+DTYPES = {"uint8": np.uint8, "uint16": np.uint16, "float32": np.float32}
+
+
+class Case:
+    """
+    One operator to benchmark.
+
+    Args:
+        name (str): Dotted name, e.g. "filter.median".
+        function (callable): function(image, kernel_size) running the operator once.
+        uses_kernel (bool): Whether the operator is run once per kernel size of the grid.
+    """
+
+    def __init__(self, name, function, uses_kernel=False):
+        self.name = name
+        self.function = function
+        self.uses_kernel = uses_kernel
+
+
+def _hybrid():
+    # A fresh mask cache per run, so every repeat pays for its mask as a first slider move does
+    return Hybrid(mask_cache=FrequencyMaskCache())
+
+
+def _local_threshold(image, kernel_size, method):
+    return thresholding(image).local_thresholding(method, kernel_size)
+
+
+CASES = [
+    Case("filter.median", lambda image, k: Filter(image, k).median_filter(), uses_kernel=True),
+    Case("filter.average", lambda image, k: Filter(image, k).average_filter(), uses_kernel=True),
+    Case("filter.gaussian", lambda image, k: Filter(image, k).gaussian_filter(), uses_kernel=True),
+    Case("noise.salt_pepper", lambda image, k: Noise(image, seed=0).slat_and_pepper()),
+    Case("noise.gaussian", lambda image, k: Noise(image, seed=0).gaussian_noise()),
+    Case("noise.uniform", lambda image, k: Noise(image, seed=0).uniform_noise()),
+    Case("edge.sobel", lambda image, k: EdgeDetector(image).sobel_detector()),
+    Case("edge.roberts", lambda image, k: EdgeDetector(image).roberts_detector()),
+    Case("edge.prewitt", lambda image, k: EdgeDetector(image).prewitt_detector()),
+    Case("edge.canny", lambda image, k: EdgeDetector(image).canny_detector()),
+    Case("threshold.global", lambda image, k: thresholding(image).global_thresholding()),
+    Case("threshold.local_mean", lambda image, k: _local_threshold(image, k, "mean"), uses_kernel=True),
+    Case("threshold.local_sauvola", lambda image, k: _local_threshold(image, k, "sauvola"), uses_kernel=True),
+    Case("decoding.equalize", lambda image, k: Decoding(image).equalize()),
+    Case("decoding.normalize", lambda image, k: Decoding(image).normalize()),
+    Case("hybrid.low_pass", lambda image, k: _hybrid().low_pass(image, 128)),
+    Case("hybrid.high_pass", lambda image, k: _hybrid().high_pass(image, 128)),
+    Case("histogram.get_histograms", lambda image, k: get_histograms(image)),
+]
+
+
+def make_image(height, width, dtype):
+    """
+    Synthetic grayscale test image of the given dtype, spanning that dtype's usual value range.
+    """
+    image = synthetic_image(height, width)
+    if dtype == np.uint16:
+        return image.astype(np.uint16) * 257
+    if dtype == np.float32:
+        return image.astype(np.float32)
+    return image
+
+
+def measure(function, image, kernel_size, repeat):
+    """
+    Best wall time over repeat runs, then the peak numpy allocation of one traced run.
+
+    Returns:
+        tuple: (seconds, peak_bytes)
+    """
+    # Warm up caches such as OpenCV's kernel setup, which a long-running session pays only once
+    function(image, kernel_size)
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(image, kernel_size)
+        seconds = min(seconds, time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        function(image, kernel_size)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes
+
+
+def run_suite(sizes, dtypes, kernel_sizes, operators=("*",), repeat=3, on_result=None, precisions=("compact",)):
+    """
+    Run every selected operator over the grid.
+
+    Args:
+        sizes (list): (height, width) pairs.
+        dtypes (list): dtype names from DTYPES.
+        kernel_sizes (list): Kernel or window sizes for operators that take one.
+        operators (tuple): Shell-style patterns selecting operators by name, e.g. "edge.*".
+        repeat (int): Timed runs per case, the best is kept.
+        on_result (callable, optional): Called with each result dict as soon as it is measured.
+        precisions (tuple): Names of the precision policies to run every case under.
+
+    Returns:
+        list: One dict per case with the operator, size, dtype, kernel size, precision,
+        seconds, megapixels per second, peak bytes and an error message if it failed.
+    """
+    results = []
+    cases = [case for case in CASES if any(fnmatch.fnmatch(case.name, pattern) for pattern in operators)]
+    default_precision = get_precision()
+    try:
+        for height, width in sizes:
+            for dtype_name in dtypes:
+                image = make_image(height, width, DTYPES[dtype_name])
+                for case in cases:
+                    for kernel_size in (kernel_sizes if case.uses_kernel else [None]):
+                        for precision in precisions:
+                            # Operators pick the policy up when they are constructed, inside the case function
+                            set_precision(precision)
+                            result = {"operator": case.name, "size": [height, width], "dtype": dtype_name,
+                                      "kernel_size": kernel_size, "precision": precision, "seconds": None,
+                                      "mpix_per_s": None, "peak_bytes": None, "error": None}
+                            try:
+                                seconds, peak_bytes = measure(case.function, image, kernel_size, repeat)
+                                result.update(seconds=seconds, mpix_per_s=height * width / 1e6 / seconds,
+                                              peak_bytes=peak_bytes)
+                            except Exception as e:
+                                result["error"] = f"{type(e).__name__}: {e}"
+                            results.append(result)
+                            if on_result is not None:
+                                on_result(result)
+    finally:
+        set_precision(default_precision)
+    return results
+
+
+def environment():
+    """
+    Versions and machine details stored with the results, to tell apart runs that are not comparable.
+    """
+    return {"date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "numpy": np.__version__, "opencv": cv2.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(), "opencv_threads": cv2.getNumThreads()}
+
+
+def case_key(result):
+    # Results saved before precision policies existed ran in what is now the compact policy
+    return (result["operator"], tuple(result["size"]), result["dtype"], result["kernel_size"],
+            result.get("precision", "compact"))
+
+
+def compare(baseline, current, threshold=0.1, min_seconds=0.0005):
+    """
+    Find the cases that got slower or allocate more than in the baseline.
+
+    Args:
+        baseline (list): Result dicts of the reference run.
+        current (list): Result dicts of the run to check.
+        threshold (float): Allowed relative increase, e.g. 0.1 for 10 %.
+        min_seconds (float): Slowdowns smaller than this are timer noise and never reported.
+
+    Returns:
+        list: (result, metric, baseline value, current value) for every regression.
+    """
+    reference = {case_key(result): result for result in baseline if result["error"] is None}
+    regressions = []
+    for result in current:
+        previous = reference.get(case_key(result))
+        if previous is None:
+            continue
+        if result["error"] is not None:
+            regressions.append((result, "error", previous["seconds"], result["error"]))
+            continue
+        if (result["seconds"] > previous["seconds"] * (1 + threshold)
+                and result["seconds"] - previous["seconds"] > min_seconds):
+            regressions.append((result, "seconds", previous["seconds"], result["seconds"]))
+        if result["peak_bytes"] > previous["peak_bytes"] * (1 + threshold):
+            regressions.append((result, "peak_bytes", previous["peak_bytes"], result["peak_bytes"]))
+    return regressions
+
+
+def describe(result):
+    kernel = "" if result["kernel_size"] is None else f" k={result['kernel_size']}"
+    precision = result.get("precision", "compact")
+    precision = "" if precision == "compact" else f" [{precision}]"
+    return f"{result['operator']} {result['size'][0]}x{result['size'][1]} {result['dtype']}{kernel}{precision}"
+
+
+def print_result(result):
+    if result["error"] is not None:
+        print(f"{describe(result):<48}{'failed: ' + result['error']}")
+    else:
+        print(f"{describe(result):<48}{result['seconds'] * 1000:>12.2f}{result['mpix_per_s']:>12.1f}"
+              f"{result['peak_bytes'] / 2 ** 20:>14.1f}")
+
+
+def print_regressions(regressions, threshold):
+    if not regressions:
+        print(f"\nNo regressions beyond {threshold:.0%}")
+        return
+    print(f"\n{len(regressions)} regressions beyond {threshold:.0%}:")
+    for result, metric, before, after in regressions:
+        if metric == "error":
+            print(f"  {describe(result)}: now fails ({after})")
+        else:
+            print(f"  {describe(result)}: {metric} {before:.6g} -> {after:.6g} ({after / before - 1:+.0%})")
+
+
+def memory_report(results, reference="double", compact="compact"):
+    """
+    Pair every case's peak allocation under two precision policies.
+
+    Returns:
+        list: (description, reference peak bytes, compact peak bytes) per case measured under both.
+    """
+    peaks = {case_key(result): result["peak_bytes"] for result in results if result["error"] is None}
+    rows = []
+    for result in results:
+        key = case_key(result)
+        if key[-1] != compact or key not in peaks or key[:-1] + (reference,) not in peaks:
+            continue
+        rows.append((describe(result), peaks[key[:-1] + (reference,)], peaks[key]))
+    return rows
+
+
+def print_memory_report(rows, reference="double", compact="compact"):
+    print(f"\n{'case':<48}{reference + ' (MiB)':>16}{compact + ' (MiB)':>16}{'reduction':>12}")
+    for description, reference_peak, compact_peak in rows:
+        reduction = 1 - compact_peak / reference_peak if reference_peak else 0.0
+        print(f"{description:<48}{reference_peak / 2 ** 20:>16.1f}{compact_peak / 2 ** 20:>16.1f}{reduction:>12.0%}")
+
+
+def load_results(path):
+    with open(path) as results_file:
+        return json.load(results_file)["results"]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 2048],
+                        help="Square image sizes (default: 512 2048)")
+    parser.add_argument("--shape", type=int, nargs=2, action="append", metavar=("HEIGHT", "WIDTH"),
+                        help="Add a non-square image size (repeatable)")
+    parser.add_argument("--dtypes", nargs="+", default=["uint8"], choices=sorted(DTYPES))
+    parser.add_argument("--kernels", type=int, nargs="+", default=[3, 9, 25])
+    parser.add_argument("--operators", nargs="+", default=["*"], help='Operator name patterns, e.g. "edge.*"')
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--precisions", nargs="+", default=["compact"], choices=sorted(PRECISIONS),
+                        help="Precision policies to run every case under; with two, print a memory report")
+    parser.add_argument("-o", "--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare the run against the results in this JSON file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Only compare two saved result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Allowed relative slowdown (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        regressions = compare(load_results(args.compare[0]), load_results(args.compare[1]), args.threshold)
+        print_regressions(regressions, args.threshold)
+        return 1 if regressions else 0
+
+    sizes = [(size, size) for size in args.sizes] + [tuple(shape) for shape in args.shape or []]
+    print(f"{'case':<48}{'time (ms)':>12}{'MP/s':>12}{'peak (MiB)':>14}")
+    results = run_suite(sizes, args.dtypes, args.kernels, args.operators, args.repeat, on_result=print_result,
+                        precisions=args.precisions)
+    if {"compact", "double"} <= set(args.precisions):
+        print_memory_report(memory_report(results))
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"environment": environment(), "results": results}, output_file, indent=2)
+
+    if args.baseline:
+        regressions = compare(load_results(args.baseline), results, args.threshold)
+        print_regressions(regressions, args.threshold)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
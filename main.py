@@ -1,7 +1,9 @@
 import cv2
+import numpy as np
 from PyQt6 import QtWidgets, uic
-from PyQt6.QtWidgets import QVBoxLayout, QFileDialog
-from PyQt6.QtGui import QIcon
+from PyQt6.QtWidgets import QVBoxLayout, QFileDialog, QProgressBar
+from PyQt6.QtCore import Qt
+from PyQt6.QtGui import QIcon, QKeySequence, QShortcut
 import sys
 import pyqtgraph as pg
 from functools import partial
@@ -9,12 +11,20 @@ from src.Filters import Filter
 from src.Noise import Noise
 from src.Hybrid import Hybrid
 from src.Edge_Detector import EdgeDetector
-from src.imageViewPort import ImageViewport
+from src.imageViewPort import ImageViewport, scale_to_fit
 from src.Thresholding import thresholding
 from src.Decoding import Decoding
-from src.Histogram import get_histograms
+from src.Histogram import get_histograms, compute_histogram
+from src.Workers import JobScheduler
+from src.ResultCache import result_cache
+from src.ImageStore import image_store
+from src.Precision import set_precision
+from src.Profiler import profiler
+from src.ProfilerPanel import ProfilerPanel
 
 class MainWindow(QtWidgets.QMainWindow):
+    # Output port shown on each tab that has one (Filters, Edges, Threshold, Hybrid)
+    TAB_OUTPUT_PORTS = {0: 0, 1: 1, 3: 2, 4: 5}
 
     def __init__(self, *args, **kwargs):
         super(MainWindow, self).__init__(*args, **kwargs)
@@ -28,8 +38,26 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui = None
         self.original_img = None
         self.kernal_size = None
-        self.hybrid = Hybrid()
+        # Results of deterministic operators, so re-applying one to the same image is free
+        self.results = result_cache
+        self.hybrid = Hybrid(result_cache=self.results)
+        self.preview_hybrid = Hybrid(result_cache=self.results)
+        # (image fingerprint, EdgeDetector) pairs, most recent first
+        self.edge_detectors = []
+        # Full resolution image behind each output port and whether a job is still computing it
+        self.full_res_results = {}
+        self.full_res_pending = {}
+        # Jobs waiting for the full resolution results they read, by output port: (input ports, start)
+        self.waiting_jobs = {}
+        self.jobs = None
+        self.job_names = {}
+        self.busy_indicator = None
         self.image_paths = [None for _ in range(6)]
+        self.df_widgets = {}
+        self.cdf_widgets = {}
+        self.hist_plot_items = {}
+        self.histogram = None
+        self.histogram_image = None
         self.init_ui()
 
 
@@ -61,6 +89,33 @@ class MainWindow(QtWidgets.QMainWindow):
         self.ui.hybridButton.clicked.connect(partial(self.apply_changes, class_type= Hybrid, action_type= "generate_hybrid", index=5))
         self.ui.comboBox_1.currentIndexChanged.connect(partial(self.onComboBoxChanged, isFirst = True))
         self.ui.comboBox_2.currentIndexChanged.connect(partial(self.onComboBoxChanged, isFirst = False))
+        self.init_jobs()
+        QShortcut(QKeySequence.StandardKey.Save, self, self.save_output)
+        self.init_profiler_panel()
+
+    def init_jobs(self):
+        """
+        Create the worker pool running the operators and the busy indicator in the status bar.
+        """
+        self.jobs = JobScheduler(parent=self)
+        self.jobs.finished.connect(self.on_job_finished)
+        self.jobs.failed.connect(self.on_job_failed)
+        self.jobs.busy_changed.connect(self.on_jobs_busy)
+        self.busy_indicator = QProgressBar()
+        # A zero range shows an indeterminate busy animation
+        self.busy_indicator.setRange(0, 0)
+        self.busy_indicator.setMaximumWidth(120)
+        self.busy_indicator.setVisible(False)
+        self.statusBar().addPermanentWidget(self.busy_indicator)
+
+    def init_profiler_panel(self):
+        """
+        Add the profiling panel as a hidden dock widget, shown and hidden with F12.
+        """
+        self.profiler_panel = ProfilerPanel(self)
+        self.addDockWidget(Qt.DockWidgetArea.BottomDockWidgetArea, self.profiler_panel)
+        self.profiler_panel.hide()
+        QShortcut(QKeySequence("F12"), self, self.profiler_panel.toggleViewAction().trigger)
 
     def load_ui_elements(self):
         """
@@ -189,8 +244,13 @@ class MainWindow(QtWidgets.QMainWindow):
             # Show the image on all viewports except the last hybrid viewport
             else:
                 for idx, (input_port, output_port) in enumerate(zip(self.input_ports[:3], self.out_ports[:3])):
+                    self.forget_jobs(idx)
                     input_port.set_image(image_path)
                     output_port.set_image(image_path, grey_flag=True)
+                    self.full_res_results[idx] = output_port.original_img
+
+            # Decode the neighbouring images in the background, so browsing through the folder is quick
+            image_store.prefetch_neighbours(image_path)
 
         # Generate histograms and distributions
         self.generate_hists_and_dists(index)
@@ -240,9 +300,11 @@ class MainWindow(QtWidgets.QMainWindow):
         Args:
             index (int): The index of the port to clear.
         """
-        for _, (input_port, output_port) in enumerate(zip(self.input_ports[:3], self.out_ports[:3])):
+        for idx, (input_port, output_port) in enumerate(zip(self.input_ports[:3], self.out_ports[:3])):
+            self.forget_jobs(idx)
             input_port.clear()  # Clear the input port
             output_port.clear()  # Clear the output port
+        self.full_res_results.clear()
         self.clear_histographs()  # Clear the histographs
 
 
@@ -255,8 +317,10 @@ class MainWindow(QtWidgets.QMainWindow):
             index (int): The index of the image to be cleared in the input_ports list.
         """
         if self.image_paths[index] is not None:
+            self.forget_jobs(index)
             self.input_ports[index].set_image(self.image_paths[index])
             self.out_ports[index].set_image(self.image_paths[index], grey_flag=True)
+            self.full_res_results[index] = self.out_ports[index].original_img
 
 
 ###################################################################################
@@ -275,45 +339,39 @@ class MainWindow(QtWidgets.QMainWindow):
         Returns:
         None
         """
-        # Reset the image at the specified index
+        # Reset the image at the specified index and take its full resolution grayscale version
+        img = None
         if index < 3:
             self.reset_image(index)
-
-        # Obtain the output port for the specified index
-        output_port = self.out_ports[index]
-
-        # Obtain the resized image from the output port
-        img = output_port.resized_img
+            img = self.full_res_results.get(index)
+        elif index < 5 and self.input_ports[index].original_img is not None:
+            img = cv2.cvtColor(self.input_ports[index].original_img, cv2.COLOR_BGR2GRAY)
 
         # Check if the image is empty or None
         if (img is None or img.size == 0) and index != 5:
             print("Error: Empty or None image received.")
             return
 
-        # Create an instance of the specified class type and apply the action
-        try: 
-            if index == 3:
-                input_image = self.input_ports[index].resized_img
-                action_type = "low_pass" if self.ui.comboBox_1.currentIndex() == 0 else "high_pass"
-                action = self.hybrid
-                action_method = getattr(action, action_type)
-                processed_image = action_method(cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY), self.ui.hybridSlider1.value())
-            elif index == 4:
-                input_image = self.input_ports[index].resized_img
-                action_type = "low_pass" if self.ui.comboBox_2.currentIndex() == 0 else "high_pass"
-                action = self.hybrid
-                action_method = getattr(action, action_type)
-                processed_image = action_method(cv2.cvtColor(input_image, cv2.COLOR_BGR2GRAY), self.ui.hybridSlider2.value())
-            else:
-                action = class_type(img) if index < 5 else self.hybrid
-                action_method = getattr(action, action_type)
-                processed_image = action_method()
-
-            # Update the original image in the output port and update the display
-            output_port.original_img = processed_image
-            output_port.update_display()
-        except Exception as e:
-            print(f"Error applying filter: {e}")
+        # Build the operator; it runs on the worker pool, once on a preview proxy and once at full resolution
+        if index in (3, 4):
+            combo_box = self.ui.comboBox_1 if index == 3 else self.ui.comboBox_2
+            slider = self.ui.hybridSlider1 if index == 3 else self.ui.hybridSlider2
+            action_type = "low_pass" if combo_box.currentIndex() == 0 else "high_pass"
+            value = slider.value()
+            operator = lambda image, preview: getattr(self.hybrid_for(preview), action_type)(image, value)
+        elif class_type == EdgeDetector:
+            # Detectors on the same image share one EdgeDetector, so they reuse its gradients
+            operator = lambda image, preview: self.results.call(
+                f"EdgeDetector.{action_type}", lambda img: getattr(self.edge_detector_for(img), action_type)(), image)
+        elif index < 5:
+            operator = lambda image, preview: self.results.call(
+                f"{class_type.__name__}.{action_type}", lambda img: getattr(class_type(img), action_type)(), image)
+        else:
+            # The hybrid combines the low and high pass results, so it waits for their full resolution jobs
+            operator = lambda image, preview: getattr(self.hybrid_for(preview), action_type)()
+            self.submit_after(index, action_type, (3, 4), partial(self.submit_job, index, action_type, operator, None))
+            return
+        self.submit_job(index, action_type, operator, img)
 
 
     def apply_filter_noise(self, action_type, class_name):
@@ -322,41 +380,262 @@ class MainWindow(QtWidgets.QMainWindow):
         """
         if class_name == Noise:
             self.reset_image(0)
-        self.original_img = cv2.cvtColor(self.input_ports[0].resized_img.copy(), cv2.COLOR_BGR2GRAY)
-        output_port = self.out_ports[0]
-        img = output_port.resized_img
-        if img is None or img.size == 0:
+        if self.full_res_results.get(0) is None:
             print("Error: Empty or None image received.")
             return
         if class_name == Filter:
-            action = class_name(img, self.kernal_size)
+            kernal_size = self.kernal_size
+            operator = lambda image, preview: self.results.call(
+                f"Filter.{action_type}", lambda img, size: getattr(Filter(img, size), action_type)(), image, kernal_size)
+        else:
+            # Noise is random, so it is never served from the result cache
+            operator = lambda image, preview: getattr(class_name(image), action_type)()
+
+        def start():
+            # Filters apply on top of the current full resolution result, e.g. to denoise it,
+            # read once the job still computing that result has finished
+            img = self.full_res_results.get(0)
+            if img is None or img.size == 0:
+                print("Error: Empty or None image received.")
+                return
+            self.submit_job(0, action_type, operator, img)
+
+        self.submit_after(0, action_type, (0,), start)
+
+
+    def edge_detector_for(self, image):
+        """
+        EdgeDetector of an image, kept for the last two images (the preview and the full resolution one).
+        """
+        key = self.results.fingerprint(image)
+        for detector_key, detector in self.edge_detectors:
+            if detector_key == key:
+                return detector
+        detector = EdgeDetector(image)
+        self.edge_detectors = [(key, detector)] + self.edge_detectors[:1]
+        return detector
+
+
+    def hybrid_for(self, preview: bool):
+        """
+        Hybrid instance for preview or full resolution jobs, so their filtered images never mix.
+        """
+        return self.preview_hybrid if preview else self.hybrid
+
+
+    def submit_job(self, index: int, action_type: str, operator, image):
+        """
+        Run an operator on the worker pool and show its result in the output port at index.
+
+        When the image is much larger than the output port, the operator first
+        runs on a downsampled proxy for quick feedback, then at full resolution;
+        the full resolution result replaces the preview and is kept for export.
+        A newer job for the same output port supersedes both, so only the
+        latest request (e.g. the final slider value) is displayed.
+
+        Args:
+            index (int): The index of the output port receiving the result.
+            action_type (str): Name of the operator, shown in the status bar.
+            operator (callable): operator(image, preview) computes the processed image.
+            image (numpy.ndarray): Full resolution input, None for operators without one.
+        """
+        self.job_names[index] = action_type
+        self.full_res_pending[index] = True
+
+        def run(image, preview):
+            with profiler.span(f"{action_type} ({'preview' if preview else 'full'})", "operator"):
+                return operator(image, preview)
+
+        proxy = self.preview_proxy(index, image)
+        if proxy is not None:
+            self.jobs.submit((index, "preview"), partial(run, proxy, True))
+        else:
+            self.jobs.cancel((index, "preview"))
+        self.jobs.submit((index, "full"), partial(run, image, False))
+        self.statusBar().showMessage(f"Processing {action_type}...")
+
+
+    def submit_after(self, index: int, action_type: str, input_ports, start):
+        """
+        Start a job once the full resolution results it reads are final.
+
+        A job reading output ports whose full resolution jobs are still
+        running waits for them rather than being submitted with their old
+        results; submitting it right away could also supersede the very job
+        it depends on, as both produce the same port. A newer job for the
+        same output port replaces a waiting one.
+
+        Args:
+            index (int): The output port the job produces.
+            action_type (str): Name of the operator, shown in the status bar.
+            input_ports (tuple): Output ports whose full resolution results the job reads.
+            start (callable): Reads the inputs and submits the job.
+        """
+        self.waiting_jobs.pop(index, None)
+        busy = [port for port in input_ports if self.full_res_pending.get(port)]
+        if not busy:
+            start()
+            return
+        self.waiting_jobs[index] = (tuple(input_ports), start)
+        self.full_res_pending[index] = True
+        self.statusBar().showMessage(
+            f"{action_type} waits for {', '.join(str(self.job_names.get(port)) for port in busy)}")
+
+
+    def start_waiting_jobs(self):
+        """
+        Start the waiting jobs whose input ports no longer have a full resolution job running.
+        """
+        for index, (input_ports, start) in list(self.waiting_jobs.items()):
+            if any(self.full_res_pending.get(port) for port in input_ports):
+                continue
+            del self.waiting_jobs[index]
+            self.full_res_pending[index] = False
+            start()
+
+
+    def forget_jobs(self, index: int):
+        """
+        Drop the queued, running and waiting jobs for an output port, e.g. when its image is reset.
+        """
+        if self.jobs is not None:
+            self.jobs.cancel((index, "preview"))
+            self.jobs.cancel((index, "full"))
+        self.waiting_jobs.pop(index, None)
+        self.full_res_pending[index] = False
+
+
+    def preview_proxy(self, index: int, image):
+        """
+        Downsample the image to the size of the output port, or None if that would not save much.
+        """
+        if image is None:
+            return None
+        output_port = self.out_ports[index]
+        proxy = scale_to_fit(image, (output_port.width(), output_port.height()))
+        if proxy.size * 2 > image.size:
+            return None
+        return proxy
+
+
+    def on_job_finished(self, key, processed_image, seconds: float):
+        """
+        Update the output port with the result of the latest job for it.
+
+        A preview result is only shown while the full resolution result is
+        still being computed.
+        """
+        index, tier = key
+        if tier == "preview":
+            if not self.full_res_pending.get(index) or processed_image is None:
+                return
+        else:
+            self.full_res_pending[index] = False
+            self.full_res_results[index] = processed_image
+        output_port = self.out_ports[index]
+        output_port.original_img = processed_image
+        output_port.update_display()
+        self.statusBar().showMessage(f"{self.job_names.get(index)} {tier} finished in {seconds * 1000:.0f} ms")
+        if tier == "full":
+            self.start_waiting_jobs()
+
+
+    def save_output(self, index=None):
+        """
+        Save the full resolution result shown in an output port without running the operator again.
+
+        Args:
+            index (int, optional): The output port to save. Default is the one on the current tab.
+        """
+        if index is None:
+            index = self.TAB_OUTPUT_PORTS.get(self.ui.tabWidget.currentIndex())
+        image = self.full_res_results.get(index)
+        if image is None:
+            self.statusBar().showMessage("Nothing to save on this tab")
+            return
+        if self.full_res_pending.get(index):
+            self.statusBar().showMessage("The full resolution result is still being computed")
+            return
+        image_path, _ = QFileDialog.getSaveFileName(self, 'Save Image File', './', filter="Images (*.png *.jpg *.bmp)")
+        if image_path:
+            self.export_output(index, image_path)
+
+
+    def export_output(self, index: int, image_path: str):
+        """
+        Write the kept full resolution result of an output port to image_path.
+        """
+        image = self.full_res_results[index]
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+        if cv2.imwrite(image_path, image):
+            self.statusBar().showMessage(f"Saved {image_path}")
         else:
-            action = class_name(img)
-        try:
-            filter_method = getattr(action, action_type)
-            filtered_image = filter_method()
-            output_port.original_img = filtered_image
-            output_port.update_display()
-        except Exception as e:
-            print(f"Error applying median filter: {e}")
+            self.statusBar().showMessage(f"Failed to save {image_path}")
+
+
+    def on_job_failed(self, key, error):
+        index, tier = key
+        if tier == "full":
+            self.full_res_pending[index] = False
+            # Jobs waiting for this result would only process a stale input
+            for waiting_index, (input_ports, _) in list(self.waiting_jobs.items()):
+                if index in input_ports:
+                    del self.waiting_jobs[waiting_index]
+                    self.full_res_pending[waiting_index] = False
+        print(f"Error applying filter: {error}")
+        self.statusBar().showMessage(f"{self.job_names.get(index)} failed: {error}")
+
+
+    def on_jobs_busy(self, busy: bool):
+        """
+        Show the busy indicator in the status bar while jobs are queued or running.
+        """
+        self.busy_indicator.setVisible(busy)
+
+
+    def closeEvent(self, event):
+        # Let running operators finish before the window's widgets are destroyed
+        self.jobs.wait()
+        image_store.shutdown()
+        super().closeEvent(event)
 
 
     def generate_hists_and_dists(self, index):
         """
         Generates histograms and distribution plots for the input image.
+
+        The histogram is only recomputed when the input image changed, and
+        existing plot items are updated in place instead of being recreated.
         """
-        # Copy the original image
-        
-        self.original_img = self.input_ports[index].original_img
-        
-        # Compute histograms and distributions
-        hists_and_dists = get_histograms(self.original_img)
+        image = self.input_ports[index].original_img
+        if image is None:
+            return
+        self.original_img = image
+
+        # Compute histograms and distributions, reusing them for an unchanged image
+        if self.histogram_image is not image:
+            with profiler.span("compute_histogram", "histogram"):
+                self.histogram = compute_histogram(image)
+            self.histogram_image = image
+        elif self.hist_plot_items:
+            return
+        with profiler.span("plot histograms", "plot"):
+            self.plot_histograms()
+
+
+    def plot_histograms(self):
+        """
+        Plot the histograms and CDFs of self.histogram, updating existing plot items in place.
+        """
+        hists_and_dists = get_histograms(self.histogram)
+        bins = np.arange(self.histogram.bins)
 
         # Define plot widgets and corresponding data
         self.df_widgets = {
-            'redDF_widget': (hists_and_dists['R'][0], hists_and_dists['R'][1], 'r'),
-            'greenDF_widget': (hists_and_dists['G'][0], hists_and_dists['G'][1], 'g'),
-            'blueDF_widget': (hists_and_dists['B'][0], hists_and_dists['B'][1], 'b'),
+            'redDF_widget': (hists_and_dists['R'][0], 'r'),
+            'greenDF_widget': (hists_and_dists['G'][0], 'g'),
+            'blueDF_widget': (hists_and_dists['B'][0], 'b'),
         }
 
         self.cdf_widgets = {
@@ -365,20 +644,27 @@ class MainWindow(QtWidgets.QMainWindow):
             'blueCDF_widget': (hists_and_dists['B'][1], (0, 0, 255, 100), 'b'),
         }
 
-        # Clear existing plot items
-        self.clear_histographs()
-
         # Plot each widget
-        for widget_name, (hist_data, bins_data, color) in self.df_widgets.items():
+        for widget_name, (hist_data, color) in self.df_widgets.items():
+            bar_plot = self.hist_plot_items.get(widget_name)
+            if bar_plot is not None:
+                bar_plot.setOpts(x=bins, height=hist_data)
+                continue
+
             # Set the background color to be transparent
             getattr(self.ui, widget_name).setBackground(None)
 
             # Plot histogram bars
-            bar_plot = pg.BarGraphItem(x=bins_data, height=hist_data, width=1, pen=color)
+            bar_plot = pg.BarGraphItem(x=bins, height=hist_data, width=1, pen=color)
             getattr(self.ui, widget_name).addItem(bar_plot)
-
+            self.hist_plot_items[widget_name] = bar_plot
 
         for widget_name, (data, brush_color, pen_color) in self.cdf_widgets.items():
+            plot_item = self.hist_plot_items.get(widget_name)
+            if plot_item is not None:
+                plot_item.setData(data)
+                continue
+
             # Set the background color to be transparent
             getattr(self.ui, widget_name).setBackground(None)
 
@@ -386,7 +672,7 @@ class MainWindow(QtWidgets.QMainWindow):
             plot_item = getattr(self.ui, widget_name).plot(data, pen=pen_color)
             plot_item.setFillLevel(0)
             plot_item.setBrush(pg.mkColor(brush_color))
-
+            self.hist_plot_items[widget_name] = plot_item
 
 
     def clear_histographs(self):
@@ -396,6 +682,8 @@ class MainWindow(QtWidgets.QMainWindow):
         for df_widget, cdf_widget in zip(self.df_widgets.keys(), self.cdf_widgets.keys()):
             getattr(self.ui, df_widget).clear()
             getattr(self.ui, cdf_widget).clear()
+        self.hist_plot_items = {}
+        self.histogram_image = None
 
 
     # Change between low pass and high pass filters in Hybrid
@@ -410,7 +698,15 @@ class MainWindow(QtWidgets.QMainWindow):
 
 def main():
     app = QtWidgets.QApplication([])
+    if "--double-precision" in sys.argv:
+        # Before the window creates its operators, which keep the policy they were built with
+        set_precision("double")
     main_window = MainWindow()
+    if "--profile" in sys.argv:
+        # Record from startup and show the profiling panel
+        profiler.enable()
+        main_window.profiler_panel.enabled_box.setChecked(True)
+        main_window.profiler_panel.show()
     main_window.show()
     sys.exit(app.exec())
 
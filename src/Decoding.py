@@ -1,33 +1,76 @@
 import numpy as np
-import cv2
+from src.PointOps import PointOpChain, to_uint8
+from src.Histogram import ImageHistogram
+from src.Stack import apply_tables, as_stack, stack_histograms
 
 class Decoding:
-    def __init__(self, original_image):
-        self.gray = cv2.convertScaleAbs(original_image)
+    def __init__(self, original_image, batch=False):
+        """
+        Args:
+            original_image (numpy.ndarray): The image, or a (N, H, W[, C]) stack of images when batch is True.
+            batch (bool): Process every image of a stack with its own statistics (min/max, histogram).
+        """
+        # uint8 input is used as it is, other dtypes are converted
+        self.gray = to_uint8(as_stack(original_image) if batch else original_image)
+        self.batch = batch
 
-    def equalize(self):
-        # Calculate the histogram of the original image
-        histogram, _ = np.histogram(self.gray.flatten(), bins=256, range=[0, 256])
+    def equalize(self, histogram=None):
+        """
+        Equalize the histogram of the image.
 
-        # Calculate the cumulative distribution function (CDF) of the histogram
-        cdf = histogram.cumsum()
+        Args:
+            histogram (ImageHistogram, optional): Already computed histogram of the image, reused instead of recounting.
+                In batch mode, an (N, 256) array with the histogram of every image.
+        """
+        # Map every pixel through the normalized CDF of the histogram in one lookup pass
+        return self._apply(PointOpChain().equalize(), histogram=_pooled_counts(histogram))
 
-        # Normalize the CDF to the range [0, 255]
-        cdf_normalized = (cdf - cdf.min()) * 255 / (cdf.max() - cdf.min())
+    def normalize(self):
+        # Stretch the [min, max] range of the image to [0, 255] in one lookup pass
+        return self._apply(PointOpChain().normalize())
 
-        # Interpolate the values of the CDF for each pixel in the image
-        equalized_image = np.interp(self.gray.flatten(), range(256), cdf_normalized).reshape(self.gray.shape).astype(np.uint8)
-        return equalized_image
+    def gamma_correction(self, gamma=1.0):
+        """
+        Apply gamma correction, out = 255 * (in / 255) ** gamma.
+        """
+        return self._apply(PointOpChain().gamma(gamma))
 
-    def normalize(self):
-        # Convert the image to floating-point format
-        image_float = self.gray.astype(np.float32)
+    def contrast_stretch(self, low_percentile=2, high_percentile=98, histogram=None):
+        """
+        Linearly stretch the intensities between two percentiles to [0, 255].
+        """
+        chain = PointOpChain().contrast_stretch(low_percentile, high_percentile)
+        return self._apply(chain, histogram=_pooled_counts(histogram))
+
+    def apply_point_ops(self, chain, in_place=False):
+        """
+        Apply a PointOpChain (e.g. equalize, then gamma, then threshold) as a single lookup table.
+
+        Args:
+            chain (PointOpChain): The operations to apply, in order.
+            in_place (bool): Overwrite self.gray with the result instead of allocating a new image.
+                For uint8 input, self.gray is the input image itself.
+
+        Returns:
+            numpy.ndarray: The processed image.
+        """
+        return self._apply(chain, out=self.gray if in_place else None)
 
-        # Determine the minimum and maximum pixel values
-        min_val = np.min(image_float)
-        max_val = np.max(image_float)
+    def _apply(self, chain, out=None, histogram=None):
+        """
+        Apply a chain to the image, or to every image of the stack with a table built from its own histogram.
+        """
+        if not self.batch or not chain.is_data_dependent():
+            return chain.apply(self.gray, out=out, histogram=histogram)
+        histograms = stack_histograms(self.gray) if histogram is None else histogram
+        tables = chain.compile_tables(histograms)
+        return apply_tables(tables, self.gray, out)
 
-        # Normalize the image to the range [0, 1]
-        normalized_image = 255 * (image_float - min_val) / (max_val - min_val)
 
-        return normalized_image.astype(np.uint8)
+def _pooled_counts(histogram):
+    """
+    Counts of all channels of an ImageHistogram added together, as one table applies to every channel.
+    """
+    if isinstance(histogram, ImageHistogram):
+        return histogram.counts.sum(axis=0)
+    return histogram
@@ -1,93 +1,285 @@
+import threading
 import cv2
 import numpy as np
+from src.PointOps import to_uint8
+from src.Precision import get_precision
+from src.Stack import apply_padded, as_mosaic, as_stack
+
+
+# Gradient kernels (x, y) of the kernel families, correlated with the image as by cv2.filter2D
+GRADIENT_KERNELS = {
+    "sobel": (np.array([[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]),
+              np.array([[-1, -2, -1], [0, 0, 0], [1, 2, 1]])),
+    "prewitt": (np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]]),
+                np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]])),
+    "roberts": (np.array([[1, 0], [0, -1]]),
+                np.array([[0, 1], [-1, 0]])),
+}
 
 
 class EdgeDetector:
-    def __init__(self, original_img):
-        self.gray = cv2.convertScaleAbs(original_img)
+    """
+    Edge detectors sharing one gradient computation per kernel family.
+
+    The x and y gradients of a family are computed once, as exact int16
+    images since the input is uint8, and the magnitude and direction are
+    derived from them in the precision's float type (float32 by default)
+    when first asked for. Everything is cached
+    on the instance and returned read-only, so running several detectors on
+    the same EdgeDetector reuses the gradients.
+
+    With batch=True the input is a (N, H, W) stack and every result is a
+    stack too, each image computed exactly as it would be on its own.
+    """
+
+    def __init__(self, original_img, batch=False, precision=None):
+        self.precision = get_precision(precision)
+        # uint8 input is used as it is, other dtypes are converted
+        self.gray = to_uint8(as_stack(original_img) if batch else original_img)
+        self.batch = batch
+        self._cache = {}
+        # Detectors may run on worker threads sharing this instance
+        self._lock = threading.RLock()
+
+    def gradients(self, family="sobel", blur_size=None):
+        """
+        Return the x and y gradients of the image for a kernel family.
+
+        Args:
+            family (str): "sobel", "prewitt" or "roberts".
+            blur_size (int, optional): Odd size of a Gaussian blur applied before differentiating.
+
+        Returns:
+            tuple: (gradient_x, gradient_y) read-only int16 arrays.
+        """
+        if family not in GRADIENT_KERNELS:
+            raise ValueError(f"Unknown gradient family: {family}")
+
+        def compute():
+            image = self.gray
+            if blur_size is not None:
+                image = self._neighbourhood(lambda tile: cv2.GaussianBlur(tile, (blur_size, blur_size), 0),
+                                            blur_size // 2)
+            # |gradient| <= 4 * 255 for these kernels, so int16 holds it exactly at a quarter of float64's size
+            kernel_x, kernel_y = GRADIENT_KERNELS[family]
+            return (_read_only(self._neighbourhood(lambda tile: cv2.filter2D(tile, cv2.CV_16S, kernel_x), 1, image)),
+                    _read_only(self._neighbourhood(lambda tile: cv2.filter2D(tile, cv2.CV_16S, kernel_y), 1, image)))
+
+        return self._cached(("gradients", family, blur_size), compute)
+
+    def magnitude(self, family="sobel", norm="l2", blur_size=None):
+        """
+        Return the gradient magnitude for a kernel family.
+
+        Args:
+            family (str): "sobel", "prewitt" or "roberts".
+            norm (str): "l2" for sqrt(gx ** 2 + gy ** 2) as a float, or "l1" for |gx| + |gy| as int16.
+            blur_size (int, optional): Odd size of a Gaussian blur applied before differentiating.
 
-    def sobel_detector(self):
-        # Define Sobel kernels
-        sobel_x = np.array([[-1, 0, 1],
-                            [-2, 0, 2],
-                            [-1, 0, 1]])
+        Returns:
+            numpy.ndarray: Read-only magnitude.
+        """
+        if norm not in ("l1", "l2"):
+            raise ValueError(f"Unknown magnitude norm: {norm}")
 
-        sobel_y = np.array([[-1, -2, -1],
-                            [0, 0, 0],
-                            [1, 2, 1]])
+        def compute():
+            gradient_x, gradient_y = self.gradients(family, blur_size)
+            if norm == "l1":
+                return _read_only(np.add(np.abs(gradient_x), np.abs(gradient_y)))
+            # hypot converts the int16 gradients in small buffered blocks, without full-size float copies
+            return _read_only(np.hypot(gradient_x, gradient_y, dtype=self.precision.float))
 
-        # Convolve the image with the kernels
-        gradient_x = cv2.filter2D(self.gray, cv2.CV_64F, sobel_x)
-        gradient_y = cv2.filter2D(self.gray, cv2.CV_64F, sobel_y)
+        return self._cached(("magnitude", family, norm, blur_size), compute)
 
-        # Compute gradient magnitude
-        gradient_magnitude = cv2.sqrt(cv2.pow(gradient_x, 2), cv2.pow(gradient_y, 2))
+    def direction(self, family="sobel", blur_size=None):
+        """
+        Return the gradient direction in degrees, in [-180, 180], as a read-only float array.
+        """
+        def compute():
+            gradient_x, gradient_y = self.gradients(family, blur_size)
+            direction = np.arctan2(gradient_y, gradient_x, dtype=self.precision.float)
+            direction *= self.precision.float.type(180 / np.pi)
+            return _read_only(direction)
 
-        gradient_magnitude *= 255.0 / gradient_magnitude.max()
+        return self._cached(("direction", family, blur_size), compute)
 
-        return gradient_magnitude.astype(np.uint8)
+    def clear(self):
+        """
+        Drop the cached gradients, magnitudes and directions.
+        """
+        with self._lock:
+            self._cache.clear()
 
-    def roberts_detector(self):
-        kernel_x = np.array([[1, 0], [0, -1]])
-        kernel_y = np.array([[0, 1], [-1, 0]])
+    def sobel_detector(self, norm="l2"):
+        gradient_magnitude = self.sobel_magnitude(norm)
+        # Every image of a stack is stretched by its own maximum
+        maximum = gradient_magnitude.max(axis=(1, 2), keepdims=True) if self.batch else gradient_magnitude.max()
+        return stretch_to_uint8(gradient_magnitude, maximum)
 
-        roberts_x = cv2.filter2D(self.gray, cv2.CV_64F, kernel_x)
-        roberts_y = cv2.filter2D(self.gray, cv2.CV_64F, kernel_y)
-        roberts = cv2.sqrt(cv2.pow(roberts_x, 2), cv2.pow(roberts_y, 2))
+    def sobel_magnitude(self, norm="l2"):
+        """
+        Return the unscaled float (int16 for L1) Sobel gradient magnitude that sobel_detector stretches to [0, 255].
+        """
+        return self.magnitude("sobel", norm)
 
-        return roberts.astype(np.uint8)
+    def roberts_detector(self, norm="l2"):
+        return wrap_to_uint8(self.magnitude("roberts", norm))
 
-    def canny_detector(self):
-        # Step 2: Apply Gaussian blur
-        blurred_image = cv2.GaussianBlur(self.gray, (5, 5), 0)
-        low_threshold = 5
-        high_threshold = 20
-        # Step 3: Compute gradient magnitude and direction
-        gradient_x = cv2.Sobel(blurred_image, cv2.CV_64F, 1, 0, ksize=3)
-        gradient_y = cv2.Sobel(blurred_image, cv2.CV_64F, 0, 1, ksize=3)
-        gradient_magnitude = np.sqrt(gradient_x ** 2 + gradient_y ** 2)
-        gradient_direction = np.arctan2(gradient_y, gradient_x) * (180 / np.pi)
+    def canny_detector(self, low_threshold=5, high_threshold=20, blur_size=5):
+        """
+        Detect edges with the Canny algorithm.
+
+        Args:
+            low_threshold (float): Gradient magnitude above which a pixel is a weak edge. Default is 5.
+            high_threshold (float): Gradient magnitude above which a pixel is a strong edge. Default is 20.
+            blur_size (int): Odd size of the Gaussian blur applied first. Default is 5.
+
+        Returns:
+            numpy.ndarray: Binary uint8 edge map with edges set to 255.
+        """
+        # Steps 2 and 3: Gaussian blur, then gradient magnitude and direction of the blurred image
+        gradient_magnitude = self.magnitude("sobel", "l2", blur_size)
+        gradient_direction = self.direction("sobel", blur_size)
+
+        if self.batch:
+            return _canny_stack(gradient_magnitude, gradient_direction, low_threshold, high_threshold)
 
         # Step 4: Non-maximum suppression
-        suppressed_image = np.zeros_like(gradient_magnitude)
-        for i in range(1, gradient_magnitude.shape[0] - 1):
-            for j in range(1, gradient_magnitude.shape[1] - 1):
-                angle = gradient_direction[i, j]
-                if (0 <= angle < 22.5) or (157.5 <= angle <= 180) or (-22.5 <= angle < 0) or (-180 <= angle < -157.5):
-                    if (gradient_magnitude[i, j] >= gradient_magnitude[i, j - 1]) and \
-                            (gradient_magnitude[i, j] >= gradient_magnitude[i, j + 1]):
-                        suppressed_image[i, j] = gradient_magnitude[i, j]
-                elif (22.5 <= angle < 67.5) or (-157.5 <= angle < -112.5):
-                    if (gradient_magnitude[i, j] >= gradient_magnitude[i - 1, j - 1]) and \
-                            (gradient_magnitude[i, j] >= gradient_magnitude[i + 1, j + 1]):
-                        suppressed_image[i, j] = gradient_magnitude[i, j]
-                elif (67.5 <= angle < 112.5) or (-112.5 <= angle < -67.5):
-                    if (gradient_magnitude[i, j] >= gradient_magnitude[i - 1, j]) and \
-                            (gradient_magnitude[i, j] >= gradient_magnitude[i + 1, j]):
-                        suppressed_image[i, j] = gradient_magnitude[i, j]
-                elif (112.5 <= angle < 157.5) or (-67.5 <= angle < -22.5):
-                    if (gradient_magnitude[i, j] >= gradient_magnitude[i - 1, j + 1]) and \
-                            (gradient_magnitude[i, j] >= gradient_magnitude[i + 1, j - 1]):
-                        suppressed_image[i, j] = gradient_magnitude[i, j]
+        suppressed_image = non_maximum_suppression(gradient_magnitude, gradient_direction)
 
         # Step 5: Hysteresis thresholding
-        edge_image = np.zeros_like(suppressed_image)
-        weak_edges = (suppressed_image > low_threshold) & (suppressed_image <= high_threshold)
-        strong_edges = suppressed_image > high_threshold
-        edge_image[strong_edges] = 255
-        for i in range(1, edge_image.shape[0] - 1):
-            for j in range(1, edge_image.shape[1] - 1):
-                if weak_edges[i, j]:
-                    if np.any(strong_edges[i - 1:i + 2, j - 1:j + 2]):
-                        edge_image[i, j] = 255
-
-        return edge_image.astype(np.uint8)
-
-    def prewitt_detector(self):
-        kernel_x = np.array([[-1, 0, 1], [-1, 0, 1], [-1, 0, 1]])
-        kernel_y = np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]])
-        prewitt_x = cv2.filter2D(self.gray, cv2.CV_64F, kernel_x)
-        prewitt_y = cv2.filter2D(self.gray, cv2.CV_64F, kernel_y)
-        prewitt = cv2.sqrt(cv2.pow(prewitt_x, 2), cv2.pow(prewitt_y, 2))
-
-        return prewitt.astype(np.uint8)
+        edge_image = hysteresis_threshold(suppressed_image, low_threshold, high_threshold)
+
+        return edge_image
+
+    def prewitt_detector(self, norm="l2"):
+        return wrap_to_uint8(self.magnitude("prewitt", norm))
+
+    def _neighbourhood(self, function, radius, image=None):
+        """
+        Apply a filter reading radius pixels around each pixel, to every image of the stack in batch mode.
+        """
+        image = self.gray if image is None else image
+        if self.batch:
+            return apply_padded(image, function, radius)
+        return function(image)
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = compute()
+            return self._cache[key]
+
+
+def stretch_to_uint8(gradient_magnitude, maximum):
+    """
+    Scale a magnitude so maximum maps to 255, truncating to uint8.
+
+    maximum may be an array broadcasting against the magnitude, e.g. one
+    maximum per image of a stack. Where it is 0 the result is 0. The
+    scaling is done in the magnitude's float type, float32 for integers.
+    """
+    maximum = np.asarray(maximum, dtype=np.float64)
+    scale_dtype = gradient_magnitude.dtype if gradient_magnitude.dtype.kind == "f" else np.float32
+    scale = np.divide(255.0, maximum, out=np.zeros_like(maximum), where=maximum != 0).astype(scale_dtype)
+    return (gradient_magnitude * scale).astype(np.uint8)
+
+
+def wrap_to_uint8(gradient_magnitude):
+    """
+    Truncate a magnitude to uint8 the way the detectors always have, values above 255 wrapping around.
+
+    Casting floats above 255 straight to uint8 is undefined, so the
+    magnitude goes through int32 first, which truncates, and the
+    int32 to uint8 cast then keeps the low 8 bits.
+    """
+    return gradient_magnitude.astype(np.int32).astype(np.uint8)
+
+
+def _canny_stack(gradient_magnitude, gradient_direction, low_threshold, high_threshold):
+    """
+    Non-maximum suppression and hysteresis of a (N, H, W) stack, run on its mosaic.
+    """
+    count, rows, cols = gradient_magnitude.shape
+    suppressed = non_maximum_suppression(as_mosaic(gradient_magnitude), as_mosaic(gradient_direction))
+    suppressed = suppressed.reshape(count, rows, cols)
+    # Rows next to another image were compared across the seam, and are border pixels suppressed on their own
+    suppressed[:, 0] = 0
+    suppressed[:, -1] = 0
+    if low_threshold < 0:
+        # Zero pixels would be weak edges joining the images through their borders
+        return np.stack([hysteresis_threshold(image, low_threshold, high_threshold) for image in suppressed])
+    # The zero rows keep the components of different images apart
+    edges = hysteresis_threshold(as_mosaic(suppressed), low_threshold, high_threshold)
+    return edges.reshape(count, rows, cols)
+
+
+def _read_only(array):
+    array.setflags(write=False)
+    return array
+
+
+# Neighbour offsets (row, column) compared against along each quantized gradient direction
+_NMS_OFFSETS = ((0, 1), (1, 1), (1, 0), (1, -1))
+
+
+def non_maximum_suppression(gradient_magnitude, gradient_direction):
+    """
+    Thin edges by keeping only pixels that are local maxima along their gradient direction.
+
+    The direction (in degrees) is quantized into the 0, 45, 90 and 135 degree
+    bins, and each pixel is compared with its two neighbours along that bin
+    using shifted views of the whole magnitude array. Border pixels are
+    suppressed.
+
+    Args:
+        gradient_magnitude (numpy.ndarray): 2D gradient magnitude.
+        gradient_direction (numpy.ndarray): 2D gradient direction in degrees, in [-180, 180].
+
+    Returns:
+        numpy.ndarray: The magnitude with non-maximum pixels set to zero.
+    """
+    rows, cols = gradient_magnitude.shape
+    suppressed_image = np.zeros_like(gradient_magnitude)
+    if rows < 3 or cols < 3:
+        return suppressed_image
+
+    # Opposite directions share a bin, so fold the angle into [0, 180) before quantizing
+    direction_bin = (np.floor((np.mod(gradient_direction[1:-1, 1:-1], 180) + 22.5) / 45) % 4).astype(np.uint8)
+
+    center = gradient_magnitude[1:-1, 1:-1]
+    keep = np.zeros(center.shape, dtype=bool)
+    for bin_index, (dr, dc) in enumerate(_NMS_OFFSETS):
+        forward = gradient_magnitude[1 + dr:rows - 1 + dr, 1 + dc:cols - 1 + dc]
+        backward = gradient_magnitude[1 - dr:rows - 1 - dr, 1 - dc:cols - 1 - dc]
+        keep |= (direction_bin == bin_index) & (center >= forward) & (center >= backward)
+
+    suppressed_image[1:-1, 1:-1] = np.where(keep, center, 0)
+    return suppressed_image
+
+
+def hysteresis_threshold(suppressed_image, low_threshold, high_threshold):
+    """
+    Keep strong edges and every weak edge connected to one through a chain of weak edges.
+
+    Pixels above low_threshold are grouped into 8-connected components, and a
+    component survives if any of its pixels is above high_threshold.
+
+    Args:
+        suppressed_image (numpy.ndarray): 2D non-maximum suppressed gradient magnitude.
+        low_threshold (float): Weak edge threshold.
+        high_threshold (float): Strong edge threshold.
+
+    Returns:
+        numpy.ndarray: Binary uint8 edge map with edges set to 255.
+    """
+    candidates = (suppressed_image > low_threshold).astype(np.uint8)
+    strong_edges = suppressed_image > high_threshold
+    num_labels, labels = cv2.connectedComponents(candidates, connectivity=8)
+
+    # Mark every component that contains a strong pixel, then look each pixel's component up
+    strong_labels = np.zeros(num_labels, dtype=bool)
+    strong_labels[labels[strong_edges]] = True
+    strong_labels[0] = False
+
+    return np.where(strong_labels[labels], 255, 0).astype(np.uint8)
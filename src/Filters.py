@@ -1,58 +1,81 @@
 import numpy as np
 import cv2
+from numpy.lib.stride_tricks import sliding_window_view
+from src.Kernels import box_filter, filter_image, gaussian_kernel_1d, kernel_size_for_sigma
+from src.Stack import apply_padded, as_stack, map_images
+
+# Border modes accepted by the filters, mapped to the matching OpenCV flag
+BORDER_MODES = {
+    "constant": cv2.BORDER_CONSTANT,
+    "replicate": cv2.BORDER_REPLICATE,
+    "reflect": cv2.BORDER_REFLECT,
+    "reflect101": cv2.BORDER_REFLECT_101,
+    "wrap": cv2.BORDER_WRAP,
+}
+
+# Upper bound on the number of window elements gathered at once by the generic median path
+_MEDIAN_CHUNK_ELEMENTS = 1 << 24
+
 
 class Filter:
-    def __init__(self, original_img, kernel_size):
-        self.original_img = original_img
+    def __init__(self, original_img, kernel_size, batch=False):
+        """
+        Args:
+            original_img (numpy.ndarray): The image, or a (N, H, W[, C]) stack of images when batch is True.
+            kernel_size (int): Odd kernel size.
+            batch (bool): Filter every image of a stack separately, in a few calls over the whole stack.
+        """
+        self.original_img = as_stack(original_img) if batch else original_img
         self.kernel_size = kernel_size
+        self.batch = batch
         self.filtered_img = None
 
-    def median_filter(self):
-        # Ensure original_img is a numpy array
-        data = np.array(self.original_img)
-        # Calculate the index for the middle element of the filter
-        indexer = self.kernel_size // 2
-        # Create an empty numpy array to store the filtered data
-        data_final = np.zeros_like(data)
-        
-        # Loop through the rows of the data
-        for i in range(len(data)):
-            # Loop through the columns of the data
-            for j in range(len(data[0])):
-                # Create an empty list to store the values within the kernel
-                values = []
-                # Loop through the kernel size
-                for m in range(-indexer, indexer + 1):
-                    for n in range(-indexer, indexer + 1):
-                        # Calculate the row and column indices for the current position
-                        row_index = i + m
-                        col_index = j + n
-                        # Check if the indices are within the bounds of the image
-                        if 0 <= row_index < len(data) and 0 <= col_index < len(data[0]):
-                            # Append the value from the data to the values list
-                            values.append(data[row_index][col_index])
-                        else:
-                            # Append 0 for out-of-bounds positions
-                            values.append(0)
-                
-                # Sort the values list
-                values.sort()
-                # Assign the median value from the values list to the corresponding position in the final data
-                data_final[i][j] = values[len(values) // 2]
-        
-        # Update the filtered_img attribute with the filtered data
-        self.filtered_img = data_final
+    def median_filter(self, border_mode="constant"):
+        """
+        Apply median filter to the original image.
+
+        Args:
+            border_mode (str): How pixels outside the image are filled, one of
+                the keys of BORDER_MODES. Default is "constant" (zero padding).
+
+        Returns:
+            numpy.ndarray: The filtered image, same shape and dtype as the input.
+        """
+        def median(image):
+            return median_blur(image, self.kernel_size, border_mode)
+
+        if not self.batch:
+            self.filtered_img = median(np.asarray(self.original_img))
+            return self.filtered_img
+
+        _check_median_args(self.kernel_size, border_mode)
+        stack = self.original_img
+        if self.kernel_size > 1 and _opencv_median_supports(stack.dtype, stack.shape[3:], self.kernel_size):
+            # One cv2.medianBlur over the padded mosaic, the mosaic padding replaces median_blur's own
+            self.filtered_img = apply_padded(stack, lambda mosaic: cv2.medianBlur(mosaic, self.kernel_size),
+                                             self.kernel_size // 2, border_mode)
+        else:
+            self.filtered_img = map_images(median, stack)
         return self.filtered_img
 
-    def gaussian_filter(self, frequency_response = 255):
+    def gaussian_filter(self, frequency_response = 255, sigma=1):
         """
         Apply Gaussian filter to the original image.
+
+        The Gaussian is separable, so it runs as a row pass and a column pass
+        with cached 1D kernels, or through the FFT for very large kernels.
+
+        Args:
+            frequency_response (int): Gain of the filter, 255 keeps the brightness. Default is 255.
+            sigma (float): Standard deviation of the Gaussian. Default is 1.
+                When kernel_size is None it is derived from sigma.
         """
-        sigma = 1
-        kernel = self._gaussian_kernel(self.kernel_size, sigma)
-        kernel *= frequency_response / 255
+        kernel_size = self.kernel_size or kernel_size_for_sigma(sigma)
+        kernel_1d = gaussian_kernel_1d(kernel_size, sigma)
 
-        self.filtered_img = cv2.filter2D(self.original_img, -1, kernel)
+        self.filtered_img = self._apply(
+            lambda image: filter_image(image, separable=(kernel_1d, kernel_1d * (frequency_response / 255))),
+            kernel_size // 2)
 
         return self.filtered_img
 
@@ -60,18 +83,86 @@ class Filter:
         """
         Apply average filter to the original image.
         """
-        kernel = np.ones((self.kernel_size, self.kernel_size)) / (self.kernel_size ** 2)
-
-        # Apply average filter using cv2.filter2D()
-        self.filtered_img = cv2.filter2D(self.original_img, -1, kernel)
+        # Box filter with running sums, constant cost per pixel for any kernel size
+        self.filtered_img = self._apply(lambda image: box_filter(image, self.kernel_size), self.kernel_size // 2)
 
         return self.filtered_img
 
-    def _gaussian_kernel(self, size, sigma):
+    def _apply(self, function, radius):
         """
-        Generate a Gaussian kernel.
+        Run function on the image, or on every image of the stack through one padded mosaic.
         """
-        kernel = np.fromfunction(lambda x, y: (1 / (2 * np.pi * sigma ** 2)) * np.exp(
-            -(x - size // 2) ** 2 / (2 * sigma ** 2) - (y - size // 2) ** 2 / (2 * sigma ** 2)), (size, size))
-        kernel /= np.sum(kernel)
-        return kernel
+        if self.batch:
+            return apply_padded(self.original_img, function, radius)
+        return function(np.asarray(self.original_img))
+
+
+def median_blur(image, kernel_size, border_mode="constant"):
+    """
+    Median filter an image with a square window of any odd size.
+
+    The image is padded with the requested border mode and handed to
+    cv2.medianBlur, which uses a histogram based sliding window for uint8
+    data, so the cost per pixel does not grow with the kernel size. The
+    padding is cropped afterwards, so OpenCV's own border handling never
+    reaches the result. Dtypes and kernel sizes cv2.medianBlur does not
+    support, including channel counts other than 1, 3 and 4 with windows
+    larger than 5x5, fall back to a chunked selection over sliding windows.
+
+    Args:
+        image (numpy.ndarray): 2D grayscale or 3D multi-channel image, uint8 or float.
+        kernel_size (int): Odd window size.
+        border_mode (str): One of the keys of BORDER_MODES.
+
+    Returns:
+        numpy.ndarray: The filtered image, same shape and dtype as the input.
+    """
+    _check_median_args(kernel_size, border_mode)
+    if kernel_size == 1:
+        return image.copy()
+
+    radius = kernel_size // 2
+    padded = cv2.copyMakeBorder(image, radius, radius, radius, radius, BORDER_MODES[border_mode], value=0)
+
+    if _opencv_median_supports(image.dtype, image.shape[2:], kernel_size):
+        return cv2.medianBlur(padded, kernel_size)[radius:-radius, radius:-radius]
+
+    return _median_blur_generic(padded, image.shape, kernel_size)
+
+
+def _check_median_args(kernel_size, border_mode):
+    """
+    Raise ValueError for a kernel size or border mode median_blur does not accept.
+    """
+    if kernel_size < 1 or kernel_size % 2 == 0:
+        raise ValueError(f"Kernel size must be a positive odd number, got {kernel_size}")
+    if border_mode not in BORDER_MODES:
+        raise ValueError(f"Unknown border mode: {border_mode}")
+
+
+def _opencv_median_supports(dtype, channel_shape, kernel_size):
+    """
+    Whether cv2.medianBlur filters images of this dtype and channel shape with this kernel size.
+    """
+    # cv2.medianBlur handles uint8 at any size and 16-bit/float32 only for 3x3 and 5x5,
+    # and windows larger than 5x5 only for 1, 3 or 4 channels
+    channels = channel_shape[0] if channel_shape else 1
+    if kernel_size <= 5:
+        return dtype in (np.uint8, np.uint16, np.int16, np.float32)
+    return dtype == np.uint8 and channels in (1, 3, 4)
+
+
+def _median_blur_generic(padded, shape, kernel_size):
+    """
+    Median filter an already padded image by partial selection over its sliding windows.
+    """
+    window_area = kernel_size * kernel_size
+    windows = sliding_window_view(padded, (kernel_size, kernel_size), axis=(0, 1))
+    filtered = np.empty(shape, dtype=padded.dtype)
+    # Gather the windows a band of rows at a time to bound the temporary memory
+    rows_per_chunk = max(1, _MEDIAN_CHUNK_ELEMENTS // (window_area * int(np.prod(shape[1:]))))
+    for top in range(0, shape[0], rows_per_chunk):
+        band = windows[top:top + rows_per_chunk]
+        band = band.reshape(band.shape[:-2] + (window_area,))
+        filtered[top:top + rows_per_chunk] = np.partition(band, window_area // 2, axis=-1)[..., window_area // 2]
+    return filtered
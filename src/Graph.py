@@ -0,0 +1,293 @@
+"""
+Lazy operator graph for chained processing.
+
+Operators from the Operators registry are recorded as nodes and only run
+when a result is asked for. Every node keeps its last result, so changing
+one node's parameters recomputes that node and the nodes downstream of
+it, while everything upstream is reused. Runs of point operations
+(equalize, normalize, gamma, contrast stretch, global threshold) feeding
+only each other are fused into one lookup-table pass, and their output
+buffers are recycled from a pool when they are recomputed.
+
+Example:
+    >>> graph = Graph(image)
+    >>> noisy = graph.add("gaussian_noise", 20)
+    >>> smooth = graph.add("median", 5)
+    >>> edges = graph.add("canny")
+    >>> result = graph.compute(edges)
+    >>> graph.set_params(smooth, 7)  # only median and canny run again
+    >>> result = graph.compute(edges)
+"""
+import time
+from collections import OrderedDict
+import numpy as np
+from src.Operators import OPERATORS, OperatorChain
+from src.PointOps import PointOpChain, to_uint8
+
+# Point operators and how they extend a PointOpChain, with the same defaults as in Operators
+POINT_OPS = {
+    "equalize": lambda chain: chain.equalize(),
+    "normalize": lambda chain: chain.normalize(),
+    "gamma": lambda chain, gamma=1.0: chain.gamma(gamma),
+    "contrast_stretch": lambda chain, low_percentile=2, high_percentile=98:
+        chain.contrast_stretch(low_percentile, high_percentile),
+    "global_threshold": lambda chain, threshold=120: chain.threshold(threshold),
+}
+
+
+class Node:
+    """
+    One operator application in a Graph.
+
+    Attributes:
+        name (str): Operator name in the Operators registry.
+        args (tuple): Positional operator parameters.
+        input (Node): The node whose result this node processes, None for the graph's source.
+        children (list): Nodes processing this node's result.
+    """
+
+    def __init__(self, name, args, input=None):
+        self.name = name
+        self.args = tuple(args)
+        self.input = input
+        self.children = []
+        self.result = None
+        # Whether result came from the graph's buffer pool and may be reused for a later result
+        self.pooled = False
+
+    @property
+    def is_point_op(self):
+        return self.name in POINT_OPS
+
+    @property
+    def label(self):
+        return ":".join([self.name, *map(str, self.args)])
+
+    def __repr__(self):
+        return f"Node({self.label})"
+
+
+class BufferPool:
+    """
+    Free arrays kept by shape and dtype, so recomputed results can reuse released buffers.
+
+    Free arrays of the least recently released shapes are dropped once
+    they hold more than max_bytes.
+
+    Args:
+        max_bytes (int): Memory kept in free arrays. Default is 256 MiB.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.free_bytes = 0
+        self.reused = 0
+        self.allocated = 0
+        # Free arrays by (shape, dtype), least recently released shapes first
+        self._free = OrderedDict()
+
+    def take(self, shape, dtype):
+        """
+        Return an uninitialized array, reusing a released one when possible.
+        """
+        key = (tuple(shape), np.dtype(dtype))
+        free = self._free.get(key)
+        if free:
+            self.reused += 1
+            array = free.pop()
+            if not free:
+                del self._free[key]
+            self.free_bytes -= array.nbytes
+            return array
+        self.allocated += 1
+        return np.empty(shape, dtype)
+
+    def release(self, array):
+        key = (array.shape, array.dtype)
+        self._free.setdefault(key, []).append(array)
+        self._free.move_to_end(key)
+        self.free_bytes += array.nbytes
+        while self.free_bytes > self.max_bytes and self._free:
+            _, evicted = self._free.popitem(last=False)
+            self.free_bytes -= sum(array.nbytes for array in evicted)
+
+    def clear(self):
+        self._free.clear()
+        self.free_bytes = 0
+
+    def stats(self):
+        """
+        Return the allocation/reuse counters and the memory held in free arrays.
+        """
+        return {"allocated": self.allocated, "reused": self.reused, "shapes": len(self._free),
+                "free_bytes": self.free_bytes, "max_bytes": self.max_bytes}
+
+
+class Graph:
+    """
+    Operators recorded as nodes and evaluated on demand, recomputing only what changed.
+
+    Results returned by compute belong to the graph: a result from the
+    buffer pool is overwritten when its node is recomputed, so copy it to
+    keep it across parameter changes.
+    """
+
+    def __init__(self, source=None):
+        self.source = source
+        self.nodes = []
+        self.pool = BufferPool()
+        # Nodes run and fused during the last compute, for inspection
+        self.last_run = []
+
+    @classmethod
+    def from_chain(cls, chain, source=None):
+        """
+        Build a linear graph from an OperatorChain or its text form, e.g. "median:5 | canny".
+        """
+        if isinstance(chain, str):
+            chain = OperatorChain.parse(chain)
+        graph = cls(source)
+        for name, args in chain.stages:
+            graph.add(name, *args)
+        return graph
+
+    def add(self, name, *args, input=None):
+        """
+        Record an operator without running it.
+
+        Args:
+            name (str): Operator name in the Operators registry.
+            *args: Operator parameters.
+            input (Node, optional): Node to process. Default is the last added node, or the source for the first one.
+
+        Returns:
+            Node: The new node.
+        """
+        if name not in OPERATORS:
+            raise ValueError(f"Unknown operator '{name}', expected one of: {', '.join(OPERATORS)}")
+        if input is None and self.nodes:
+            input = self.nodes[-1]
+        node = Node(name, args, input)
+        if input is not None:
+            input.children.append(node)
+        self.nodes.append(node)
+        return node
+
+    def set_source(self, image):
+        """
+        Replace the input image, invalidating every node.
+
+        Pooled buffers only fit images of the source's shape and dtype, so
+        they are dropped when the new image differs, e.g. in a batch of
+        images of mixed sizes.
+        """
+        previous = self.source
+        self.source = image
+        for node in self.nodes:
+            if node.input is None:
+                self._invalidate(node)
+        if previous is None or np.shape(previous) != np.shape(image) or \
+                np.asarray(previous).dtype != np.asarray(image).dtype:
+            self.pool.clear()
+
+    def set_params(self, node, *args):
+        """
+        Change a node's parameters, invalidating it and the nodes downstream of it.
+        """
+        if tuple(args) != node.args:
+            node.args = tuple(args)
+            self._invalidate(node)
+
+    def compute(self, node=None, timings=None):
+        """
+        Return a node's result, running only the nodes that are out of date.
+
+        Args:
+            node (Node, optional): The node to evaluate. Default is the last added node.
+            timings (list, optional): If given, (label, seconds) pairs are appended for every node run.
+
+        Returns:
+            numpy.ndarray: The node's result.
+        """
+        if self.source is None:
+            raise ValueError("The graph has no source image")
+        node = node or self.nodes[-1]
+        self.last_run = []
+
+        # Walk up to the nearest node with a result, then run downstream from there
+        path = []
+        while node is not None and node.result is None:
+            path.append(node)
+            node = node.input
+        path.reverse()
+
+        index = 0
+        while index < len(path):
+            group = self._fusable_run(path, index)
+            start = time.perf_counter()
+            if len(group) > 1:
+                self._run_fused(group)
+            else:
+                self._run(group[0])
+            label = " + ".join(member.label for member in group)
+            self.last_run.append(label)
+            if timings is not None:
+                timings.append((label, time.perf_counter() - start))
+            index += len(group)
+        return path[-1].result if path else node.result
+
+    def release(self):
+        """
+        Drop every cached result and pooled buffer.
+        """
+        for node in self.nodes:
+            node.result = None
+            node.pooled = False
+        self.pool.clear()
+
+    def _input_of(self, node):
+        return self.source if node.input is None else node.input.result
+
+    def _fusable_run(self, path, start):
+        """
+        The longest run of point operations from path[start] whose intermediate results nobody else needs.
+        """
+        end = start + 1
+        if path[start].is_point_op:
+            while (end < len(path) and path[end].is_point_op
+                   and len(path[end - 1].children) == 1):
+                end += 1
+        return path[start:end]
+
+    def _run(self, node):
+        if node.is_point_op:
+            self._run_fused([node])
+            return
+        node.result = OPERATORS[node.name](self._input_of(node), *node.args)
+        node.pooled = False
+
+    def _run_fused(self, group):
+        """
+        Apply a run of point operations as a single lookup table, storing the result on its last node.
+        """
+        chain = PointOpChain()
+        for member in group:
+            POINT_OPS[member.name](chain, *member.args)
+        image = to_uint8(np.asarray(self._input_of(group[0])))
+        last = group[-1]
+        out = self.pool.take(image.shape, np.uint8)
+        last.result = chain.apply(image, out=out)
+        last.pooled = True
+
+    def _invalidate(self, node):
+        """
+        Forget the results of node and every node downstream of it, recycling their pooled buffers.
+        """
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.result is not None and current.pooled:
+                self.pool.release(current.result)
+            current.result = None
+            current.pooled = False
+            stack.extend(current.children)
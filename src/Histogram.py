@@ -1,21 +1,179 @@
 import numpy as np
 import cv2
 
+# Pixels counted per bincount call, bounding the temporary index buffer
+_BAND_PIXELS = 1 << 20
+
+_CHANNEL_NAMES = {1: ("Gray",), 3: ("R", "G", "B"), 4: ("R", "G", "B", "A")}
+
+
+class ImageHistogram:
+    """
+    Per-channel histograms of an image with lazily computed, cached statistics.
+
+    counts has shape (channels, bins). The CDF, mean, standard deviation
+    and percentiles are derived from the counts the first time they are
+    asked for and kept until the counts change through add, remove or
+    update.
+    """
+
+    def __init__(self, counts, channel_names=None):
+        self.counts = np.asarray(counts, dtype=np.int64)
+        if self.counts.ndim == 1:
+            self.counts = self.counts[np.newaxis, :]
+        self.channel_names = tuple(channel_names or _default_channel_names(self.counts.shape[0]))
+        self._cache = {}
+
+    @property
+    def bins(self):
+        return self.counts.shape[1]
+
+    @property
+    def total(self):
+        """
+        Number of pixels counted per channel.
+        """
+        return int(self.counts[0].sum())
+
+    def channel_index(self, channel):
+        if isinstance(channel, str):
+            return self.channel_names.index(channel)
+        return channel
+
+    def histogram(self, channel=0):
+        return self.counts[self.channel_index(channel)]
+
+    def cdf(self, channel=0):
+        """
+        Cumulative counts of one channel.
+        """
+        return self._cached(("cdf", self.channel_index(channel)),
+                            lambda: self.histogram(channel).cumsum())
+
+    def mean(self, channel=0):
+        return self._cached(("mean", self.channel_index(channel)), lambda: self._moments(channel)[0])
+
+    def std(self, channel=0):
+        return self._cached(("std", self.channel_index(channel)), lambda: self._moments(channel)[1])
+
+    def percentile(self, percent, channel=0):
+        """
+        Smallest intensity whose cumulative count reaches percent of the pixels.
+        """
+        cdf = self.cdf(channel)
+        return int(np.searchsorted(cdf, cdf[-1] * percent / 100))
+
+    def add(self, region):
+        """
+        Count the pixels of a region that was added to the image.
+        """
+        self.counts += _count(region, self.bins, self.counts.shape[0])
+        self._cache.clear()
+        return self
+
+    def remove(self, region):
+        """
+        Stop counting the pixels of a region that was removed from the image.
+        """
+        self.counts -= _count(region, self.bins, self.counts.shape[0])
+        self._cache.clear()
+        return self
+
+    def update(self, old_region, new_region):
+        """
+        Account for a region (e.g. a tile) of the image being replaced, without recounting the rest.
+
+        Args:
+            old_region (numpy.ndarray): The region's pixels before the change.
+            new_region (numpy.ndarray): The region's pixels after the change.
+        """
+        self.counts += (_count(new_region, self.bins, self.counts.shape[0])
+                        - _count(old_region, self.bins, self.counts.shape[0]))
+        self._cache.clear()
+        return self
+
+    def _moments(self, channel):
+        histogram = self.histogram(channel)
+        total = histogram.sum()
+        if total == 0:
+            return 0.0, 0.0
+        values = np.arange(self.bins, dtype=np.float64)
+        mean = float(histogram @ values / total)
+        variance = float(histogram @ (values - mean) ** 2 / total)
+        return mean, variance ** 0.5
+
+    def _cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+
+def compute_histogram(image):
+    """
+    Count every channel of an image, 8- and 16-bit images in a single bincount pass.
+
+    Channel values are offset into disjoint bin ranges so one bincount
+    counts all channels at once. The image is visited in bands through
+    reshaped views, so no flattened copy of the image is made. Other
+    dtypes, e.g. float images, are counted per channel with np.histogram
+    into 256 unit-wide bins over [0, 256], values outside it are not counted.
+
+    Args:
+        image (numpy.ndarray): 2D grayscale or 3D (rows, cols, channels) image.
+
+    Returns:
+        ImageHistogram: 256 bins per channel, 65536 for uint16 input.
+    """
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    return ImageHistogram(_count(image, _bins_for(image.dtype), channels), _default_channel_names(channels))
+
 
 def get_histograms(image):
-    # Separate the R, G, and B channels
-    R = image[..., 0]
-    G = image[..., 1]
-    B = image[..., 2]
-
-    # Calculate the histograms for R, G, and B channels
-    hist_R, bins_R = np.histogram(R.flatten(), bins=256, range=(0, 256))
-    hist_G, bins_G = np.histogram(G.flatten(), bins=256, range=(0, 256))
-    hist_B, bins_B = np.histogram(B.flatten(), bins=256, range=(0, 256))
-
-    # Calculate the cumulative distribution functions (CDFs) for R, G, and B channels
-    cdf_R = hist_R.cumsum()
-    cdf_G = hist_G.cumsum()
-    cdf_B = hist_B.cumsum()
-
-    return {"R": [hist_R, cdf_R], "G": [hist_G, cdf_G], "B": [hist_B, cdf_B]}
+    """
+    Histograms and CDFs of the R, G and B channels, as plotted by the main window.
+
+    Grayscale images report their single channel under all three keys.
+    """
+    histogram = image if isinstance(image, ImageHistogram) else compute_histogram(image)
+    if len(histogram.channel_names) == 1:
+        return {name: [histogram.histogram(0), histogram.cdf(0)] for name in ("R", "G", "B")}
+    return {name: [histogram.histogram(name), histogram.cdf(name)] for name in ("R", "G", "B")}
+
+
+def _bins_for(dtype):
+    if dtype == np.uint8:
+        return 256
+    if dtype == np.uint16:
+        return 65536
+    return 256
+
+
+def _default_channel_names(channels):
+    return _CHANNEL_NAMES.get(channels, tuple(str(i) for i in range(channels)))
+
+
+def _count(image, bins, channels):
+    """
+    (channels, bins) counts of an image, or of a region of one.
+    """
+    image = np.asarray(image)
+    if image.ndim == 2:
+        image = image[:, :, np.newaxis]
+    if image.shape[2] != channels:
+        raise ValueError(f"Expected {channels} channels, got {image.shape[2]}")
+    if image.dtype != np.uint8 and image.dtype != np.uint16:
+        return np.stack([np.histogram(image[:, :, channel], bins, range=(0, bins))[0]
+                         for channel in range(channels)]).astype(np.int64)
+
+    counts = np.zeros(channels * bins, dtype=np.int64)
+    if image.size == 0:
+        return counts.reshape(channels, bins)
+    offsets = np.arange(channels, dtype=np.intp) * bins
+    rows_per_band = max(1, _BAND_PIXELS // max(1, image.shape[1]))
+    index = np.empty((rows_per_band * image.shape[1], channels), dtype=np.intp)
+    for top in range(0, image.shape[0], rows_per_band):
+        band = image[top:top + rows_per_band]
+        band_index = index[:band.shape[0] * band.shape[1]]
+        np.add(band.reshape(-1, channels), offsets, out=band_index)
+        counts += np.bincount(band_index.ravel(), minlength=channels * bins)
+    return counts.reshape(channels, bins)
@@ -1,54 +1,231 @@
+import threading
 import numpy as np
+from collections import OrderedDict
 from src.Filters import Filter
+from src.Precision import get_precision
+from src.ResultCache import image_fingerprint
 import cv2
-from numpy.fft import fft2, ifft2, fftshift, ifftshift
+
+
+class FrequencyMaskCache:
+    """
+    LRU cache of the Gaussian-shaped frequency masks used by Hybrid.
+
+    A mask depends only on the image shape, the cutoff frequency, the
+    degree and whether it is a low or high pass mask, so it is built once
+    by broadcasting over a radial distance grid and reused while the
+    sliders move. Least recently used masks are evicted once the cached
+    masks exceed max_bytes.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._masks = OrderedDict()
+        self._distance_grids = OrderedDict()
+        # Hybrid filters run on worker threads and share this cache
+        self._lock = threading.RLock()
+
+    def get_ccs(self, shape, cutoff_frequency, degree, high_pass=False, dtype=np.float32):
+        """
+        Return the mask laid out like the packed (CCS) output of cv2.dft on a real image.
+
+        The mask is unshifted, so it applies to the spectrum as cv2.dft
+        returns it. Multiplying a packed spectrum by this mask applies the
+        filter, as both the real and the imaginary part of every frequency
+        are scaled by that frequency's mask value.
+
+        Args:
+            shape (tuple): (rows, cols) of the image.
+            cutoff_frequency (float): Distance from zero frequency where the mask falls to exp(-0.5).
+            degree (float): Exponent controlling how sharp the transition is.
+            high_pass (bool): Return 1 - low pass mask when True.
+            dtype: Float type of the mask, matching the spectrum's. Default is float32.
+
+        Returns:
+            numpy.ndarray: Mask of the given shape.
+        """
+        dtype = np.dtype(dtype)
+        key = ("ccs", tuple(shape), cutoff_frequency, degree, high_pass, dtype.str)
+        return self._lookup(key, lambda: self._half_distance_grid(shape), cutoff_frequency, degree, high_pass,
+                            dtype, lambda mask: ccs_layout(mask, shape[1]))
+
+    def _lookup(self, key, distance_grid, cutoff_frequency, degree, high_pass, dtype=np.float32, layout=None):
+        with self._lock:
+            return self._lookup_locked(key, distance_grid, cutoff_frequency, degree, high_pass, dtype, layout)
+
+    def _lookup_locked(self, key, distance_grid, cutoff_frequency, degree, high_pass, dtype, layout):
+        mask = self._masks.get(key)
+        if mask is not None:
+            self.hits += 1
+            self._masks.move_to_end(key)
+            return mask
+
+        self.misses += 1
+        low_pass_mask = np.exp(-0.5 * (distance_grid() / cutoff_frequency) ** degree)
+        mask = 1 - low_pass_mask if high_pass else low_pass_mask
+        if layout is not None:
+            mask = layout(mask)
+        mask = mask.astype(dtype)
+        mask.setflags(write=False)
+
+        if mask.nbytes <= self.max_bytes:
+            self._masks[key] = mask
+            self.current_bytes += mask.nbytes
+            self._evict()
+        return mask
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Change the memory budget, evicting masks that no longer fit.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Drop every cached mask and distance grid and reset the counters.
+        """
+        with self._lock:
+            self._masks.clear()
+            self._distance_grids.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the memory currently used by cached masks.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._masks),
+                "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    def _half_distance_grid(self, shape):
+        """
+        Distance from zero frequency of every non-negative column frequency, indexed like np.fft.rfft2 output.
+        """
+        rows, cols = shape
+        row_offsets = np.fft.fftfreq(rows, 1 / rows)
+        col_offsets = np.arange(cols // 2 + 1)
+        return self._cached_grid(tuple(shape), row_offsets, col_offsets)
+
+    def _cached_grid(self, key, row_offsets, col_offsets):
+        """
+        Broadcast the row and column offsets into a distance grid, kept for the last few keys.
+        """
+        grid = self._distance_grids.get(key)
+        if grid is None:
+            grid = np.sqrt(row_offsets[:, np.newaxis] ** 2 + col_offsets[np.newaxis, :] ** 2)
+            self._distance_grids[key] = grid
+            while len(self._distance_grids) > 2:
+                self._distance_grids.popitem(last=False)
+        else:
+            self._distance_grids.move_to_end(key)
+        return grid
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._masks:
+            _, evicted = self._masks.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+
+# Mask cache shared by every Hybrid instance
+mask_cache = FrequencyMaskCache()
+
 
 class Hybrid:
-    def __init__(self):
+    def __init__(self, mask_cache=mask_cache, max_spectra=4, result_cache=None, precision=None):
+        # Spectra and filtered images are kept in the precision's float type, float32 by default
+        self.precision = get_precision(precision)
         self.filtered_img_one = None
         self.filtered_img_two = None
+        self.mask_cache = mask_cache
+        # Optional ResultCache keeping filtered images, so toggling back to a setting is free
+        self.result_cache = result_cache
+        # Forward spectra of recent input images, keyed by their content
+        self.max_spectra = max_spectra
+        self._spectra = OrderedDict()
+        # Serializes filtering so concurrent callers see consistent filtered images and spectra
+        self._lock = threading.RLock()
 
     def low_pass(self, image, smoothing_degree):
-         fft_img = fftshift(fft2(image))
-         rows, cols = image.shape
-         crow, ccol = rows // 2, cols // 2
          cutoff_frequency = 10
          smoothing_degree = (smoothing_degree + 1) / 25.6
-         mask = np.zeros((rows, cols), np.float32)
-         for i in range(rows):
-             for j in range(cols):
-                 distance = np.sqrt((i - crow)**2 + (j - ccol)**2)
-                 mask[i, j] = np.exp(-0.5 * (distance / cutoff_frequency) ** smoothing_degree)
-         low_pass_fft = fft_img * mask
-         low_pass = ifft2(ifftshift(low_pass_fft))
-         self.filtered_img_one = low_pass
+         low_pass = self._apply_mask(image, cutoff_frequency, smoothing_degree, high_pass=False)
+         with self._lock:
+             self.filtered_img_one = low_pass
          low_pass = np.abs(low_pass)
          low_pass = normalize_image(low_pass)
          low_pass = low_pass.astype(np.uint8)
          return low_pass
     
     def high_pass(self, image, edge_degree):
-         fft_img = fftshift(fft2(image))
-         rows, cols = image.shape
-         crow, ccol = rows // 2, cols // 2
          cutoff_frequency = 10
-         edge_degree = (edge_degree + 1) / 25.6 
-         mask = np.zeros((rows, cols), np.float32)
-         for i in range(rows):
-             for j in range(cols):
-                 distance = np.sqrt((i - crow)**2 + (j - ccol)**2)
-                 mask[i, j] = 1 - np.exp(-0.5 * (distance / cutoff_frequency) ** edge_degree)
-         high_pass_fft = fft_img * mask
-         high_pass = ifft2(ifftshift(high_pass_fft))
-         self.filtered_img_two = high_pass
+         edge_degree = (edge_degree + 1) / 25.6
+         high_pass = self._apply_mask(image, cutoff_frequency, edge_degree, high_pass=True)
+         with self._lock:
+             self.filtered_img_two = high_pass
          high_pass = np.abs(high_pass)
          high_pass = normalize_image(high_pass)
          high_pass = high_pass.astype(np.uint8)
          return high_pass
 
+    def _apply_mask(self, image, cutoff_frequency, degree, high_pass):
+         """
+         Filter a grayscale image in the frequency domain and return the real-valued result.
+
+         The forward spectrum is reused while the image content is unchanged,
+         so a slider move costs one mask multiply and one inverse transform.
+         With a result cache, filtered images already computed are returned as they are.
+         """
+         if self.result_cache is not None:
+             return self.result_cache.call(f"hybrid_mask:{self.precision.name}", self._filter_spectrum, image,
+                                           cutoff_frequency, degree, high_pass)
+         return self._filter_spectrum(image, cutoff_frequency, degree, high_pass)
+
+    def _filter_spectrum(self, image, cutoff_frequency, degree, high_pass):
+         with self._lock:
+             spectrum = self._spectrum(image)
+         mask = self.mask_cache.get_ccs(image.shape, cutoff_frequency, degree, high_pass, self.precision.float)
+         return cv2.idft(spectrum * mask, flags=cv2.DFT_REAL_OUTPUT | cv2.DFT_SCALE)
+
+    def _spectrum(self, image):
+         """
+         Return the spectrum of the image, computing it on a miss.
+
+         The spectrum is cv2.dft's packed (CCS) output, real-valued and the
+         size of the image, half the memory of a complex half spectrum. The
+         image is transformed at its own size, which cv2.dft handles for any
+         size, so the result is the same as the full complex transform's.
+         """
+         key = image_fingerprint(image)
+         cached = self._spectra.get(key)
+         if cached is not None:
+             self._spectra.move_to_end(key)
+             return cached
+
+         spectrum = cv2.dft(np.asarray(image, dtype=self.precision.float))
+         spectrum.setflags(write=False)
+
+         self._spectra[key] = spectrum
+         while len(self._spectra) > self.max_spectra:
+             self._spectra.popitem(last=False)
+         return spectrum
+
+    def clear_spectra(self):
+         """
+         Forget the cached forward spectra.
+         """
+         with self._lock:
+             self._spectra.clear()
+
     def generate_hybrid(self):
-         img1 = self.filtered_img_one
-         img2 = self.filtered_img_two
+         with self._lock:
+             img1 = self.filtered_img_one
+             img2 = self.filtered_img_two
          if img1 is None or img2 is None:
              return
          if img2.shape != img1.shape:
@@ -71,13 +248,50 @@ def normalize_image(image):
       if min_val == max_val:
           return image
 
-      # Perform normalization
-      normalized_image = ((image - min_val) / (max_val - min_val)) * 255
+      # Subtracting makes one working copy in the image's own float type (float32 for integers),
+      # which is then scaled in place
+      normalized_image = np.subtract(image, min_val, dtype=np.result_type(image.dtype, np.float32))
+      normalized_image /= max_val - min_val
+      normalized_image *= 255
       normalized_image = normalized_image.astype(np.uint8)
 
       return normalized_image
 
+def ccs_layout(half_spectrum, cols):
+      """
+      Lay out a real array indexed like np.fft.rfft2 output like cv2.dft's packed (CCS) spectrum.
+
+      Args:
+          half_spectrum (numpy.ndarray): Values per frequency, of shape (rows, cols // 2 + 1).
+              Row frequencies k and rows - k must share their value, as for a radial mask.
+          cols (int): Columns of the transformed image.
+
+      Returns:
+          numpy.ndarray: Array of shape (rows, cols) holding every frequency's value at the
+          positions of its real and imaginary parts.
+      """
+      rows = half_spectrum.shape[0]
+      packed = np.empty((rows, cols), dtype=half_spectrum.dtype)
+      # Columns 1 .. cols - 2 hold the real and imaginary parts of column frequencies 1 .. (cols - 1) // 2
+      inner = (cols - 1) // 2
+      packed[:, 1:1 + 2 * inner:2] = half_spectrum[:, 1:1 + inner]
+      packed[:, 2:2 + 2 * inner:2] = half_spectrum[:, 1:1 + inner]
+      # The first column, and the last for even widths, pack column frequencies 0 and cols / 2 down the rows
+      edges = [(0, 0)] + ([(cols - 1, cols // 2)] if cols % 2 == 0 else [])
+      pairs = (rows - 1) // 2
+      for packed_col, frequency in edges:
+          column = half_spectrum[:, frequency]
+          packed[0, packed_col] = column[0]
+          packed[1:1 + 2 * pairs:2, packed_col] = column[1:1 + pairs]
+          packed[2:2 + 2 * pairs:2, packed_col] = column[1:1 + pairs]
+          if rows % 2 == 0:
+              packed[rows - 1, packed_col] = column[rows // 2]
+      return packed
+
 def resize_complex_array(complex_array, new_shape):
+    if not np.iscomplexobj(complex_array):
+        # Filtered images are real, resizing them directly avoids a complex128 copy
+        return cv2.resize(complex_array, new_shape[::-1])
     real_part = np.real(complex_array)
     imag_part = np.imag(complex_array)
 
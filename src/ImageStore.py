@@ -0,0 +1,195 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from src.Profiler import profiler
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".jfif", ".bmp", ".tif", ".tiff")
+
+# Variants derived from the decoded BGR image
+_CONVERSIONS = {"rgb": cv2.COLOR_BGR2RGB, "gray": cv2.COLOR_BGR2GRAY}
+
+
+class ImageStore:
+    """
+    Decodes each image file once and serves read-only BGR, RGB and grayscale versions of it.
+
+    Entries remember the file's modification time and size, and are
+    decoded again when the file changes on disk. Variants are derived
+    from the cached decode the first time they are asked for. Least
+    recently used files are evicted once the cached images exceed
+    max_bytes. Files can be decoded ahead of time on background threads,
+    e.g. the neighbours of the image being viewed.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, prefetch_workers=2):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Decodes in progress, so a file being prefetched is not decoded a second time
+        self._loading = {}
+        self._lock = threading.RLock()
+        self._prefetch_workers = prefetch_workers
+        self._executor = None
+
+    def get(self, path, mode="bgr"):
+        """
+        Return the image at path, decoding it only if it is not cached or the file changed.
+
+        Args:
+            path (str): The path to the image file.
+            mode (str): "bgr" as decoded by OpenCV, "rgb" or "gray".
+
+        Returns:
+            numpy.ndarray: Read-only image shared between callers.
+
+        Raises:
+            FileNotFoundError: If the file does not exist or cannot be decoded.
+            ValueError: If mode is unknown.
+        """
+        if mode != "bgr" and mode not in _CONVERSIONS:
+            raise ValueError(f"Unknown image mode: {mode}")
+        path = os.path.abspath(path)
+        entry = self._entry(path)
+        with self._lock:
+            image = entry["variants"].get(mode)
+        if image is None:
+            with profiler.span(f"convert to {mode}", "decode"):
+                image = cv2.cvtColor(entry["variants"]["bgr"], _CONVERSIONS[mode])
+            image.setflags(write=False)
+            with self._lock:
+                image = entry["variants"].setdefault(mode, image)
+                if self._entries.get(path) is entry:
+                    self.current_bytes += image.nbytes
+                    self._evict()
+        return image
+
+    def prefetch(self, paths):
+        """
+        Decode files on background threads so later get calls return immediately.
+        """
+        for path in paths:
+            path = os.path.abspath(path)
+            with self._lock:
+                if path in self._loading:
+                    continue
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._prefetch_workers, thread_name_prefix="image-prefetch")
+            self._executor.submit(self._prefetch_one, path)
+
+    def prefetch_neighbours(self, path, count=2):
+        """
+        Prefetch the count images before and after path in its folder, in name order.
+        """
+        folder, name = os.path.split(os.path.abspath(path))
+        try:
+            names = sorted(entry for entry in os.listdir(folder) if entry.lower().endswith(IMAGE_EXTENSIONS))
+        except OSError:
+            return
+        if name not in names:
+            return
+        position = names.index(name)
+        neighbours = names[position + 1:position + 1 + count] + names[max(0, position - count):position][::-1]
+        self.prefetch(os.path.join(folder, neighbour) for neighbour in neighbours)
+
+    def invalidate(self, path=None):
+        """
+        Forget one file, or every file when path is None.
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self.current_bytes = 0
+                return
+            entry = self._entries.pop(os.path.abspath(path), None)
+            if entry is not None:
+                self.current_bytes -= _entry_bytes(entry)
+
+    def stats(self):
+        """
+        Return the hit/miss counters and the memory currently used by cached images.
+        """
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries),
+                "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    def shutdown(self):
+        """
+        Stop the prefetch threads, e.g. when the application exits.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _entry(self, path):
+        signature = _file_signature(path)
+        while True:
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry["signature"] == signature:
+                    self.hits += 1
+                    self._entries.move_to_end(path)
+                    return entry
+                loading = self._loading.get(path)
+                if loading is None:
+                    loading = self._loading[path] = threading.Event()
+                    break
+            # Another thread is decoding this file, wait for it and look again
+            loading.wait()
+            signature = _file_signature(path)
+
+        try:
+            with self._lock:
+                self.misses += 1
+            return self._decode(path, signature)
+        finally:
+            with self._lock:
+                del self._loading[path]
+            loading.set()
+
+    def _decode(self, path, signature):
+        with profiler.span("imread", "decode"):
+            image = cv2.imread(path)
+        if image is None:
+            raise FileNotFoundError(f"Failed to load image: {path}")
+        image.setflags(write=False)
+        entry = {"signature": signature, "variants": {"bgr": image}}
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None:
+                self.current_bytes -= _entry_bytes(previous)
+            if image.nbytes <= self.max_bytes:
+                self._entries[path] = entry
+                self.current_bytes += image.nbytes
+                self._evict()
+        return entry
+
+    def _prefetch_one(self, path):
+        try:
+            self._entry(path)
+        except (OSError, cv2.error):
+            # Prefetching is best effort, get reports the error if the file is ever opened
+            pass
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= _entry_bytes(evicted)
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise FileNotFoundError(f"Failed to load image: {path}")
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _entry_bytes(entry):
+    return sum(image.nbytes for image in entry["variants"].values())
+
+
+# Image store shared by every viewport
+image_store = ImageStore()
@@ -1,76 +1,149 @@
 import cv2
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src.PointOps import to_uint8
+from src.Precision import get_precision
+from src.Stack import as_mosaic, as_stack
+
+# Pixels per independently seeded band of noise, fixed so a seed gives the same noise whatever the thread count
+_NOISE_BAND_PIXELS = 1 << 20
+
 
 class Noise:
-    def __init__(self, original_img):
-        self.original_img = original_img
+    """
+    Noise generators built on numpy.random.Generator.
+
+    The noise field is drawn in row bands of float32 (Gaussian, float64
+    under the double precision policy) or int16 (uniform) values and added to the image with saturating arithmetic
+    straight into the output, so no full-size float64 field or clipped copy
+    is made. Every band has its own generator spawned from the seed, which
+    makes seeded noise reproducible and lets bands be generated on several
+    threads.
+    """
+
+    def __init__(self, original_img, seed=None, threads=1, batch=False, precision=None):
+        """
+        Args:
+            original_img (numpy.ndarray): The image to add noise to, or a (N, H, W[, C]) stack when batch is True.
+            seed (int, optional): Seed for reproducible noise. Default draws fresh entropy.
+            threads (int): Threads generating bands of large images. Default is 1.
+            batch (bool): Add noise to every image of a stack, the stack being banded as one tall image.
+            precision (Precision or str, optional): Float type of Gaussian noise. Default is the current policy.
+        """
+        self.original_img = as_stack(original_img) if batch else original_img
+        self.batch = batch
+        self.precision = get_precision(precision)
         self.noisy_img = None
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.threads = threads
 
     def slat_and_pepper(self, density=0.05):
         """
         Adds salt and pepper noise to the grayscale image.
-        
+
+        Exactly ceil(density * pixels / 2) distinct pixels are set to 255 and
+        as many others to 0, drawn uniformly over the whole image.
+
         Parameters:
             density (float): Density of the salt and pepper noise. Default is 0.05.
         """
         # Create a copy of the original image
-        self.noisy_img = self.original_img.copy()
-
-        # Calculate the number of salt pixels based on the density
-        num_salt = np.ceil(density * self.original_img.size * 0.5)
-
-        # Generate random coordinates for salt pixels
-        coords_salt = [np.random.randint(0, i - 1, int(num_salt)) for i in self.original_img.shape]
-
-        # Add salt pixels to the noisy image
-        self.noisy_img[coords_salt[0], coords_salt[1]] = 255
-
-        # Calculate the number of pepper pixels based on the density
-        num_pepper = np.ceil(density * self.original_img.size * 0.5)
+        self.noisy_img = np.array(to_uint8(np.asarray(self.original_img)))
+        images = self.noisy_img if self.batch else [self.noisy_img]
+        # One generator per image, so every image of a stack gets its exact share of salt and pepper
+        for image, seed in zip(images, self.seed_sequence.spawn(len(images))):
+            _salt_and_pepper(image, density, np.random.default_rng(seed))
 
-        # Generate random coordinates for pepper pixels
-        coords_pepper = [np.random.randint(0, i - 1, int(num_pepper)) for i in self.original_img.shape]
-
-        # Add pepper pixels to the noisy image
-        self.noisy_img[coords_pepper[0], coords_pepper[1]] = 0
-
-        # Return the noisy image as unsigned 8-bit integers
-        return self.noisy_img.astype(np.uint8)
+        return self.noisy_img
 
     def gaussian_noise(self, mean=0, stddev=25):
         """
         Adds Gaussian noise to the image.
-        
+
         Parameters:
             mean (float): Mean of the Gaussian distribution. Default is 0.
             stddev (float): Standard deviation of the Gaussian distribution. Default is 25.
         """
-        # Make a copy of the original image
-        self.noisy_img = self.original_img.copy()
+        def draw(rng, shape):
+            noise = rng.standard_normal(shape, dtype=self.precision.float)
+            noise *= stddev
+            noise += mean
+            return noise
 
-        # Add Gaussian noise to the image
-        noise = np.random.normal(mean, stddev, self.original_img.shape)
-        self.noisy_img = np.clip(self.noisy_img + noise, 0, 255)
-
-        # Convert the noisy image to unsigned 8-bit integer
-        return self.noisy_img.astype(np.uint8)
+        return self._add_noise(draw)
 
     def uniform_noise(self, min_val=0, max_val=100):
         """
         Adds uniform noise to the image.
-        
+
         Parameters:
             min_val (int): Minimum value of the uniform distribution. Default is 0.
-            max_val (int): Maximum value of the uniform distribution. Default is 255.
+            max_val (int): Maximum value of the uniform distribution. Default is 100.
         """
-        # Create a copy of the original image
-        self.noisy_img = self.original_img.copy()
-
-        # Generate random noise with values between min_val and max_val
-        noise = np.random.randint(min_val, max_val + 1, self.original_img.shape)
-
-        # Add the noise to the noisy image and ensure the pixel values stay within the range [0, 255]
-        self.noisy_img = np.clip(self.noisy_img + noise, 0, 255)
+        # int16 holds every offset that can still change a uint8 pixel
+        low, high = np.clip([min_val, max_val], -255, 255)
+        return self._add_noise(lambda rng, shape: rng.integers(low, high, shape, dtype=np.int16, endpoint=True))
 
-        # Convert the noisy image to unsigned 8-bit integer type and return it
-        return self.noisy_img.astype(np.uint8)
\ No newline at end of file
+    def _add_noise(self, draw):
+        """
+        Add noise drawn by draw(rng, shape) to the image band by band, saturating to uint8.
+        """
+        image = np.ascontiguousarray(to_uint8(np.asarray(self.original_img)))
+        self.noisy_img = np.empty_like(image)
+        if self.batch:
+            # Noise is independent per pixel, so the stack is banded like one tall image
+            return self._add_noise_bands(draw, as_mosaic(image), as_mosaic(self.noisy_img)).reshape(image.shape)
+        return self._add_noise_bands(draw, image, self.noisy_img)
+
+    def _add_noise_bands(self, draw, image, out):
+        row_pixels = max(1, int(np.prod(image.shape[1:])))
+        rows_per_band = max(1, _NOISE_BAND_PIXELS // row_pixels)
+        band_starts = range(0, image.shape[0], rows_per_band)
+        band_seeds = self.seed_sequence.spawn(len(band_starts))
+
+        def add_band(start, seed):
+            band = slice(start, start + rows_per_band)
+            noise = draw(np.random.default_rng(seed), image[band].shape)
+            # Saturating add straight into the output rows
+            cv2.add(image[band], noise, dst=out[band], dtype=cv2.CV_8U)
+
+        if self.threads > 1 and len(band_starts) > 1:
+            with ThreadPoolExecutor(self.threads) as executor:
+                list(executor.map(add_band, band_starts, band_seeds))
+        else:
+            for start, seed in zip(band_starts, band_seeds):
+                add_band(start, seed)
+        return out
+
+
+def _salt_and_pepper(image, density, rng):
+    """
+    Set an exact density of distinct pixels of one image to 255 and 0, in place.
+    """
+    rows, cols = image.shape[:2]
+
+    # Calculate the number of salt pixels, and as many pepper pixels, based on the density
+    num_salt = min(int(np.ceil(density * rows * cols * 0.5)), rows * cols // 2)
+
+    # Draw distinct pixels without replacement, the first half becomes salt and the second half pepper
+    pixels = _distinct_indices(rng, rows * cols, 2 * num_salt)
+    flat = image.reshape(rows * cols, -1)
+    flat[pixels[:num_salt]] = 255
+    flat[pixels[num_salt:]] = 0
+
+
+def _distinct_indices(rng, population, count):
+    """
+    count distinct integers drawn uniformly from range(population), in random order.
+
+    Sparse draws are made with replacement and topped up until enough
+    distinct values remain, which needs memory for count values only,
+    not for the whole population.
+    """
+    if count > population // 4:
+        return rng.choice(population, count, replace=False)
+    picked = np.empty(0, dtype=np.int64)
+    while picked.size < count:
+        picked = np.unique(np.concatenate([picked, rng.integers(0, population, count - picked.size)]))
+    # Any subset of a uniform sample is uniform, and shuffling decides which pixels become salt
+    return rng.permutation(picked)[:count]
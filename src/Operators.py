@@ -0,0 +1,217 @@
+import time
+import numpy as np
+from src.Filters import Filter
+from src.Noise import Noise
+from src.Edge_Detector import EdgeDetector
+from src.Thresholding import thresholding
+from src.Decoding import Decoding
+from src.Hybrid import Hybrid
+
+
+###################################################################################
+#               Single image operators, addressable by name                       #
+###################################################################################
+
+def median(image, kernel_size=3):
+    return Filter(image, kernel_size).median_filter()
+
+
+def average(image, kernel_size=3):
+    return Filter(image, kernel_size).average_filter()
+
+
+def gaussian(image, kernel_size=3, sigma=1):
+    return Filter(image, kernel_size).gaussian_filter(sigma=sigma)
+
+
+def salt_pepper(image, density=0.05, seed=None):
+    return Noise(image, seed).slat_and_pepper(density)
+
+
+def gaussian_noise(image, stddev=25, seed=None):
+    return Noise(image, seed).gaussian_noise(stddev=stddev)
+
+
+def uniform_noise(image, max_val=100, seed=None):
+    return Noise(image, seed).uniform_noise(max_val=max_val)
+
+
+def sobel(image):
+    return EdgeDetector(image).sobel_detector()
+
+
+def roberts(image):
+    return EdgeDetector(image).roberts_detector()
+
+
+def prewitt(image):
+    return EdgeDetector(image).prewitt_detector()
+
+
+def canny(image, low_threshold=5, high_threshold=20, blur_size=5):
+    return EdgeDetector(image).canny_detector(low_threshold, high_threshold, blur_size)
+
+
+def global_threshold(image, threshold=120):
+    operator = thresholding(image)
+    operator.threshold = threshold
+    return operator.global_thresholding()
+
+
+def local_threshold(image, window_size=11, method="mean", k=None):
+    return thresholding(image).local_thresholding(method, window_size, k)
+
+
+def equalize(image):
+    return Decoding(image).equalize()
+
+
+def normalize(image):
+    return Decoding(image).normalize()
+
+
+def gamma(image, gamma=1.0):
+    return Decoding(image).gamma_correction(gamma)
+
+
+def contrast_stretch(image, low_percentile=2, high_percentile=98):
+    return Decoding(image).contrast_stretch(low_percentile, high_percentile)
+
+
+def low_pass(image, degree=128):
+    return Hybrid().low_pass(image, degree)
+
+
+def high_pass(image, degree=128):
+    return Hybrid().high_pass(image, degree)
+
+
+OPERATORS = {
+    "median": median,
+    "average": average,
+    "gaussian": gaussian,
+    "salt_pepper": salt_pepper,
+    "gaussian_noise": gaussian_noise,
+    "uniform_noise": uniform_noise,
+    "sobel": sobel,
+    "roberts": roberts,
+    "prewitt": prewitt,
+    "canny": canny,
+    "global_threshold": global_threshold,
+    "local_threshold": local_threshold,
+    "equalize": equalize,
+    "normalize": normalize,
+    "gamma": gamma,
+    "contrast_stretch": contrast_stretch,
+    "low_pass": low_pass,
+    "high_pass": high_pass,
+}
+
+# Operators that only accept single-channel images, every other operator keeps the channel count
+GRAYSCALE_ONLY = ("canny", "low_pass", "high_pass")
+
+
+###################################################################################
+#               Operator chains such as "median:5 | canny | equalize"             #
+###################################################################################
+
+class OperatorChain:
+    """
+    An ordered list of named operators applied one after another.
+
+    Each stage is written as ``name`` or ``name:arg1:arg2``, with stages
+    separated by ``|``, for example ``median:5 | canny:10:30 | local_threshold:25:sauvola``.
+    Arguments are passed positionally to the operator functions above.
+    """
+
+    def __init__(self, stages):
+        self.stages = list(stages)
+
+    @classmethod
+    def parse(cls, spec):
+        """
+        Build a chain from its text form.
+
+        Args:
+            spec (str): Stages separated by "|", each "name" or "name:arg:...".
+
+        Returns:
+            OperatorChain: The parsed chain.
+        """
+        stages = []
+        for stage_spec in spec.split("|"):
+            stage_spec = stage_spec.strip()
+            if not stage_spec:
+                continue
+            name, *args = stage_spec.split(":")
+            name = name.strip()
+            if name not in OPERATORS:
+                raise ValueError(f"Unknown operator '{name}', expected one of: {', '.join(OPERATORS)}")
+            stages.append((name, tuple(_parse_number(arg) for arg in args)))
+        if not stages:
+            raise ValueError("Operator chain is empty")
+        return cls(stages)
+
+    def __call__(self, image, timings=None):
+        """
+        Apply every stage to the image.
+
+        Args:
+            image (numpy.ndarray): The input image.
+            timings (list, optional): If given, (stage label, seconds) pairs are appended to it.
+
+        Returns:
+            numpy.ndarray: The output of the last stage.
+        """
+        for label, (name, args) in zip(self.labels(), self.stages):
+            start = time.perf_counter()
+            image = OPERATORS[name](image, *args)
+            if timings is not None:
+                timings.append((label, time.perf_counter() - start))
+        return image
+
+    def check_channels(self, channels):
+        """
+        Check that every stage accepts images with the given number of channels.
+
+        Raises:
+            ValueError: If a stage needs grayscale input and channels is not 1.
+        """
+        if channels == 1:
+            return
+        unsupported = [label for label, (name, _) in zip(self.labels(), self.stages) if name in GRAYSCALE_ONLY]
+        if unsupported:
+            raise ValueError(f"Stages needing grayscale input: {', '.join(unsupported)}; "
+                             f"the input has {channels} channels")
+
+    def labels(self):
+        """
+        Return a readable label per stage, e.g. "median:5".
+        """
+        return [":".join([name, *map(str, args)]) for name, args in self.stages]
+
+    def __str__(self):
+        return " | ".join(self.labels())
+
+
+def _parse_number(text):
+    """
+    Convert a stage argument to int or float, leaving words such as "sauvola" as strings.
+    """
+    text = text.strip()
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            pass
+    return text
+
+
+def as_uint8(image):
+    """
+    Return the image as uint8, saturating other dtypes, without copying uint8 input.
+    """
+    image = np.asarray(image)
+    if image.dtype == np.uint8:
+        return image
+    return np.clip(image, 0, 255).astype(np.uint8)
@@ -0,0 +1,337 @@
+"""
+Lookup-table engine for uint8 point operations.
+
+Every operation whose output pixel depends only on the input pixel value
+is a 256-entry table. Chained operations are composed into one table and
+applied with a single cv2.LUT pass, without float temporaries the size of
+the image. Operations that depend on the image content (equalize,
+normalize, percentile contrast stretch) are built from the image's
+histogram, which is computed once and pushed through the earlier tables
+of the chain instead of being recomputed from pixels.
+"""
+import numpy as np
+import cv2
+
+
+class PointOp:
+    """
+    A uint8 -> uint8 point operation stored as a 256-entry lookup table.
+    """
+
+    def __init__(self, table):
+        table = np.asarray(table)
+        if table.shape != (256,):
+            raise ValueError(f"A point operation table needs 256 entries, got shape {table.shape}")
+        self.table = np.clip(table, 0, 255).astype(np.uint8)
+
+    @classmethod
+    def identity(cls):
+        return cls(np.arange(256))
+
+    def then(self, other):
+        """
+        Return the point operation applying self first and other second.
+        """
+        return PointOp(other.table[self.table])
+
+    def apply(self, image, out=None):
+        """
+        Map every pixel of a uint8 image through the table.
+
+        Args:
+            image (numpy.ndarray): uint8 image of any shape.
+            out (numpy.ndarray, optional): uint8 array receiving the result,
+                may be image itself for an in-place update.
+
+        Returns:
+            numpy.ndarray: The mapped image.
+        """
+        if image.dtype != np.uint8:
+            raise TypeError(f"Point operations apply to uint8 images, got {image.dtype}")
+        if image.size == 0:
+            return image.copy() if out is None else out
+        if image.ndim > 2 and image.flags.c_contiguous and (out is None or out.flags.c_contiguous):
+            # cv2.LUT reads a third axis as channels, limited in number, so stacks go through 2D views
+            rows = image.shape[0]
+            result = self.apply(image.reshape(rows, -1), None if out is None else out.reshape(rows, -1))
+            return result.reshape(image.shape) if out is None else out
+        if out is None:
+            return cv2.LUT(image, self.table)
+        # cv2.LUT cannot write into a read-only or non-contiguous target, np.take can
+        if out.flags.c_contiguous and out.flags.writeable:
+            cv2.LUT(image, self.table, dst=out)
+        else:
+            np.take(self.table, image, out=out)
+        return out
+
+    def remap_histogram(self, histogram):
+        """
+        Return the histogram of an image after this operation, given its histogram before.
+        """
+        return np.bincount(self.table, weights=histogram, minlength=256)
+
+
+###################################################################################
+#               Table builders                                                    #
+###################################################################################
+
+def histogram_of(image):
+    """
+    Exact 256-bin int64 histogram of a uint8 image.
+
+    cv2.calcHist counts without copying the pixels but in float32, which
+    is exact only up to 2**24 per bin, so large images are counted in
+    bands of at most that many pixels.
+    """
+    image = image.reshape(image.shape[0], -1) if image.ndim != 2 else image
+    histogram = np.zeros(256, dtype=np.int64)
+    rows_per_band = max(1, (1 << 24) // max(1, image.shape[1]))
+    for top in range(0, image.shape[0], rows_per_band):
+        band = image[top:top + rows_per_band]
+        histogram += cv2.calcHist([band], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+    return histogram
+
+
+def to_uint8(image):
+    """
+    The image as uint8 like cv2.convertScaleAbs (absolute value, saturated), without copying uint8 input.
+    """
+    if image.dtype == np.uint8:
+        return image
+    if image.ndim > 2 and image.flags.c_contiguous:
+        # Like cv2.LUT, convertScaleAbs reads a third axis as channels, so stacks go through a 2D view
+        return cv2.convertScaleAbs(image.reshape(image.shape[0], -1)).reshape(image.shape)
+    return cv2.convertScaleAbs(image)
+
+
+def threshold_lut(threshold):
+    """
+    255 above threshold, 0 otherwise.
+    """
+    return PointOp(np.where(np.arange(256) > threshold, 255, 0))
+
+
+def gamma_lut(gamma):
+    """
+    Gamma correction, out = 255 * (in / 255) ** gamma, rounded.
+    """
+    return PointOp(np.round(255 * (np.arange(256) / 255) ** gamma))
+
+
+def contrast_stretch_lut(low, high):
+    """
+    Linearly map [low, high] onto [0, 255], saturating outside.
+    """
+    if high <= low:
+        return PointOp.identity()
+    return PointOp(np.round((np.arange(256) - low) * 255 / (high - low)))
+
+
+def equalize_lut(histogram):
+    """
+    Histogram equalization table for an image with the given histogram.
+    """
+    return PointOp(equalize_tables(np.asarray(histogram)[np.newaxis])[0])
+
+
+def normalize_lut(histogram):
+    """
+    Min-max normalization table, stretching the occupied range of the histogram to [0, 255].
+    """
+    return PointOp(normalize_tables(np.asarray(histogram)[np.newaxis])[0])
+
+
+def percentile_stretch_lut(histogram, low_percentile=2, high_percentile=98):
+    """
+    Contrast stretch between two percentiles of the histogram.
+    """
+    return PointOp(percentile_stretch_tables(np.asarray(histogram)[np.newaxis], low_percentile, high_percentile)[0])
+
+
+###################################################################################
+#               Table builders over many histograms at once                       #
+###################################################################################
+
+def equalize_tables(histograms):
+    """
+    Equalization tables of (N, 256) histograms, one uint8 table per row.
+    """
+    # Calculate the cumulative distribution function (CDF) of every histogram
+    cdf = np.cumsum(histograms, axis=1)
+    low, high = cdf.min(axis=1, keepdims=True), cdf.max(axis=1, keepdims=True)
+    flat = (high == low)[:, 0]
+    # Normalize every CDF to the range [0, 255]
+    tables = ((cdf - low) * 255 / np.where(high == low, 1, high - low)).astype(np.uint8)
+    tables[flat] = np.arange(256)
+    return tables
+
+
+def normalize_tables(histograms):
+    """
+    Min-max normalization tables of (N, 256) histograms, one uint8 table per row.
+    """
+    occupied = np.asarray(histograms) != 0
+    first = occupied.argmax(axis=1)
+    last = 255 - occupied[:, ::-1].argmax(axis=1)
+    flat = ~occupied.any(axis=1) | (first == last)
+    # Same float32 arithmetic as normalizing the pixels directly
+    min_val = first.astype(np.float32)[:, np.newaxis]
+    max_val = last.astype(np.float32)[:, np.newaxis]
+    values = np.arange(256, dtype=np.float32)
+    tables = _saturate(255 * (values - min_val) / np.where(flat[:, np.newaxis], np.float32(1), max_val - min_val))
+    tables[flat] = np.arange(256)
+    return tables
+
+
+def percentile_stretch_tables(histograms, low_percentile=2, high_percentile=98):
+    """
+    Contrast stretch tables between two percentiles of (N, 256) histograms, one uint8 table per row.
+    """
+    cdf = np.cumsum(histograms, axis=1)
+    total = cdf[:, -1:]
+    # Index of the first bin reaching each percentile, as np.searchsorted finds it in one CDF
+    low = (cdf < total * low_percentile / 100).sum(axis=1, keepdims=True)
+    high = (cdf < total * high_percentile / 100).sum(axis=1, keepdims=True)
+    flat = (total == 0) | (high <= low)
+    tables = _saturate(np.round((np.arange(256) - low) * 255 / np.where(flat, 1, high - low)))
+    tables[flat[:, 0]] = np.arange(256)
+    return tables
+
+
+def _saturate(tables):
+    return np.clip(tables, 0, 255).astype(np.uint8)
+
+
+def _remap_histograms(tables, histograms):
+    """
+    Histograms of N images after mapping each through its own table, given their histograms before.
+    """
+    count = len(tables)
+    index = tables.astype(np.intp) + np.arange(count, dtype=np.intp)[:, np.newaxis] * 256
+    return np.bincount(index.ravel(), weights=np.asarray(histograms, dtype=np.float64).ravel(),
+                       minlength=count * 256).reshape(count, 256)
+
+
+class HistogramStage:
+    """
+    A chain stage built from the histogram of the image reaching it.
+
+    Args:
+        build_tables (callable): Maps (N, 256) histograms to (N, 256) uint8 tables,
+            so a stack of images gets all its tables in one call.
+    """
+
+    def __init__(self, build_tables):
+        self.build_tables = build_tables
+
+    def __call__(self, histogram):
+        return PointOp(self.build_tables(np.asarray(histogram)[np.newaxis])[0])
+
+
+###################################################################################
+#               Chains                                                            #
+###################################################################################
+
+class PointOpChain:
+    """
+    A sequence of point operations compiled into one lookup table.
+
+    Stages are either fixed PointOps or builders that take the histogram of
+    the image as it reaches that stage and return a PointOp.
+
+    Example:
+        >>> PointOpChain().gamma(0.8).equalize().threshold(128).apply(gray)
+    """
+
+    def __init__(self, stages=()):
+        self.stages = list(stages)
+
+    def append(self, stage):
+        """
+        Add a PointOp or a histogram -> PointOp builder, returning the chain.
+        """
+        self.stages.append(stage)
+        return self
+
+    def extend(self, other):
+        """
+        Add every stage of another chain, returning the chain.
+        """
+        self.stages.extend(other.stages)
+        return self
+
+    def equalize(self):
+        return self.append(HistogramStage(equalize_tables))
+
+    def normalize(self):
+        return self.append(HistogramStage(normalize_tables))
+
+    def threshold(self, threshold):
+        return self.append(threshold_lut(threshold))
+
+    def gamma(self, gamma):
+        return self.append(gamma_lut(gamma))
+
+    def contrast_stretch(self, low_percentile=2, high_percentile=98):
+        return self.append(HistogramStage(
+            lambda histograms: percentile_stretch_tables(histograms, low_percentile, high_percentile)))
+
+    def is_data_dependent(self):
+        return any(not isinstance(stage, PointOp) for stage in self.stages)
+
+    def compile(self, image=None, histogram=None):
+        """
+        Compose every stage into a single PointOp.
+
+        Args:
+            image (numpy.ndarray, optional): The image the chain will be
+                applied to; needed when a stage depends on the image content
+                and histogram is not given.
+            histogram (numpy.ndarray, optional): Precomputed 256-bin histogram of image.
+
+        Returns:
+            PointOp: The composed operation.
+        """
+        composed = PointOp.identity()
+        for stage in self.stages:
+            if not isinstance(stage, PointOp):
+                if histogram is None:
+                    if image is None:
+                        raise ValueError("This chain depends on the image content, pass the image or its histogram")
+                    histogram = histogram_of(image)
+                stage = stage(composed.remap_histogram(histogram))
+            composed = composed.then(stage)
+        return composed
+
+    def compile_tables(self, histograms):
+        """
+        Compose every stage into one table per image of a stack, from the images' histograms.
+
+        Histogram stages build the tables of every image in one call, other
+        histogram -> PointOp builders are called once per image.
+
+        Args:
+            histograms (numpy.ndarray): (N, 256) histograms, one per image.
+
+        Returns:
+            numpy.ndarray: (N, 256) uint8 tables.
+        """
+        histograms = np.asarray(histograms)
+        composed = np.tile(np.arange(256, dtype=np.uint8), (len(histograms), 1))
+        for stage in self.stages:
+            if isinstance(stage, PointOp):
+                composed = stage.table[composed]
+                continue
+            remapped = _remap_histograms(composed, histograms)
+            if isinstance(stage, HistogramStage):
+                tables = stage.build_tables(remapped)
+            else:
+                tables = np.stack([stage(histogram).table for histogram in remapped])
+            composed = np.take_along_axis(tables, composed.astype(np.intp), axis=1)
+        return composed
+
+    def apply(self, image, out=None, histogram=None):
+        """
+        Apply the whole chain to a uint8 image in one pass over its pixels.
+        """
+        return self.compile(image, histogram).apply(image, out)
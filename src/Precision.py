@@ -0,0 +1,70 @@
+"""
+Working precision of the operators' floating point intermediates.
+
+The "compact" policy, the default, keeps gradient magnitudes and
+directions, Gaussian noise fields, local window statistics and Hybrid
+spectra in float32, which is plenty for 8-bit images and half the memory
+of float64. Exact integer intermediates, such as the int16 Sobel
+gradients and uniform noise, are the same under every policy, and so is
+the float64 FFT path of very large filter kernels, whose results must not
+depend on the image size.
+The "double" policy computes the same intermediates in float64, for
+callers that need results matching double precision arithmetic.
+
+    from src.Precision import set_precision
+    set_precision("double")
+
+Operators read the default policy when they are constructed and keep it,
+so changing it does not affect instances already created, and also
+accept a precision argument overriding it.
+"""
+import numpy as np
+
+
+class Precision:
+    """
+    A named floating point precision.
+
+    Args:
+        name (str): Name used on command lines and in benchmark results.
+        float_dtype: Dtype of real-valued intermediates.
+    """
+
+    def __init__(self, name, float_dtype):
+        self.name = name
+        self.float = np.dtype(float_dtype)
+
+    def __repr__(self):
+        return f"Precision({self.name!r}, {self.float.name})"
+
+
+COMPACT = Precision("compact", np.float32)
+DOUBLE = Precision("double", np.float64)
+
+PRECISIONS = {precision.name: precision for precision in (COMPACT, DOUBLE)}
+
+_default = COMPACT
+
+
+def get_precision(precision=None):
+    """
+    Resolve a Precision, a name from PRECISIONS, or None for the current default.
+
+    Raises:
+        ValueError: If the name is unknown.
+    """
+    if precision is None:
+        return _default
+    if isinstance(precision, Precision):
+        return precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of: {', '.join(PRECISIONS)}")
+    return PRECISIONS[precision]
+
+
+def set_precision(precision):
+    """
+    Make precision (a Precision or its name) the default for operators created from now on.
+    """
+    global _default
+    _default = get_precision(precision)
@@ -0,0 +1,168 @@
+"""
+Lightweight instrumentation of the toolkit's hot paths.
+
+Code marks its expensive steps with spans:
+
+    with profiler.span("imread", "decode"):
+        image = cv2.imread(path)
+
+While the profiler is disabled, span returns one shared no-op context
+manager, so an instrumented call costs a method call and nothing is
+recorded. Enabled, every span records its start, duration and thread,
+and optionally the bytes it allocated and kept (traced with tracemalloc,
+which slows everything down while on, and counts every thread's
+allocations, so it is approximate while several spans run at once). Recorded spans are aggregated per
+name and can be exported as a Chrome trace (chrome://tracing, Perfetto).
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+from collections import deque
+
+
+class _NullSpan:
+    """
+    Context manager doing nothing, returned while the profiler is disabled.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "category", "start", "start_bytes")
+
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start_bytes = tracemalloc.get_traced_memory()[0] if self.profiler.track_allocations else None
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        duration = time.perf_counter() - self.start
+        allocated = None
+        if self.start_bytes is not None and tracemalloc.is_tracing():
+            allocated = tracemalloc.get_traced_memory()[0] - self.start_bytes
+        self.profiler.record(self.name, self.category, self.start, duration, allocated)
+        return False
+
+
+class Profiler:
+    """
+    Collects timed spans and per-name totals.
+
+    Args:
+        max_events (int): Most recent spans kept for the trace export, older ones are dropped.
+    """
+
+    def __init__(self, max_events=100_000):
+        self.enabled = False
+        self.track_allocations = False
+        self.events = deque(maxlen=max_events)
+        self._totals = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self, track_allocations=False):
+        """
+        Start recording spans, and the bytes they allocate if track_allocations is True.
+        """
+        if track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif not track_allocations and self.track_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_allocations = track_allocations
+        self.enabled = True
+
+    def disable(self):
+        """
+        Stop recording. Spans already recorded are kept.
+        """
+        self.enabled = False
+        if self.track_allocations and tracemalloc.is_tracing():
+            tracemalloc.stop()
+        self.track_allocations = False
+
+    def span(self, name, category="operator"):
+        """
+        Context manager timing the code it wraps under name.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category)
+
+    def record(self, name, category, start, duration, allocated=None):
+        """
+        Add a finished span. start is a time.perf_counter() value, duration in seconds.
+        """
+        thread = threading.current_thread()
+        self.events.append((name, category, start, duration, allocated, thread.ident, thread.name))
+        with self._lock:
+            totals = self._totals.get((category, name))
+            if totals is None:
+                totals = self._totals[(category, name)] = {"count": 0, "total": 0.0, "max": 0.0, "allocated": 0}
+            totals["count"] += 1
+            totals["total"] += duration
+            totals["max"] = max(totals["max"], duration)
+            if allocated is not None:
+                totals["allocated"] += allocated
+
+    def stats(self):
+        """
+        Per-span totals, sorted by total time.
+
+        Returns:
+            list: Dicts with the category, name, count, total, mean and max seconds, and allocated bytes.
+        """
+        with self._lock:
+            rows = [dict(totals, category=category, name=name, mean=totals["total"] / totals["count"])
+                    for (category, name), totals in self._totals.items()]
+        return sorted(rows, key=lambda row: row["total"], reverse=True)
+
+    def clear(self):
+        with self._lock:
+            self.events.clear()
+            self._totals.clear()
+            self._origin = time.perf_counter()
+
+    def chrome_trace(self):
+        """
+        The recorded spans in the Chrome trace event format.
+        """
+        pid = os.getpid()
+        trace_events = []
+        thread_names = {}
+        for name, category, start, duration, allocated, thread_id, thread_name in list(self.events):
+            thread_names[thread_id] = thread_name
+            event = {"name": name, "cat": category, "ph": "X", "pid": pid, "tid": thread_id,
+                     "ts": (start - self._origin) * 1e6, "dur": duration * 1e6}
+            if allocated is not None:
+                event["args"] = {"allocated_bytes": allocated}
+            trace_events.append(event)
+        for thread_id, thread_name in thread_names.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": thread_id,
+                                 "args": {"name": thread_name}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        """
+        Write the recorded spans to path as a Chrome trace JSON file.
+        """
+        with open(path, "w") as trace_file:
+            json.dump(self.chrome_trace(), trace_file)
+
+
+# Profiler shared by the whole application
+profiler = Profiler()
@@ -0,0 +1,91 @@
+from PyQt6.QtCore import Qt, QTimer
+from PyQt6.QtWidgets import (QCheckBox, QDockWidget, QFileDialog, QHBoxLayout, QHeaderView, QPushButton,
+                             QTableWidget, QTableWidgetItem, QVBoxLayout, QWidget)
+from src.Profiler import profiler
+
+_COLUMNS = ("Span", "Category", "Calls", "Total (ms)", "Mean (ms)", "Max (ms)", "Kept (MiB)")
+
+
+class ProfilerPanel(QDockWidget):
+    """
+    Dockable panel showing the profiler's per-span totals, refreshed while it is visible.
+
+    The panel turns recording and allocation tracking on and off, clears
+    the totals and exports the recorded spans as a Chrome trace.
+    """
+
+    def __init__(self, parent=None, profiler=profiler, refresh_ms=500):
+        super().__init__("Profiler", parent)
+        self.profiler = profiler
+        self.setObjectName("profilerPanel")
+
+        self.enabled_box = QCheckBox("Record")
+        self.enabled_box.toggled.connect(self.set_recording)
+        self.allocations_box = QCheckBox("Track allocations")
+        self.allocations_box.toggled.connect(self.set_recording)
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear)
+        export_button = QPushButton("Export trace...")
+        export_button.clicked.connect(self.export_trace)
+
+        controls = QHBoxLayout()
+        for widget in (self.enabled_box, self.allocations_box, clear_button, export_button):
+            controls.addWidget(widget)
+        controls.addStretch()
+
+        self.table = QTableWidget(0, len(_COLUMNS))
+        self.table.setHorizontalHeaderLabels(_COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+
+        layout = QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self.table)
+        content = QWidget()
+        content.setLayout(layout)
+        self.setWidget(content)
+
+        self.timer = QTimer(self)
+        self.timer.setInterval(refresh_ms)
+        self.timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def set_recording(self, _=None):
+        if self.enabled_box.isChecked():
+            self.profiler.enable(track_allocations=self.allocations_box.isChecked())
+        else:
+            self.profiler.disable()
+
+    def on_visibility_changed(self, visible: bool):
+        # Only spend time on refreshing the table while it can be seen
+        if visible:
+            self.refresh()
+            self.timer.start()
+        else:
+            self.timer.stop()
+
+    def refresh(self):
+        """
+        Fill the table with the current per-span totals, slowest first.
+        """
+        rows = self.profiler.stats()
+        self.table.setRowCount(len(rows))
+        for row_index, row in enumerate(rows):
+            allocated = f"{row['allocated'] / 2 ** 20:.2f}" if self.profiler.track_allocations else ""
+            values = (row["name"], row["category"], str(row["count"]), f"{row['total'] * 1000:.1f}",
+                      f"{row['mean'] * 1000:.2f}", f"{row['max'] * 1000:.2f}", allocated)
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column >= 2:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row_index, column, item)
+
+    def clear(self):
+        self.profiler.clear()
+        self.refresh()
+
+    def export_trace(self):
+        path, _ = QFileDialog.getSaveFileName(self, "Export Chrome Trace", "./trace.json", filter="JSON (*.json)")
+        if path:
+            self.profiler.export_chrome_trace(path)
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict
+import numpy as np
+
+
+class ResultCache:
+    """
+    Content-addressed LRU cache of operator results.
+
+    Results are keyed by the operator name, a hash of the input image's
+    pixels and the operator's parameters, so re-applying an operator to
+    the same image returns the stored result whatever array holds the
+    image. Results are stored read-only and shared between callers. Least
+    recently used results are evicted once the cached results exceed
+    max_bytes.
+    """
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self._results = OrderedDict()
+        # Fingerprints of read-only arrays that own their pixels, which cannot change under us
+        self._fingerprints = {}
+        # Operators run on worker threads and share this cache
+        self._lock = threading.RLock()
+
+    def call(self, operator, function, image, *args, **kwargs):
+        """
+        Return function(image, *args, **kwargs), computing it only if it is not cached yet.
+
+        Only deterministic operators should go through the cache; unseeded
+        noise would keep returning the same noise.
+
+        Args:
+            operator (str): Name identifying what function computes, part of the key.
+            function (callable): Computes the result from the image and parameters.
+            image (numpy.ndarray): Input image, hashed by content.
+            *args, **kwargs: Operator parameters, part of the key. Must be hashable.
+
+        Returns:
+            The (read-only) result.
+        """
+        key = (operator, self.fingerprint(image), args, tuple(sorted(kwargs.items())))
+
+        def compute():
+            result = function(image, *args, **kwargs)
+            # Never freeze the caller's input when an operator hands it back unchanged
+            if isinstance(result, np.ndarray) and np.shares_memory(result, image):
+                result = result.copy()
+            return result
+
+        return self.get_or_compute(key, compute)
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the result stored under key, calling compute() and storing its result on a miss.
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return result
+            self.misses += 1
+
+        # Compute outside the lock so other operators keep running meanwhile
+        result = _freeze(compute())
+        if result is None:
+            return result
+        nbytes = _nbytes(result)
+        with self._lock:
+            if nbytes <= self.max_bytes and key not in self._results:
+                self._results[key] = result
+                self.current_bytes += nbytes
+                self._evict()
+        return result
+
+    def fingerprint(self, image):
+        """
+        Key identifying an image by its content, reusing the hash of arrays this cache made read-only.
+        """
+        if image.flags.writeable or not image.flags.owndata:
+            return image_fingerprint(image)
+        with self._lock:
+            cached = self._fingerprints.get(id(image))
+            if cached is not None and cached[0]() is image:
+                return cached[1]
+        key = image_fingerprint(image)
+        with self._lock:
+            image_id = id(image)
+            self._fingerprints[image_id] = (weakref.ref(image, lambda _: self._fingerprints.pop(image_id, None)), key)
+        return key
+
+    def set_max_bytes(self, max_bytes):
+        """
+        Change the memory budget, evicting results that no longer fit.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def clear(self):
+        """
+        Drop every cached result and reset the counters.
+        """
+        with self._lock:
+            self._results.clear()
+            self._fingerprints.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.evicted_bytes = 0
+
+    def stats(self):
+        """
+        Return the hit/miss/eviction counters and the memory currently used by cached results.
+        """
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes, "entries": len(self._results),
+                "bytes": self.current_bytes, "max_bytes": self.max_bytes}
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._results:
+            _, evicted = self._results.popitem(last=False)
+            nbytes = _nbytes(evicted)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+            self.evicted_bytes += nbytes
+
+
+def image_fingerprint(image):
+    """
+    Key identifying an image by its shape, dtype and pixel content.
+    """
+    image = np.ascontiguousarray(image)
+    return image.shape, image.dtype.str, hashlib.blake2b(image.data, digest_size=16).digest()
+
+
+def _freeze(result):
+    """
+    Make the arrays of a result read-only so callers cannot alter the cached copy.
+    """
+    if isinstance(result, np.ndarray):
+        result.setflags(write=False)
+    elif isinstance(result, tuple):
+        for item in result:
+            _freeze(item)
+    return result
+
+
+def _nbytes(result):
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, tuple):
+        return sum(_nbytes(item) for item in result)
+    return 0
+
+
+# Result cache shared by the main window's operators
+result_cache = ResultCache()
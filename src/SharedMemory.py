@@ -0,0 +1,318 @@
+"""
+Shared-memory transport of images between processes.
+
+Sending an ndarray to a process pool pickles it, copies it through a
+pipe and unpickles it on the other side, and the result travels back the
+same way. For cheap operators such as a global threshold this costs more
+than the operator. Here images live in multiprocessing.shared_memory
+blocks instead: a task carries only a small handle (block name, shape,
+dtype), the worker maps the block and works on a zero-copy view, and
+writes its result into an output block the parent has set aside.
+
+Blocks come from a SharedImagePool, which reference counts them and
+reuses released blocks for later images of similar size rather than
+creating and unlinking one per task.
+
+Example:
+
+    with SharedMemoryExecutor(workers=8) as executor:
+        futures = [executor.submit(global_threshold, image, 120) for image in images]
+        for future in futures:
+            with future.result() as result:
+                cv2.imwrite(..., result.array)
+"""
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+# Blocks a worker process keeps mapped between tasks, least recently used ones are unmapped first
+_WORKER_MAPPED_BLOCKS = 32
+
+
+class SharedImage:
+    """
+    An array stored in a shared memory block of a SharedImagePool.
+
+    The handle is a small picklable tuple that any process can turn back
+    into a view of the same memory with attach(). The parent holds one
+    reference per SharedImage; release it (or use the image as a context
+    manager) once the array is no longer needed, after which the block may
+    be reused for another image.
+    """
+
+    def __init__(self, pool, block, shape, dtype):
+        self.pool = pool
+        self.block = block
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.array = np.ndarray(self.shape, self.dtype, buffer=block.buf)
+
+    @property
+    def handle(self):
+        return self.block.name, self.shape, self.dtype.str
+
+    def retain(self):
+        """
+        Return a second SharedImage of the same block, holding its own reference, e.g. for a task.
+        """
+        self.pool.retain(self.block)
+        return SharedImage(self.pool, self.block, self.shape, self.dtype)
+
+    def release(self):
+        if self.array is not None:
+            self.array = None
+            self.pool.release(self.block)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+
+class SharedImagePool:
+    """
+    Creates, reference counts and reuses shared memory blocks for images.
+
+    A released block whose references drop to zero is kept for reuse by
+    a later image needing between half its size and its full size. Free
+    blocks beyond max_free_bytes are unlinked, oldest first.
+
+    Args:
+        max_free_bytes (int): Memory kept in free blocks for reuse. Default is 1 GiB.
+    """
+
+    def __init__(self, max_free_bytes=1024 * 1024 * 1024):
+        self.max_free_bytes = max_free_bytes
+        self.created = 0
+        self.reused = 0
+        self._blocks = {}
+        self._references = {}
+        # Free blocks by name, in release order
+        self._free = OrderedDict()
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+
+    def allocate(self, shape, dtype=np.uint8):
+        """
+        Return an uninitialized SharedImage of the given shape and dtype, holding one reference.
+        """
+        nbytes = max(1, int(np.prod(shape)) * np.dtype(dtype).itemsize)
+        return SharedImage(self, self.allocate_block(nbytes), shape, dtype)
+
+    def allocate_block(self, nbytes):
+        """
+        Return a block of at least nbytes, reused if a free one fits, holding one reference.
+        """
+        with self._lock:
+            fitting = [block for block in self._free.values() if nbytes <= block.size <= 2 * nbytes]
+            if fitting:
+                block = min(fitting, key=lambda candidate: candidate.size)
+                del self._free[block.name]
+                self._free_bytes -= block.size
+                self.reused += 1
+            else:
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+                self._blocks[block.name] = block
+                self.created += 1
+            self._references[block.name] = 1
+            return block
+
+    def share(self, array):
+        """
+        Copy an array into a new SharedImage.
+        """
+        array = np.asarray(array)
+        image = self.allocate(array.shape, array.dtype)
+        np.copyto(image.array, array)
+        return image
+
+    def retain(self, block):
+        with self._lock:
+            self._references[block.name] += 1
+
+    def release(self, block):
+        """
+        Drop one reference to a block, making it free for reuse when it was the last one.
+        """
+        with self._lock:
+            self._references[block.name] -= 1
+            if self._references[block.name] > 0:
+                return
+            del self._references[block.name]
+            self._free[block.name] = block
+            self._free_bytes += block.size
+            while self._free_bytes > self.max_free_bytes and self._free:
+                _, evicted = self._free.popitem(last=False)
+                self._free_bytes -= evicted.size
+                self._destroy(evicted)
+
+    def stats(self):
+        """
+        Block counts, bytes in use and free, and how often a free block was reused.
+        """
+        with self._lock:
+            total = sum(block.size for block in self._blocks.values())
+            return {"blocks": len(self._blocks), "in_use": len(self._references), "free": len(self._free),
+                    "bytes": total, "free_bytes": self._free_bytes, "created": self.created, "reused": self.reused}
+
+    def close(self):
+        """
+        Unlink every block. Arrays still viewing a block keep it mapped until they are collected.
+        """
+        with self._lock:
+            for block in list(self._blocks.values()):
+                self._destroy(block)
+            self._references.clear()
+            self._free.clear()
+            self._free_bytes = 0
+
+    def _destroy(self, block):
+        self._blocks.pop(block.name, None)
+        try:
+            block.close()
+        except BufferError:
+            # Still viewed by an array, the mapping goes away with the last view
+            pass
+        block.unlink()
+
+
+###################################################################################
+#               Worker side                                                       #
+###################################################################################
+
+# Blocks mapped by this worker process, by name
+_mapped_blocks = OrderedDict()
+
+
+def attach(handle):
+    """
+    Return a zero-copy view of the array a handle refers to, in any process.
+    """
+    name, shape, dtype = handle
+    return np.ndarray(shape, np.dtype(dtype), buffer=_map_block(name).buf)
+
+
+def _map_block(name):
+    block = _mapped_blocks.get(name)
+    if block is not None:
+        _mapped_blocks.move_to_end(name)
+        return block
+    # Attaching registers the name with the parent's resource tracker again, which is harmless:
+    # the tracker keeps a set of names, and the parent unregisters the block when it unlinks it
+    block = _mapped_blocks[name] = shared_memory.SharedMemory(name=name)
+    while len(_mapped_blocks) > _WORKER_MAPPED_BLOCKS:
+        _, unmapped = _mapped_blocks.popitem(last=False)
+        try:
+            unmapped.close()
+        except BufferError:
+            pass
+    return block
+
+
+def _run_task(function, input_handle, output_name, output_capacity, args, kwargs):
+    """
+    Run function on a shared input in a worker, writing the result into the output block if it fits.
+
+    Returns:
+        tuple: ("shared", shape, dtype) when the result was written to the
+        output block, or ("array", result) when it was larger than the block.
+    """
+    image = attach(input_handle)
+    # Operators must not modify their input, other tasks may be reading it
+    image.flags.writeable = False
+    result = np.asarray(function(image, *args, **kwargs))
+    if result.nbytes > output_capacity:
+        return "array", result
+    output = np.ndarray(result.shape, result.dtype, buffer=_map_block(output_name).buf)
+    np.copyto(output, result)
+    return "shared", result.shape, result.dtype.str
+
+
+###################################################################################
+#               Executor                                                          #
+###################################################################################
+
+class SharedMemoryExecutor:
+    """
+    Runs image operators on a process pool, passing images through shared memory.
+
+    Args:
+        workers (int, optional): Worker processes. Default is the number of CPUs.
+        pool (SharedImagePool, optional): Pool the input and output blocks come from.
+            Default is a pool owned, and closed, by the executor.
+    """
+
+    def __init__(self, workers=None, pool=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._owns_pool = pool is None
+        self.pool = pool or SharedImagePool()
+        self._executor = ProcessPoolExecutor(self.workers)
+
+    def submit(self, function, image, *args, output_nbytes=None, **kwargs):
+        """
+        Run function(image, *args, **kwargs) in a worker.
+
+        Args:
+            function (callable): A picklable function, e.g. one of src.Operators, returning an array.
+            image (numpy.ndarray or SharedImage): The input. An ndarray is copied into shared memory once,
+                a SharedImage is used as it is (and may be passed to several tasks).
+            output_nbytes (int, optional): Room set aside for the result. Default is the input's size,
+                enough for every operator that keeps the input shape. Larger results are pickled back.
+
+        Returns:
+            concurrent.futures.Future: Resolves to a SharedImage holding the result, which the caller releases.
+        """
+        shared_input = image.retain() if isinstance(image, SharedImage) else self.pool.share(image)
+        capacity = output_nbytes or max(1, shared_input.array.nbytes)
+        output_block = self.pool.allocate_block(capacity)
+        try:
+            task = self._executor.submit(_run_task, function, shared_input.handle, output_block.name,
+                                         capacity, args, kwargs)
+        except Exception:
+            shared_input.release()
+            self.pool.release(output_block)
+            raise
+
+        future = Future()
+
+        def finish(task):
+            shared_input.release()
+            try:
+                outcome = task.result()
+            except BaseException as e:
+                self.pool.release(output_block)
+                future.set_exception(e)
+                return
+            if outcome[0] == "shared":
+                future.set_result(SharedImage(self.pool, output_block, outcome[1], outcome[2]))
+            else:
+                self.pool.release(output_block)
+                future.set_result(self.pool.share(outcome[1]))
+
+        task.add_done_callback(finish)
+        return future
+
+    def map(self, function, images, *args, **kwargs):
+        """
+        Run function on every image, yielding the result SharedImages in order.
+        """
+        futures = [self.submit(function, image, *args, **kwargs) for image in images]
+        for future in futures:
+            yield future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        if self._owns_pool:
+            self.pool.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        return False
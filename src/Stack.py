@@ -0,0 +1,137 @@
+"""
+Helpers running the operators on stacks of images in a few large calls.
+
+A stack is a contiguous (N, H, W) or (N, H, W, C) array of equally sized
+images. Neighbourhood operators run on a mosaic: every image is padded by
+the operator's radius with the operator's own border mode and the padded
+images are laid out one above the other, so one OpenCV call filters the
+whole stack and each image only ever sees its own pixels and border.
+Point operators with per-image statistics (equalize, normalize) get one
+lookup table per image, built from that image's histogram.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# numpy padding mode matching each border mode name used by the filters
+_PAD_MODES = {
+    "constant": "constant",
+    "replicate": "edge",
+    "reflect": "symmetric",
+    "reflect101": "reflect",
+    "wrap": "wrap",
+}
+
+# Upper bound on the pixels indexed at once by stack_histograms and apply_tables
+_TABLE_CHUNK_PIXELS = 1 << 24
+
+
+def as_stack(images):
+    """
+    Return images as a C-contiguous (N, H, W) or (N, H, W, C) array.
+
+    Raises:
+        ValueError: If images does not have 3 or 4 dimensions.
+    """
+    stack = np.ascontiguousarray(images)
+    if stack.ndim not in (3, 4):
+        raise ValueError(f"Expected an (N, H, W) or (N, H, W, C) stack, got shape {stack.shape}")
+    return stack
+
+
+def apply_padded(stack, function, radius, border_mode="reflect101"):
+    """
+    Run a neighbourhood operator over every image of a stack in one call.
+
+    Args:
+        stack (numpy.ndarray): (N, H, W) or (N, H, W, C) stack.
+        function (callable): Maps a 2D or 3D image to a result of the same rows and columns.
+        radius (int): Farthest neighbour the operator reads, in pixels.
+        border_mode (str): Border the operator applies to a single image, a key of _PAD_MODES.
+
+    Returns:
+        numpy.ndarray: The stack of results, each identical to function applied to that image alone.
+    """
+    count, rows, cols = stack.shape[:3]
+    channels = stack.shape[3:]
+    if radius:
+        padding = ((0, 0), (radius, radius), (radius, radius)) + ((0, 0),) * len(channels)
+        stack = np.pad(stack, padding, mode=_PAD_MODES[border_mode])
+    padded_rows, padded_cols = rows + 2 * radius, cols + 2 * radius
+    mosaic = function(stack.reshape((count * padded_rows, padded_cols) + channels))
+    result = mosaic.reshape((count, padded_rows, padded_cols) + mosaic.shape[2:])
+    return np.ascontiguousarray(result[:, radius:radius + rows, radius:radius + cols])
+
+
+def as_mosaic(stack):
+    """
+    View a stack as one tall image, the images one above the other.
+    """
+    return stack.reshape((stack.shape[0] * stack.shape[1],) + stack.shape[2:])
+
+
+def map_images(function, stack, threads=None):
+    """
+    Apply function to every image of a stack on a thread pool and stack the results.
+
+    Used for operators without a mosaic form. OpenCV and numpy release the
+    GIL in their kernels, so the images are processed in parallel.
+    """
+    threads = threads or os.cpu_count() or 1
+    if threads == 1 or len(stack) == 1:
+        return np.stack([function(image) for image in stack])
+    with ThreadPoolExecutor(threads) as executor:
+        return np.stack(list(executor.map(function, stack)))
+
+
+def per_image(values, stack):
+    """
+    Reshape one value per image so it broadcasts against the stack.
+    """
+    return np.asarray(values).reshape((len(stack),) + (1,) * (stack.ndim - 1))
+
+
+def stack_histograms(stack):
+    """
+    Exact 256-bin histogram of every uint8 image of a stack, pooling its channels.
+
+    Every pixel is offset by 256 times its image's index, so one bincount
+    counts the whole stack.
+
+    Returns:
+        numpy.ndarray: (N, 256) int64 counts.
+    """
+    histograms = np.zeros((len(stack), 256), np.int64)
+    for start, stop in _table_chunks(stack):
+        offsets = per_image(np.arange(stop - start, dtype=np.int32) * 256, stack[start:stop])
+        counts = np.bincount((offsets + stack[start:stop]).ravel(), minlength=(stop - start) * 256)
+        histograms[start:stop] = counts.reshape(-1, 256)
+    return histograms
+
+
+def apply_tables(tables, stack, out=None):
+    """
+    Map every uint8 image of a stack through its own 256-entry lookup table.
+
+    The tables are read as one flat table, each image offset to its own
+    256 entries, so the whole stack is looked up in one gather.
+
+    Args:
+        tables (numpy.ndarray): (N, 256) uint8 tables, one per image.
+        stack (numpy.ndarray): uint8 stack.
+        out (numpy.ndarray, optional): uint8 stack receiving the result, may be stack itself.
+    """
+    out = np.empty_like(stack) if out is None else out
+    flat_tables = np.ascontiguousarray(tables, dtype=np.uint8).ravel()
+    for start, stop in _table_chunks(stack):
+        offsets = per_image(np.arange(start, stop, dtype=np.int32) * 256, stack[start:stop])
+        np.take(flat_tables, offsets + stack[start:stop], out=out[start:stop])
+    return out
+
+
+def _table_chunks(stack):
+    """
+    (start, stop) ranges of images holding about _TABLE_CHUNK_PIXELS values each, bounding the index arrays.
+    """
+    step = max(1, _TABLE_CHUNK_PIXELS // max(1, stack[0].size)) if len(stack) else 1
+    return [(start, min(start + step, len(stack))) for start in range(0, len(stack), step)]
@@ -0,0 +1,492 @@
+"""
+Streaming execution of an operator chain over a video or an image sequence.
+
+Frames are read on one thread into a ring of preallocated frame buffers,
+processed on a second thread and handed, through a second ring, to the
+calling thread, which writes or displays them. No frame-sized array is
+allocated per frame outside the operators themselves. When processing
+falls behind, the reader either waits for a free buffer ("block", the
+default for files, which then stream as fast as they are processed) or
+overwrites the oldest frame still waiting ("drop", for live sources,
+which keeps the latency bounded).
+
+Example:
+
+    python -m src.Streaming clip.mp4 -c "gaussian_noise:20 | median:3 | sobel" -o edges.mp4
+    python -m src.Streaming "frames/*.png" -c "median:5 | canny" -o edges --policy drop --realtime
+    python -m src.Streaming "frames/frame_%04d.png" -c "equalize" --show
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+from src.Graph import Graph
+from src.ImageStore import IMAGE_EXTENSIONS
+from src.Operators import OperatorChain, as_uint8
+from src.Profiler import Profiler
+
+RING_POLICIES = ("block", "drop")
+
+# Output extensions written with cv2.VideoWriter, mapped to their codec
+VIDEO_CODECS = {".mp4": "mp4v", ".avi": "MJPG", ".mkv": "mp4v", ".mov": "mp4v"}
+
+
+class FrameRing:
+    """
+    A bounded ring of preallocated frames passed from one producer thread to one consumer thread.
+
+    The producer acquires a free slot, fills frames[slot] and publishes it;
+    the consumer takes the oldest published slot and releases it once done.
+
+    Args:
+        slots (int): Number of frame buffers, at least 2.
+        shape (tuple): Shape of one frame.
+        dtype: Pixel type. Default is uint8.
+        policy (str): "block" makes acquire wait for a free slot, "drop"
+            reuses the slot of the oldest frame not taken yet instead.
+    """
+
+    def __init__(self, slots, shape, dtype=np.uint8, policy="block"):
+        if policy not in RING_POLICIES:
+            raise ValueError(f"Unknown ring policy '{policy}', expected one of: {', '.join(RING_POLICIES)}")
+        if slots < 2:
+            raise ValueError(f"A frame ring needs at least 2 slots, got {slots}")
+        self.frames = np.empty((slots,) + tuple(shape), dtype=dtype)
+        self.policy = policy
+        self.dropped = 0
+        self._free = deque(range(slots))
+        self._ready = deque()
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """
+        Return the index of a slot to fill, or None once the ring is closed.
+        """
+        with self._condition:
+            while not self._free and not self._closed:
+                if self.policy == "drop" and self._ready:
+                    self.dropped += 1
+                    return self._ready.popleft()[0]
+                self._condition.wait()
+            return None if self._closed else self._free.popleft()
+
+    def publish(self, index, info=None):
+        """
+        Hand a filled slot to the consumer, with info (e.g. frame number and timestamp) attached.
+        """
+        with self._condition:
+            self._ready.append((index, info))
+            self._condition.notify_all()
+
+    def take(self):
+        """
+        Wait for the oldest published slot.
+
+        Returns:
+            tuple: (index, info), or None once the ring is closed and every published slot was taken.
+        """
+        with self._condition:
+            while not self._ready and not self._closed:
+                self._condition.wait()
+            return self._ready.popleft() if self._ready else None
+
+    def release(self, index):
+        """
+        Give a taken slot back to the producer.
+        """
+        with self._condition:
+            self._free.append(index)
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Stop the ring: acquire returns None, take returns what is left and then None.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+###################################################################################
+#               Frame sources and sinks                                           #
+###################################################################################
+
+class VideoSource:
+    """
+    Frames of a video file, a printf-style image sequence ("frame_%04d.png") or a camera index.
+    """
+
+    def __init__(self, spec, grey_flag=True):
+        self.capture = cv2.VideoCapture(int(spec) if str(spec).isdigit() else spec)
+        if not self.capture.isOpened():
+            raise FileNotFoundError(f"Failed to open video: {spec}")
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or None
+        self.grey_flag = grey_flag
+        ok, self._decoded = self.capture.read()
+        if not ok:
+            raise ValueError(f"No frames in video: {spec}")
+        self._pending_first = True
+        self.shape = self._decoded.shape[:2] if grey_flag else self._decoded.shape
+
+    def read(self, out):
+        """
+        Decode the next frame into out. Returns False at the end of the stream.
+        """
+        if self._pending_first:
+            self._pending_first = False
+        else:
+            # Color frames decode straight into out, grayscale ones through a reused BGR buffer
+            ok, decoded = self.capture.read(self._decoded if self.grey_flag else out)
+            if not ok:
+                return False
+            self._decoded = decoded
+        if self.grey_flag:
+            cv2.cvtColor(self._decoded, cv2.COLOR_BGR2GRAY, dst=out)
+        elif self._decoded is not out:
+            np.copyto(out, self._decoded)
+        return True
+
+    def close(self):
+        self.capture.release()
+
+
+class SequenceSource:
+    """
+    Frames read from a list of image files, in order.
+    """
+
+    def __init__(self, paths, grey_flag=True, fps=None):
+        if not paths:
+            raise ValueError("The image sequence is empty")
+        self.paths = list(paths)
+        self.fps = fps
+        self.flag = cv2.IMREAD_GRAYSCALE if grey_flag else cv2.IMREAD_COLOR
+        self._position = 0
+        self.shape = self._load(self.paths[0]).shape
+
+    def read(self, out):
+        if self._position >= len(self.paths):
+            return False
+        image = self._load(self.paths[self._position])
+        if image.shape != out.shape:
+            raise ValueError(f"Frame {self.paths[self._position]} is {image.shape}, the sequence is {out.shape}")
+        np.copyto(out, image)
+        self._position += 1
+        return True
+
+    def close(self):
+        pass
+
+    def _load(self, path):
+        image = cv2.imread(path, self.flag)
+        if image is None:
+            raise FileNotFoundError(f"Failed to load image: {path}")
+        return image
+
+
+def open_source(spec, grey_flag=True, fps=None):
+    """
+    Open a directory or glob of images as a SequenceSource, anything else as a VideoSource.
+
+    Args:
+        spec (str): Video file, camera index, printf-style pattern, directory or glob pattern.
+        grey_flag (bool): Deliver grayscale frames when True, BGR otherwise.
+        fps (float, optional): Frame rate of an image sequence, used to pace realtime reading.
+    """
+    if os.path.isdir(spec):
+        paths = sorted(os.path.join(spec, name) for name in os.listdir(spec)
+                       if name.lower().endswith(IMAGE_EXTENSIONS))
+        return SequenceSource(paths, grey_flag, fps)
+    if glob.has_magic(spec):
+        return SequenceSource(sorted(glob.glob(spec)), grey_flag, fps)
+    source = VideoSource(spec, grey_flag)
+    source.fps = fps or source.fps
+    return source
+
+
+class FrameWriter:
+    """
+    Writes frames to a video file, chosen by extension (see VIDEO_CODECS), or as numbered PNGs into a directory.
+
+    Args:
+        path (str): The video file or directory. Missing parent directories are created.
+        fps (float, optional): Frame rate of a video. Default is 25.
+        frame_shape (tuple, optional): Expected frame shape. When given, a video writer is
+            opened right away, so an unwritable output fails before any frame is processed.
+
+    Raises:
+        OSError: If the video writer cannot be opened.
+    """
+
+    def __init__(self, path, fps=None, frame_shape=None):
+        self.path = path
+        self.fps = fps or 25
+        self.writer = None
+        self.count = 0
+        self.extension = os.path.splitext(path)[1].lower()
+        if self.extension in VIDEO_CODECS:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            if frame_shape is not None:
+                self._open(frame_shape)
+        else:
+            os.makedirs(path, exist_ok=True)
+
+    def write(self, frame):
+        if self.extension in VIDEO_CODECS:
+            if self.writer is None or self._shape != (frame.shape[:2], frame.ndim == 3):
+                self._open(frame.shape)
+            self.writer.write(frame)
+        else:
+            output_path = os.path.join(self.path, f"frame_{self.count:06d}.png")
+            if not cv2.imwrite(output_path, frame):
+                raise OSError(f"Failed to write image: {output_path}")
+        self.count += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+    def _open(self, frame_shape):
+        """
+        (Re)open the video writer for frames of frame_shape, nothing having been written yet.
+        """
+        if self.writer is not None:
+            self.writer.release()
+        fourcc = cv2.VideoWriter_fourcc(*VIDEO_CODECS[self.extension])
+        self.writer = cv2.VideoWriter(self.path, fourcc, self.fps, (frame_shape[1], frame_shape[0]),
+                                      len(frame_shape) == 3)
+        if not self.writer.isOpened():
+            raise OSError(f"Failed to open video writer: {self.path}")
+        self._shape = (tuple(frame_shape[:2]), len(frame_shape) == 3)
+
+
+###################################################################################
+#               Pipeline                                                          #
+###################################################################################
+
+class StreamPipeline:
+    """
+    Runs an operator chain over every frame of a source, reading and processing on background threads.
+
+    Args:
+        source: A VideoSource or SequenceSource.
+        chain (str or OperatorChain): The operators to apply, e.g. "median:5 | sobel".
+        buffer_frames (int): Frames buffered between the reader and the processor,
+            and between the processor and the caller.
+        policy (str): What the reader does when the input buffer is full, "block" or "drop".
+        realtime (bool): Read frames no faster than the source's frame rate, as a live source delivers them.
+    """
+
+    def __init__(self, source, chain, buffer_frames=4, policy="block", realtime=False):
+        if policy not in RING_POLICIES:
+            raise ValueError(f"Unknown ring policy '{policy}', expected one of: {', '.join(RING_POLICIES)}")
+        self.source = source
+        self.chain = OperatorChain.parse(chain) if isinstance(chain, str) else chain
+        # Point operator runs are fused and their buffers reused from frame to frame
+        self.graph = Graph.from_chain(self.chain)
+        self.buffer_frames = buffer_frames
+        self.policy = policy
+        self.realtime = realtime
+        # Per-stage latencies of this run only, kept apart from the application profiler
+        self.timings = Profiler()
+        self.timings.enable()
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_delivered = 0
+        self.elapsed = 0.0
+        self._input = None
+        self._output = None
+        self._output_ready = threading.Event()
+        self._error = None
+
+    @property
+    def dropped(self):
+        return self._input.dropped if self._input is not None else 0
+
+    def run(self, on_frame, max_frames=None):
+        """
+        Stream the source through the chain, calling on_frame(frame_number, result) on this thread.
+
+        result is a uint8 buffer reused for later frames, so on_frame must
+        copy it to keep it. on_frame can return False to stop the stream.
+
+        Returns:
+            dict: The summary, see summary().
+        """
+        self._input = FrameRing(self.buffer_frames, self.source.shape, np.uint8, self.policy)
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._guarded, args=(self._read, max_frames), name="stream-reader"),
+                   threading.Thread(target=self._guarded, args=(self._process,), name="stream-processor")]
+        for thread in threads:
+            thread.start()
+        try:
+            self._output_ready.wait()
+            while self._output is not None:
+                taken = self._output.take()
+                if taken is None:
+                    break
+                index, (frame_number, captured) = taken
+                span_start = time.perf_counter()
+                keep_going = on_frame(frame_number, self._output.frames[index])
+                done = time.perf_counter()
+                self._output.release(index)
+                self.timings.record("deliver", "stage", span_start, done - span_start)
+                self.timings.record("end to end", "latency", captured, done - captured)
+                self.frames_delivered += 1
+                if keep_going is False:
+                    break
+        finally:
+            self._stop()
+            for thread in threads:
+                thread.join()
+            self.elapsed = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+        return self.summary()
+
+    def summary(self):
+        """
+        Frame counts, sustained frames per second and per-stage latency in seconds.
+        """
+        stages = {row["name"]: {"count": row["count"], "mean": row["mean"], "max": row["max"],
+                                "total": row["total"]}
+                  for row in self.timings.stats()}
+        return {"chain": str(self.chain), "frames_read": self.frames_read,
+                "frames_processed": self.frames_processed, "frames_delivered": self.frames_delivered,
+                "frames_dropped": self.dropped, "elapsed": self.elapsed,
+                "fps": self.frames_delivered / self.elapsed if self.elapsed else 0.0,
+                "source_fps": self.source.fps, "stages": stages}
+
+    def _guarded(self, target, *args):
+        try:
+            target(*args)
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+            self._stop()
+
+    def _stop(self):
+        for ring in (self._input, self._output):
+            if ring is not None:
+                ring.close()
+        self._output_ready.set()
+
+    def _read(self, max_frames):
+        frame_interval = 1 / self.source.fps if self.realtime and self.source.fps else None
+        start = time.perf_counter()
+        try:
+            while max_frames is None or self.frames_read < max_frames:
+                if frame_interval is not None:
+                    # A live source delivers frame n at n / fps whether or not the pipeline keeps up
+                    time.sleep(max(0.0, start + self.frames_read * frame_interval - time.perf_counter()))
+                index = self._input.acquire()
+                if index is None:
+                    return
+                span_start = time.perf_counter()
+                if not self.source.read(self._input.frames[index]):
+                    return
+                self.timings.record("read", "stage", span_start, time.perf_counter() - span_start)
+                self._input.publish(index, (self.frames_read, span_start))
+                self.frames_read += 1
+        finally:
+            # Frames already buffered are still processed
+            self._input.close()
+
+    def _process(self):
+        try:
+            while True:
+                taken = self._input.take()
+                if taken is None:
+                    return
+                index, info = taken
+                span_start = time.perf_counter()
+                timings = []
+                self.graph.set_source(self._input.frames[index])
+                result = as_uint8(self.graph.compute(timings=timings))
+                for label, seconds in timings:
+                    self.timings.record(label, "operator", span_start, seconds)
+
+                if self._output is None:
+                    self._output = FrameRing(self.buffer_frames, result.shape, np.uint8)
+                    self._output_ready.set()
+                out_index = self._output.acquire()
+                if out_index is None:
+                    return
+                np.copyto(self._output.frames[out_index], result)
+                self._input.release(index)
+                self.timings.record("process", "stage", span_start, time.perf_counter() - span_start)
+                self._output.publish(out_index, info)
+                self.frames_processed += 1
+        finally:
+            if self._output is not None:
+                self._output.close()
+            self._output_ready.set()
+
+
+def print_summary(summary):
+    print(f"{summary['frames_delivered']} frames in {summary['elapsed']:.2f} s ({summary['fps']:.1f} fps), "
+          f"{summary['frames_read']} read, {summary['frames_dropped']} dropped")
+    print(f"{'stage':<32}{'mean (ms)':>12}{'max (ms)':>12}")
+    for name, stage in summary["stages"].items():
+        print(f"{name:<32}{stage['mean'] * 1000:>12.2f}{stage['max'] * 1000:>12.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Video file, camera index, image directory, glob or printf-style pattern")
+    parser.add_argument("-c", "--chain", required=True, help='Operator chain, e.g. "median:5 | sobel"')
+    parser.add_argument("-o", "--output", help="Output video file (.mp4, .avi, .mkv, .mov) or directory of PNGs")
+    parser.add_argument("--show", action="store_true", help="Display the processed frames, press q to stop")
+    parser.add_argument("--buffer", type=int, default=4, help="Frames buffered between stages (default: 4)")
+    parser.add_argument("--policy", choices=RING_POLICIES, default="block",
+                        help="When processing falls behind, block the reader or drop the oldest frame")
+    parser.add_argument("--realtime", action="store_true", help="Read at the source's frame rate, like a camera")
+    parser.add_argument("--fps", type=float, help="Frame rate of an image sequence (default: 25)")
+    parser.add_argument("--max-frames", type=int, help="Stop after this many frames")
+    parser.add_argument("--color", action="store_true", help="Process color frames instead of grayscale")
+    parser.add_argument("--report", help="Write the summary to this JSON file")
+    args = parser.parse_args(argv)
+
+    try:
+        source = open_source(args.input, grey_flag=not args.color, fps=args.fps)
+        pipeline = StreamPipeline(source, args.chain, args.buffer, args.policy, args.realtime)
+        pipeline.chain.check_channels(source.shape[2] if len(source.shape) == 3 else 1)
+        writer = FrameWriter(args.output, source.fps, source.shape) if args.output else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    def on_frame(frame_number, frame):
+        if writer is not None:
+            writer.write(frame)
+        if args.show:
+            cv2.imshow("Stream", frame)
+            return (cv2.waitKey(1) & 0xFF) != ord("q")
+        return True
+
+    try:
+        summary = pipeline.run(on_frame, args.max_frames)
+    finally:
+        source.close()
+        if writer is not None:
+            writer.close()
+        if args.show:
+            cv2.destroyAllWindows()
+
+    print_summary(summary)
+    if args.report:
+        with open(args.report, "w") as report_file:
+            json.dump(summary, report_file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
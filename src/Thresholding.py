@@ -1,29 +1,154 @@
 import numpy as np
 import cv2
+from src.PointOps import threshold_lut, to_uint8
+from src.Precision import get_precision
+from src.Stack import as_mosaic, as_stack
+
+# Default k per local thresholding method
+_LOCAL_THRESHOLD_K = {"mean": 0.0, "niblack": -0.2, "sauvola": 0.5}
+
+# Pixels per band of float64 window sums in local_mean_std
+_STATISTICS_BAND_PIXELS = 1 << 18
 
 
 class thresholding:
-    def __init__(self, original_img):
-        self.gray = cv2.convertScaleAbs(original_img)
+    def __init__(self, original_img, batch=False, precision=None):
+        """
+        Args:
+            original_img (numpy.ndarray): The image, or a (N, H, W) stack of images when batch is True.
+            batch (bool): Threshold every image of a stack separately.
+            precision (Precision or str, optional): Float type of the local window statistics.
+                Default is the current policy.
+        """
+        self.precision = get_precision(precision)
+        # uint8 input is used as it is, other dtypes are converted
+        self.gray = to_uint8(as_stack(original_img) if batch else original_img)
+        self.batch = batch
         self.threshold = 120
         self.block_size = 11
 
     def global_thresholding(self):
-        return np.where(self.gray > self.threshold, 255, 0).astype(np.uint8)
+        return threshold_lut(self.threshold).apply(self.gray)
+
+    def local_thresholding(self, method="mean", window_size=None, k=None, dynamic_range=128):
+        """
+        Threshold every pixel against statistics of the window centered on it.
+
+        Windows are clipped at the image border, so border pixels are
+        thresholded against the pixels that exist around them. The channels
+        of a colour image are thresholded separately.
+
+        Args:
+            method (str): "mean" (T = m + k), "niblack" (T = m + k * s) or
+                "sauvola" (T = m * (1 + k * (s / dynamic_range - 1))), where
+                m and s are the window mean and standard deviation.
+            window_size (int, optional): Odd window size. Default is self.block_size.
+            k (float, optional): Method parameter. Defaults are 0 for mean,
+                -0.2 for Niblack and 0.5 for Sauvola.
+            dynamic_range (float): Sauvola's R, the dynamic range of the standard deviation. Default is 128.
+
+        Returns:
+            numpy.ndarray: Binary uint8 image with foreground set to 255.
+        """
+        if method not in _LOCAL_THRESHOLD_K:
+            raise ValueError(f"Unknown local thresholding method: {method}")
+        window_size = window_size or self.block_size
+        k = _LOCAL_THRESHOLD_K[method] if k is None else k
+
+        def threshold(image, image_rows=None):
+            mean, std = local_mean_std(image, window_size, with_std=method != "mean", precision=self.precision,
+                                       image_rows=image_rows)
+            if method == "mean":
+                threshold_values = mean + k
+            elif method == "niblack":
+                threshold_values = mean + k * std
+            else:
+                threshold_values = mean * (1 + k * (std / dynamic_range - 1))
+
+            return np.where(image > threshold_values, np.uint8(255), np.uint8(0))
+
+        if not self.batch:
+            return threshold(self.gray)
+        # One pass over the mosaic, with every window clipped at the border of its own image
+        return threshold(as_mosaic(self.gray), image_rows=self.gray.shape[1]).reshape(self.gray.shape)
+
+
+def local_mean_std(image, window_size, with_std=True, precision=None, image_rows=None):
+    """
+    Per-pixel mean and standard deviation over a sliding square window, in O(1) per pixel.
+
+    The sums over each window are read from summed-area tables (integral
+    images) with four lookups, whatever the window size. Windows are
+    clipped at the image border and averaged over the pixels they cover.
+    The tables and window sums are float64, exact for any image size, and
+    are computed a band of rows at a time; the statistics are stored in the
+    precision's float type.
+
+    Args:
+        image (numpy.ndarray): 2D image, or 3D image whose channels get separate statistics.
+        window_size (int): Odd window size.
+        with_std (bool): Also compute the standard deviation. Default is True.
+        precision (Precision or str, optional): Float type of the results. Default is the current policy.
+        image_rows (int, optional): Height of each image when image is a mosaic of equally
+            tall images laid out one above the other, windows are then clipped at the border
+            of every image. Default is the whole image.
+
+    Returns:
+        tuple: (mean, std) arrays of the image's shape, std is None when with_std is False.
+
+    Raises:
+        ValueError: If window_size is not a positive odd number.
+    """
+    if window_size < 1 or window_size % 2 == 0:
+        raise ValueError(f"Window size must be a positive odd number, got {window_size}")
+    dtype = get_precision(precision).float
+    rows, cols = image.shape[:2]
+    radius = window_size // 2
+    if with_std:
+        integral, squared_integral = cv2.integral2(image, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+    else:
+        integral, squared_integral = cv2.integral(image, sdepth=cv2.CV_64F), None
+    if image.ndim == 3:
+        # OpenCV drops the channel axis of single-channel tables, keep one per channel
+        integral = integral.reshape(rows + 1, cols + 1, -1)
+        if with_std:
+            squared_integral = squared_integral.reshape(rows + 1, cols + 1, -1)
 
-    def local_thresholding(self):
-        # Create meshgrids for block indices with adjusted step size
-        rows, cols = np.meshgrid(np.arange(0, self.gray.shape[0] - self.block_size + 1, self.block_size),
-                                 np.arange(0, self.gray.shape[1] - self.block_size + 1, self.block_size),
-                                 indexing='ij')
+    # First and one-past-last row/column of every pixel's clipped window
+    image_rows = image_rows or rows
+    local_row = np.arange(rows) % image_rows
+    first_row = np.arange(rows) - local_row
+    row_start = first_row + np.clip(local_row - radius, 0, image_rows)
+    row_end = first_row + np.clip(local_row + radius + 1, 0, image_rows)
+    col_start = np.clip(np.arange(cols) - radius, 0, cols)
+    col_end = np.clip(np.arange(cols) + radius + 1, 0, cols)
+    col_count = col_end - col_start
 
-        # Extract blocks and compute local thresholds
-        blocks = np.array([self.gray[r:r + self.block_size, c:c + self.block_size] for r, c in zip(rows.flatten(), cols.flatten())])
-        threshold_values = np.mean(blocks, axis=(1, 2))
+    mean = np.empty(image.shape, dtype=dtype)
+    std = np.empty(image.shape, dtype=dtype) if with_std else None
+    # float64 intermediates only ever exist for one band of rows
+    rows_per_band = max(1, _STATISTICS_BAND_PIXELS // max(1, cols))
+    for top in range(0, rows, rows_per_band):
+        band = slice(top, top + rows_per_band)
+        band_start, band_end = row_start[band], row_end[band]
+        count = np.outer(band_end - band_start, col_count)
+        if image.ndim == 3:
+            count = count[..., None]
 
-        # Apply local thresholding using vectorized operations
-        local_threshold = np.zeros_like(self.gray)
-        for (r, c), block, threshold_value in zip(zip(rows.flatten(), cols.flatten()), blocks, threshold_values):
-            local_threshold[r:r + self.block_size, c:c + self.block_size] = np.where(block > threshold_value, 255, 0)
+        def window_sums(table):
+            sums = table[np.ix_(band_end, col_end)]
+            sums -= table[np.ix_(band_start, col_end)]
+            sums -= table[np.ix_(band_end, col_start)]
+            sums += table[np.ix_(band_start, col_start)]
+            return sums
 
-        return local_threshold.astype(np.uint8)
+        band_mean = window_sums(integral)
+        band_mean /= count
+        mean[band] = band_mean
+        if with_std:
+            variance = window_sums(squared_integral)
+            variance /= count
+            variance -= band_mean ** 2
+            np.maximum(variance, 0, out=variance)
+            std[band] = np.sqrt(variance, out=variance)
+    return mean, std
@@ -0,0 +1,344 @@
+"""
+Out-of-core, tile by tile execution of the neighbourhood operators.
+
+Images too large for memory are read from memory-mapped .npy or raw files,
+processed in overlapping tiles and written back tile by tile. Each tile is
+read with a halo as wide as the operator's kernel radius, so every output
+pixel sees exactly the neighbourhood it would see in the whole image and
+the stitched result is identical to running the operator on the full image.
+The same halos let BandExecutor split an image into horizontal bands and
+process them on a thread pool.
+
+Example:
+
+    python -m src.Tiling scan.npy filtered.npy --op median:5 --tile 4096
+    python -m src.Tiling scan.raw filtered.npy --op gaussian:5 --shape 60000 80000 --dtype uint8
+    python -m src.Tiling scan.npy filtered.npy --op median:5 --tile 1024 --threads 32
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.Edge_Detector import EdgeDetector, stretch_to_uint8
+from src.Operators import OPERATORS, OperatorChain
+
+
+class TileOperator:
+    """
+    Describes how an operator from src.Operators can be run on tiles.
+
+    Args:
+        name (str): Key of the operator in OPERATORS.
+        halo (callable): Maps the operator's arguments to the number of
+            context pixels each tile needs on every side.
+        alignment (callable, optional): Maps the operator's arguments to a
+            size tile origins must be multiples of, for block based operators.
+            Default is no alignment.
+        reduce (callable, optional): For operators that rescale by a global
+            statistic. Maps a tile's raw values to a partial statistic; the
+            partials are combined with combine.
+        combine (callable, optional): Combines two partial statistics.
+        finalize (callable, optional): Maps a tile's raw values and the
+            global statistic to the final output tile.
+    """
+
+    def __init__(self, name, halo, alignment=None, reduce=None, combine=None, finalize=None, function=None):
+        self.name = name
+        self.function = function or OPERATORS[name]
+        self.halo = halo
+        self.alignment = alignment or (lambda *args: 1)
+        self.reduce = reduce
+        self.combine = combine
+        self.finalize = finalize
+
+
+def _sobel_finalize(gradient_magnitude, global_max):
+    return stretch_to_uint8(gradient_magnitude, global_max)
+
+
+TILE_OPERATORS = {
+    "median": TileOperator("median", halo=lambda kernel_size=3: kernel_size // 2),
+    "average": TileOperator("average", halo=lambda kernel_size=3: kernel_size // 2),
+    "gaussian": TileOperator("gaussian", halo=lambda kernel_size=3, *args: kernel_size // 2),
+    "roberts": TileOperator("roberts", halo=lambda: 1),
+    "prewitt": TileOperator("prewitt", halo=lambda: 1),
+    # Sobel stretches by the global maximum, so it takes a reduction pass before writing
+    "sobel": TileOperator("sobel", halo=lambda: 1,
+                          function=lambda tile: EdgeDetector(tile).sobel_magnitude(),
+                          reduce=np.max, combine=max, finalize=_sobel_finalize),
+    "local_threshold": TileOperator("local_threshold", halo=lambda window_size=11, *args: window_size // 2),
+}
+
+
+###################################################################################
+#               Memory-mapped inputs and outputs                                  #
+###################################################################################
+
+def open_image_array(path, shape=None, dtype=np.uint8):
+    """
+    Memory-map an image stored as .npy, or as headerless raw pixels when shape is given.
+
+    Args:
+        path (str): Path of the .npy or raw file.
+        shape (tuple, optional): Image shape, required for raw files.
+        dtype: Pixel type of raw files. Default is uint8.
+
+    Returns:
+        numpy.memmap: Read-only view of the image.
+    """
+    if path.lower().endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    if shape is None:
+        raise ValueError(f"The shape of raw image {path} must be given")
+    return np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+
+
+def create_image_array(path, shape, dtype):
+    """
+    Create a writable memory-mapped .npy or raw file for a result image.
+    """
+    if path.lower().endswith(".npy"):
+        return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=tuple(shape))
+    return np.memmap(path, dtype=dtype, mode="w+", shape=tuple(shape))
+
+
+###################################################################################
+#               Tile executor                                                     #
+###################################################################################
+
+class TileExecutor:
+    """
+    Runs a tileable operator over an image one overlapping tile at a time.
+
+    Only one tile plus its halo is held in memory at once (besides what the
+    operating system pages in for the memory maps).
+    """
+
+    def __init__(self, tile_size=2048):
+        self.tile_size = tile_size
+        self.tile_count = 0
+        self.elapsed = 0.0
+
+    def run(self, name, source, args=(), output=None, output_path=None):
+        """
+        Apply operator name to source tile by tile.
+
+        Args:
+            name (str): Key of the operator in TILE_OPERATORS.
+            source (numpy.ndarray): Input image, usually a numpy.memmap.
+            args (tuple): Positional operator arguments, as in an operator chain stage.
+            output (numpy.ndarray, optional): Preallocated result array.
+            output_path (str, optional): Create the result as a memory-mapped
+                file at this path. Ignored when output is given. When neither
+                is given the result is an in-memory array.
+
+        Returns:
+            numpy.ndarray: The stitched result.
+        """
+        if name not in TILE_OPERATORS:
+            raise ValueError(f"Operator '{name}' cannot run on tiles, expected one of: {', '.join(TILE_OPERATORS)}")
+        operator = TILE_OPERATORS[name]
+        halo = operator.halo(*args)
+        start = time.perf_counter()
+
+        statistic = None
+        if operator.reduce is not None:
+            for _, raw in self._tiles(operator, source, args, halo):
+                partial = operator.reduce(raw)
+                statistic = partial if statistic is None else operator.combine(statistic, partial)
+
+        for (top, bottom, left, right), result in self._tiles(operator, source, args, halo):
+            if operator.finalize is not None:
+                result = operator.finalize(result, statistic)
+            if output is None:
+                result_shape = source.shape[:2] + result.shape[2:]
+                if output_path is not None:
+                    output = create_image_array(output_path, result_shape, result.dtype)
+                else:
+                    output = np.empty(result_shape, dtype=result.dtype)
+            output[top:bottom, left:right] = result
+            self.tile_count += 1
+
+        if isinstance(output, np.memmap):
+            output.flush()
+        self.elapsed += time.perf_counter() - start
+        return output
+
+    def tile_boxes(self, shape, alignment=1):
+        """
+        Yield (top, bottom, left, right) of the output tiles covering an image of the given shape.
+        """
+        # Round the tile size to a multiple of the alignment so tiles start on block boundaries
+        step = max(alignment, self.tile_size // alignment * alignment)
+        rows, cols = shape[:2]
+        for top in range(0, rows, step):
+            for left in range(0, cols, step):
+                yield top, min(top + step, rows), left, min(left + step, cols)
+
+    def _tiles(self, operator, source, args, halo):
+        """
+        Yield each output tile box with the operator's result cropped to it.
+        """
+        rows, cols = source.shape[:2]
+        for top, bottom, left, right in self.tile_boxes(source.shape, operator.alignment(*args)):
+            # Clamp the halo at the image border, where the operator's own border handling applies
+            read_top, read_bottom = max(top - halo, 0), min(bottom + halo, rows)
+            read_left, read_right = max(left - halo, 0), min(right + halo, cols)
+            tile = np.ascontiguousarray(source[read_top:read_bottom, read_left:read_right])
+            result = operator.function(tile, *args)
+            yield (top, bottom, left, right), result[top - read_top:bottom - read_top,
+                                                     left - read_left:right - read_left]
+
+
+###################################################################################
+#               Band executor                                                     #
+###################################################################################
+
+class BandExecutor:
+    """
+    Runs a tileable operator over an image in horizontal bands on a thread pool.
+
+    Bands span the full width and are read with the operator's halo above
+    and below, as TileExecutor reads its tiles, so the result is identical
+    to a single-threaded run whatever the thread count. OpenCV and numpy
+    release the GIL inside their kernels, so the bands are processed in
+    parallel. Every band writes its rows of the output itself, and a
+    memory-mapped source is only read a band at a time per thread.
+
+    Args:
+        threads (int, optional): Worker threads. Default is the number of CPUs.
+        band_rows (int, optional): Rows per band. Default gives every thread about four bands,
+            so uneven bands balance out.
+    """
+
+    def __init__(self, threads=None, band_rows=None):
+        self.threads = threads or os.cpu_count() or 1
+        self.band_rows = band_rows
+        self.band_count = 0
+        self.elapsed = 0.0
+
+    def run(self, name, source, args=(), output=None, output_path=None):
+        """
+        Apply operator name to source band by band.
+
+        Args:
+            name (str): Key of the operator in TILE_OPERATORS.
+            source (numpy.ndarray): Input image, in memory or a numpy.memmap.
+            args (tuple): Positional operator arguments, as in an operator chain stage.
+            output (numpy.ndarray, optional): Preallocated result array.
+            output_path (str, optional): Create the result as a memory-mapped
+                file at this path. Ignored when output is given. When neither
+                is given the result is an in-memory array.
+
+        Returns:
+            numpy.ndarray: The stitched result.
+        """
+        if name not in TILE_OPERATORS:
+            raise ValueError(f"Operator '{name}' cannot run on tiles, expected one of: {', '.join(TILE_OPERATORS)}")
+        operator = TILE_OPERATORS[name]
+        halo = operator.halo(*args)
+        boxes = list(self.band_boxes(source.shape[0], operator.alignment(*args), halo))
+        start = time.perf_counter()
+
+        def compute(box):
+            top, bottom = box
+            read_top, read_bottom = max(top - halo, 0), min(bottom + halo, source.shape[0])
+            band = np.ascontiguousarray(source[read_top:read_bottom])
+            return operator.function(band, *args)[top - read_top:bottom - read_top]
+
+        with ThreadPoolExecutor(self.threads) as pool:
+            statistic = None
+            raw = None
+            if operator.reduce is not None:
+                if isinstance(source, np.memmap):
+                    # Out of core, the bands are computed again rather than all kept in memory
+                    partials = list(pool.map(lambda box: operator.reduce(compute(box)), boxes))
+                else:
+                    raw = list(pool.map(compute, boxes))
+                    partials = list(pool.map(operator.reduce, raw))
+                statistic = partials[0]
+                for partial in partials[1:]:
+                    statistic = operator.combine(statistic, partial)
+
+            def produce(index):
+                result = compute(boxes[index]) if raw is None else raw[index]
+                if raw is not None:
+                    raw[index] = None
+                return result if operator.finalize is None else operator.finalize(result, statistic)
+
+            def write(index):
+                top, bottom = boxes[index]
+                output[top:bottom] = produce(index)
+
+            # The first band gives the result's dtype and channels
+            first = produce(0)
+            if output is None:
+                result_shape = source.shape[:2] + first.shape[2:]
+                if output_path is not None:
+                    output = create_image_array(output_path, result_shape, first.dtype)
+                else:
+                    output = np.empty(result_shape, dtype=first.dtype)
+            output[boxes[0][0]:boxes[0][1]] = first
+            del first
+            list(pool.map(write, range(1, len(boxes))))
+
+        self.band_count += len(boxes)
+        if isinstance(output, np.memmap):
+            output.flush()
+        self.elapsed += time.perf_counter() - start
+        return output
+
+    def band_boxes(self, rows, alignment=1, halo=0):
+        """
+        Yield (top, bottom) of the output bands covering rows image rows.
+        """
+        band_rows = self.band_rows or -(-rows // (4 * self.threads))
+        # Bands much thinner than their halo would mostly recompute their neighbours' rows
+        band_rows = max(band_rows, 4 * halo, 16)
+        step = -(-band_rows // alignment) * alignment
+        for top in range(0, rows, step):
+            yield top, min(top + step, rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Input .npy file, or raw file with --shape")
+    parser.add_argument("output", help="Output .npy or raw file")
+    parser.add_argument("--op", required=True, help=f"Operator stage, one of: {', '.join(TILE_OPERATORS)}")
+    parser.add_argument("--tile", type=int, default=2048, help="Tile size in pixels (default: 2048)")
+    parser.add_argument("--shape", type=int, nargs="+", help="Shape of a raw input, e.g. HEIGHT WIDTH")
+    parser.add_argument("--dtype", default="uint8", help="Pixel type of a raw input (default: uint8)")
+    parser.add_argument("--threads", type=int,
+                        help="Process full-width bands of --tile rows on this many threads instead of tiles one by one")
+    args = parser.parse_args(argv)
+
+    try:
+        chain = OperatorChain.parse(args.op)
+    except ValueError as e:
+        parser.error(str(e))
+    if len(chain.stages) != 1:
+        parser.error("Exactly one operator stage is supported")
+    name, op_args = chain.stages[0]
+    if name not in TILE_OPERATORS:
+        parser.error(f"Operator '{name}' cannot run on tiles, expected one of: {', '.join(TILE_OPERATORS)}")
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error("Output must not overwrite the input")
+
+    source = open_image_array(args.input, args.shape, np.dtype(args.dtype))
+
+    if args.threads:
+        executor = BandExecutor(args.threads, band_rows=args.tile)
+        executor.run(name, source, op_args, output_path=args.output)
+        pieces = f"{executor.band_count} bands on {executor.threads} threads"
+    else:
+        executor = TileExecutor(args.tile)
+        executor.run(name, source, op_args, output_path=args.output)
+        pieces = f"{executor.tile_count} tiles"
+    megapixels = source.shape[0] * source.shape[1] / 1e6
+    print(f"{chain} over {source.shape[0]}x{source.shape[1]} in {pieces}: "
+          f"{executor.elapsed:.2f} s ({megapixels / executor.elapsed:.1f} MP/s)")
+
+
+if __name__ == '__main__':
+    main()
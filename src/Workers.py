@@ -0,0 +1,127 @@
+import time
+import traceback
+from PyQt6.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class JobSignals(QObject):
+    """
+    Signals of a single job, delivered to the GUI thread through queued connections.
+    """
+    done = pyqtSignal(object, int, object, float, object)
+
+
+class OperatorJob(QRunnable):
+    """
+    Runs one operator call on a pool thread and reports its result and duration.
+
+    A job that was superseded before a thread picked it up skips its work.
+    """
+
+    def __init__(self, key, generation, function, is_current):
+        super().__init__()
+        # The scheduler keeps the job alive until it reports back, so Qt must not delete it
+        self.setAutoDelete(False)
+        self.key = key
+        self.generation = generation
+        self.function = function
+        self.is_current = is_current
+        self.signals = JobSignals()
+
+    def run(self):
+        if not self.is_current(self.key, self.generation):
+            self.signals.done.emit(self.key, self.generation, None, 0.0, None)
+            return
+        start = time.perf_counter()
+        result, error = None, None
+        try:
+            result = self.function()
+        except Exception as e:
+            traceback.print_exc()
+            error = e
+        self.signals.done.emit(self.key, self.generation, result, time.perf_counter() - start, error)
+
+
+class JobScheduler(QObject):
+    """
+    Runs operator jobs on a QThreadPool and keeps only the latest job per key.
+
+    Jobs are keyed by the output they produce (e.g. an output port index).
+    Submitting a job for a key supersedes the previous one: if it has not
+    started yet it is taken off the queue, and if it is already running its
+    result is dropped when it arrives. Only results of the latest job per
+    key are delivered through finished or failed.
+    """
+
+    finished = pyqtSignal(object, object, float)
+    failed = pyqtSignal(object, object)
+    busy_changed = pyqtSignal(bool)
+
+    def __init__(self, max_threads=None, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        if max_threads:
+            self.pool.setMaxThreadCount(max_threads)
+        self.cancelled = 0
+        self._generations = {}
+        self._jobs = set()
+
+    def submit(self, key, function):
+        """
+        Queue function() for key, superseding any earlier job for the same key.
+
+        Args:
+            key: Identifies the output the job produces.
+            function (callable): Called without arguments on a pool thread.
+        """
+        generation = self._generations.get(key, 0) + 1
+        self._generations[key] = generation
+
+        for job in list(self._jobs):
+            if job.key == key and self.pool.tryTake(job):
+                self._jobs.discard(job)
+                self.cancelled += 1
+
+        job = OperatorJob(key, generation, function, self.is_current)
+        job.signals.done.connect(self._on_done)
+        if not self._jobs:
+            self.busy_changed.emit(True)
+        self._jobs.add(job)
+        self.pool.start(job)
+
+    def cancel(self, key):
+        """
+        Drop every queued or running job for key.
+        """
+        self._generations[key] = self._generations.get(key, 0) + 1
+        for job in list(self._jobs):
+            if job.key == key and self.pool.tryTake(job):
+                self._jobs.discard(job)
+                self.cancelled += 1
+        if not self._jobs:
+            self.busy_changed.emit(False)
+
+    def is_current(self, key, generation):
+        return self._generations.get(key) == generation
+
+    def is_busy(self):
+        return bool(self._jobs)
+
+    def pending(self):
+        return len(self._jobs)
+
+    def wait(self, msecs=-1):
+        """
+        Block until every started job has finished, e.g. before closing the window.
+        """
+        return self.pool.waitForDone(msecs)
+
+    def _on_done(self, key, generation, result, seconds, error):
+        self._jobs = {job for job in self._jobs if not (job.key == key and job.generation == generation)}
+        if not self.is_current(key, generation):
+            self.cancelled += 1
+        elif error is not None:
+            self.failed.emit(key, error)
+        else:
+            self.finished.emit(key, result, seconds)
+        if not self._jobs:
+            self.busy_changed.emit(False)
@@ -2,14 +2,26 @@ from PyQt6.QtWidgets import QWidget
 from PyQt6.QtGui import QPixmap, QImage, QPainter
 import logging
 import cv2
+import numpy as np
+from src.ImageStore import image_store
+from src.Profiler import profiler
+
+# Above this many source pixels, downscaling uses bilinear sampling instead of pixel-area averaging
+AREA_INTERPOLATION_MAX_PIXELS = 4_000_000
 
 
 class ImageViewport(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.original_img = None
-        self.resized_img = None
         self.image_path = None
+        # Decoded images are shared through the store, so setting a path again does not re-read the file
+        self.image_store = image_store
+        # Scaled copy of original_img for the current widget size and its QImage wrapper
+        self._scaled_source = None
+        self._scaled_size = None
+        self._scaled_img = None
+        self._scaled_qimage = None
 
     def set_image(self, image_path, grey_flag=False):
         """
@@ -24,19 +36,10 @@ class ImageViewport(QWidget):
             :param grey_flag:
         """
         try:
-            # Open the image file 
-            image = cv2.imread(image_path)
-
-            if image is None:
-                raise FileNotFoundError(f"Failed to load image: {image_path}")
+            # Get the decoded image from the store, as RGB or grayscale (read-only, shared with other ports)
+            image = self.image_store.get(image_path, "gray" if grey_flag else "rgb")
 
             self.image_path = image_path
-            if not grey_flag:
-                # Convert BGR to RGB
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-            else:
-                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
 
             # Set the original_img attribute 
             self.original_img = image
@@ -50,10 +53,48 @@ class ImageViewport(QWidget):
 
     def update_display(self):
         """
-        Update the display if the original image is not None.
+        Schedule a repaint if the original image is not None.
+
+        update() is used rather than repaint(), so several requests in a row
+        are coalesced into a single paint event.
         """
         if self.original_img is not None:
-            self.repaint()
+            self.update()
+
+    @property
+    def resized_img(self):
+        """
+        The original image scaled to fit the widget while preserving its aspect ratio.
+
+        The scaled buffer is cached and only recomputed when the image object
+        or the widget size changes.
+        """
+        if self.original_img is None:
+            return None
+        size = (self.width(), self.height())
+        if self._scaled_source is not self.original_img or self._scaled_size != size:
+            with profiler.span("scale_to_fit", "viewport"):
+                self._scaled_img = scale_to_fit(self.original_img, size)
+            self._scaled_qimage = None
+            self._scaled_source = self.original_img
+            self._scaled_size = size
+        return self._scaled_img
+
+    def _display_image(self):
+        """
+        QImage viewing the scaled buffer directly, without copying the pixels.
+        """
+        scaled = self.resized_img
+        if self._scaled_qimage is None:
+            # Check if the image is grayscale or RGB
+            if len(scaled.shape) == 2:  # Grayscale image
+                image_format = QImage.Format.Format_Grayscale8
+            else:  # RGB image
+                image_format = QImage.Format.Format_RGB888
+            # The QImage shares scaled's memory, which stays alive in self._scaled_img
+            self._scaled_qimage = QImage(scaled.data, scaled.shape[1], scaled.shape[0],
+                                         scaled.strides[0], image_format)
+        return self._scaled_qimage
 
     def paintEvent(self, event):
         """
@@ -65,30 +106,17 @@ class ImageViewport(QWidget):
         """
         super().paintEvent(event)
 
+        with profiler.span("paintEvent", "viewport"):
+            self._paint()
+
+    def _paint(self):
         if self.original_img is not None:
             painter_img = QPainter(self)
-            height, width = self.original_img.shape[:2]  # Get height and width
-
-            # Check if the image is grayscale or RGB
-            if len(self.original_img.shape) == 2:  # Grayscale image
-                image_format = QImage.Format.Format_Grayscale8
-
-            else:  # RGB image
-                image_format = QImage.Format.Format_RGB888
-
-            # Resize the image while preserving aspect ratio
-            aspect_ratio = width / height
-            target_width = min(self.width(), int(self.height() * aspect_ratio))
-            target_height = min(self.height(), int(self.width() / aspect_ratio))
-            self.resized_img = cv2.resize(self.original_img, (target_width, target_height))
+            image = self._display_image()
 
             # Calculate the position to center the image
-            x_offset = (self.width() - target_width) // 2
-            y_offset = (self.height() - target_height) // 2
-
-            # Convert image to QImage
-            image = QImage(self.resized_img.data, self.resized_img.shape[1], self.resized_img.shape[0],
-                           self.resized_img.strides[0], image_format)
+            x_offset = (self.width() - image.width()) // 2
+            y_offset = (self.height() - image.height()) // 2
 
             # Draw the image on the widget with the calculated offsets
             painter_img.drawImage(x_offset, y_offset, image)
@@ -106,6 +134,35 @@ class ImageViewport(QWidget):
         """
         print("Clearing image")
         self.original_img = None
-        self.repaint()
-
-
+        self._scaled_source = self._scaled_img = self._scaled_qimage = None
+        self.update()
+
+
+def scale_to_fit(image, size):
+    """
+    Resize an image to fit size (width, height) while preserving its aspect ratio.
+
+    Args:
+        image (numpy.ndarray): The image to resize.
+        size (tuple): (width, height) of the area to fit.
+
+    Returns:
+        numpy.ndarray: The resized image, or a contiguous view of image if it already fits exactly.
+    """
+    height, width = image.shape[:2]  # Get height and width
+
+    # Resize the image while preserving aspect ratio
+    aspect_ratio = width / height
+    target_width = max(1, min(size[0], int(size[1] * aspect_ratio)))
+    target_height = max(1, min(size[1], int(size[0] / aspect_ratio)))
+    if (target_width, target_height) == (width, height):
+        return np.ascontiguousarray(image)
+
+    # Pixel-area averaging gives the best downscale but reads every source pixel,
+    # bilinear only samples four per output pixel, which keeps huge images responsive
+    downscale = target_width < width
+    if downscale and width * height <= AREA_INTERPOLATION_MAX_PIXELS:
+        interpolation = cv2.INTER_AREA
+    else:
+        interpolation = cv2.INTER_LINEAR
+    return cv2.resize(image, (target_width, target_height), interpolation=interpolation)
@@ -0,0 +1,21 @@
+import cv2
+import numpy as np
+import pytest
+from src.Edge_Detector import EdgeDetector
+
+KERNELS = {
+    "roberts_detector": (np.array([[1, 0], [0, -1]]), np.array([[0, 1], [-1, 0]])),
+    "prewitt_detector": (np.array([[-1, 0, 1]] * 3), np.array([[-1, -1, -1], [0, 0, 0], [1, 1, 1]])),
+}
+
+
+@pytest.mark.parametrize("detector", sorted(KERNELS))
+def test_magnitudes_above_255_wrap_around_in_the_uint8_cast(detector):
+    image = np.random.default_rng(0).integers(0, 256, (64, 48), dtype=np.uint8)
+    kernel_x, kernel_y = KERNELS[detector]
+    magnitude = np.hypot(cv2.filter2D(image, cv2.CV_64F, kernel_x), cv2.filter2D(image, cv2.CV_64F, kernel_y))
+
+    result = getattr(EdgeDetector(image), detector)()
+
+    assert (magnitude > 255).any()
+    assert np.array_equal(result, magnitude.astype(np.int32).astype(np.uint8))
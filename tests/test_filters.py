@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from src.Filters import median_blur
+
+
+def loop_median(image, kernel_size):
+    """
+    The original per-pixel median filter with zero padding, kept as the reference.
+    """
+    radius = kernel_size // 2
+    result = np.zeros_like(image)
+    for i in range(image.shape[0]):
+        for j in range(image.shape[1]):
+            values = []
+            for m in range(-radius, radius + 1):
+                for n in range(-radius, radius + 1):
+                    if 0 <= i + m < image.shape[0] and 0 <= j + n < image.shape[1]:
+                        values.append(image[i + m, j + n])
+                    else:
+                        values.append(0)
+            values.sort()
+            result[i, j] = values[len(values) // 2]
+    return result
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.uint16, np.float32, np.float64])
+@pytest.mark.parametrize("kernel_size", [3, 7, 9])
+def test_median_blur_matches_loop_reference(dtype, kernel_size):
+    rng = np.random.default_rng(kernel_size)
+    if np.issubdtype(dtype, np.integer):
+        image = rng.integers(0, np.iinfo(dtype).max, (17, 13), endpoint=True).astype(dtype)
+    else:
+        image = (rng.random((17, 13)) * 1000 - 200).astype(dtype)
+
+    result = median_blur(image, kernel_size)
+
+    assert result.dtype == dtype
+    assert np.array_equal(result, loop_median(image, kernel_size))
+
+
+@pytest.mark.parametrize("channels", [2, 3, 5])
+def test_median_blur_filters_channels_separately(channels):
+    image = np.random.default_rng(channels).integers(0, 256, (15, 12, channels), dtype=np.uint8)
+
+    result = median_blur(image, 7)
+
+    for channel in range(channels):
+        assert np.array_equal(result[..., channel], loop_median(image[..., channel], 7))
@@ -0,0 +1,35 @@
+import numpy as np
+from src.Graph import BufferPool, Graph
+
+
+def test_pool_memory_stays_flat_across_mixed_image_sizes():
+    graph = Graph.from_chain("equalize | global_threshold:100 | median:3 | gamma:1.5")
+    rng = np.random.default_rng(0)
+    largest = 0
+    for index in range(200):
+        image = rng.integers(0, 256, (20 + index, 30 + index % 17), dtype=np.uint8)
+        largest = max(largest, image.nbytes)
+        graph.set_source(image)
+        graph.compute()
+        assert graph.pool.stats()["shapes"] <= 1
+        assert graph.pool.free_bytes <= 2 * largest
+
+
+def test_pool_reuses_buffers_for_images_of_one_size():
+    graph = Graph.from_chain("equalize | median:3 | gamma:1.5")
+    rng = np.random.default_rng(0)
+    for _ in range(10):
+        graph.set_source(rng.integers(0, 256, (40, 50), dtype=np.uint8))
+        graph.compute()
+
+    assert graph.pool.reused >= 9
+
+
+def test_pool_drops_least_recently_released_shapes_over_budget():
+    pool = BufferPool(max_bytes=1000)
+    for size in range(10, 30):
+        pool.release(np.empty((size, size), np.uint8))
+
+    assert pool.free_bytes <= 1000
+    assert pool.take((29, 29), np.uint8).shape == (29, 29)
+    assert pool.reused == 1
@@ -0,0 +1,27 @@
+import numpy as np
+import pytest
+from src.Histogram import compute_histogram, get_histograms
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.float32, np.float64])
+def test_get_histograms_matches_numpy_histogram(dtype):
+    image = (np.random.default_rng(0).random((40, 30, 3)) * 300 - 20).astype(dtype)
+
+    histograms = get_histograms(image)
+
+    for channel, name in enumerate("RGB"):
+        expected = np.histogram(image[..., channel], bins=256, range=(0, 256))[0]
+        assert np.array_equal(histograms[name][0], expected)
+        assert np.array_equal(histograms[name][1], expected.cumsum())
+
+
+def test_update_recounts_only_the_changed_region():
+    rng = np.random.default_rng(1)
+    image = rng.integers(0, 256, (32, 32), dtype=np.uint8)
+    histogram = compute_histogram(image)
+
+    tile = rng.integers(0, 256, (8, 8), dtype=np.uint8)
+    histogram.update(image[8:16, 8:16], tile)
+    image[8:16, 8:16] = tile
+
+    assert np.array_equal(histogram.counts, compute_histogram(image).counts)
@@ -0,0 +1,28 @@
+import numpy as np
+import pytest
+from src.Hybrid import Hybrid, normalize_image
+from src.Precision import DOUBLE
+
+
+def reference_filter(image, degree, high_pass):
+    """
+    The original centered complex FFT filter, with the mask built by broadcasting.
+    """
+    rows, cols = image.shape
+    distance = np.hypot(*np.meshgrid(np.arange(rows) - rows // 2, np.arange(cols) - cols // 2, indexing="ij"))
+    mask = np.exp(-0.5 * (distance / 10) ** ((degree + 1) / 25.6)).astype(np.float32)
+    if high_pass:
+        mask = 1 - mask
+    filtered = np.fft.ifft2(np.fft.ifftshift(np.fft.fftshift(np.fft.fft2(image)) * mask))
+    return normalize_image(np.abs(filtered)).astype(np.uint8)
+
+
+@pytest.mark.parametrize("shape", [(64, 64), (67, 53), (101, 97)])
+@pytest.mark.parametrize("high_pass", [False, True])
+def test_hybrid_matches_complex_fft_reference_at_any_size(shape, high_pass):
+    image = np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+    hybrid = Hybrid(precision=DOUBLE)
+
+    result = hybrid.high_pass(image, 60) if high_pass else hybrid.low_pass(image, 60)
+
+    assert np.array_equal(result, reference_filter(image, 60, high_pass))
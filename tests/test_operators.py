@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+from src.Operators import GRAYSCALE_ONLY, OPERATORS, OperatorChain
+
+
+def test_chain_rejects_grayscale_only_stages_for_colour_input():
+    chain = OperatorChain.parse("median:3 | canny | equalize")
+
+    chain.check_channels(1)
+    with pytest.raises(ValueError, match="canny"):
+        chain.check_channels(3)
+
+
+@pytest.mark.parametrize("name", [name for name in OPERATORS if name not in GRAYSCALE_ONLY])
+def test_other_operators_accept_colour_images(name):
+    image = np.random.default_rng(0).integers(0, 256, (24, 32, 3), dtype=np.uint8)
+
+    OperatorChain.parse(name).check_channels(3)
+    assert np.asarray(OPERATORS[name](image)).shape == image.shape
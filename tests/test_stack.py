@@ -0,0 +1,116 @@
+import numpy as np
+import pytest
+from src.Decoding import Decoding
+from src.Edge_Detector import EdgeDetector
+from src.Filters import Filter
+from src.PointOps import (PointOpChain, equalize_lut, equalize_tables, normalize_lut, normalize_tables,
+                          percentile_stretch_lut, percentile_stretch_tables)
+from src.Stack import apply_tables, stack_histograms
+from src.Thresholding import thresholding
+
+
+def random_stack(shape, dtype=np.uint8, seed=0):
+    rng = np.random.default_rng(seed)
+    if np.issubdtype(dtype, np.integer):
+        stack = rng.integers(0, np.iinfo(dtype).max, shape, endpoint=True, dtype=dtype)
+    else:
+        stack = rng.random(shape).astype(dtype)
+    # Vary the ranges so every image gets different per-image statistics
+    if dtype == np.uint8:
+        stack[0] //= 4
+        stack[1] = stack[1] // 2 + 100
+        stack[2] = 77
+    return stack
+
+
+def assert_batch_equals_per_image(run, stack):
+    expected = np.stack([run(image, batch=False) for image in stack])
+    result = run(stack, batch=True)
+    assert result.dtype == expected.dtype
+    assert np.array_equal(result, expected)
+
+
+def test_stack_histograms_and_apply_tables_match_per_image():
+    stack = random_stack((7, 20, 30, 3))
+    tables = np.random.default_rng(1).integers(0, 256, (7, 256), dtype=np.uint8)
+
+    histograms = stack_histograms(stack)
+
+    assert np.array_equal(histograms, [np.bincount(image.ravel(), minlength=256) for image in stack])
+    assert np.array_equal(apply_tables(tables, stack), [table[image] for table, image in zip(tables, stack)])
+
+
+def test_table_builders_match_single_histogram_tables():
+    stack = random_stack((6, 32, 32))
+    histograms = stack_histograms(stack).astype(np.float64)
+    histograms[5] = 0
+
+    for tables, lut in [(equalize_tables(histograms), equalize_lut),
+                        (normalize_tables(histograms), normalize_lut),
+                        (percentile_stretch_tables(histograms, 5, 90),
+                         lambda histogram: percentile_stretch_lut(histogram, 5, 90))]:
+        assert np.array_equal(tables, [lut(histogram).table for histogram in histograms])
+
+
+def test_compile_tables_matches_compile_per_image():
+    histograms = stack_histograms(random_stack((6, 32, 32)))
+    chain = PointOpChain().gamma(0.5).equalize().contrast_stretch(5, 95).threshold(100)
+
+    tables = chain.compile_tables(histograms)
+
+    assert np.array_equal(tables, [chain.compile(histogram=histogram).table for histogram in histograms])
+
+
+@pytest.mark.parametrize("operation", [
+    lambda decoding: decoding.equalize(),
+    lambda decoding: decoding.normalize(),
+    lambda decoding: decoding.gamma_correction(0.6),
+    lambda decoding: decoding.contrast_stretch(5, 95),
+    lambda decoding: decoding.apply_point_ops(PointOpChain().normalize().gamma(2).equalize()),
+])
+def test_decoding_batch_equals_per_image(operation):
+    assert_batch_equals_per_image(lambda images, batch: operation(Decoding(images, batch=batch)),
+                                  random_stack((5, 24, 40)))
+
+
+@pytest.mark.parametrize("dtype, kernel_size", [
+    (np.uint8, 3), (np.uint8, 9), (np.uint16, 5), (np.uint16, 7), (np.float32, 5), (np.float64, 3),
+])
+@pytest.mark.parametrize("border_mode", ["constant", "reflect101"])
+def test_median_batch_equals_per_image(dtype, kernel_size, border_mode):
+    assert_batch_equals_per_image(
+        lambda images, batch: Filter(images, kernel_size, batch=batch).median_filter(border_mode),
+        random_stack((4, 21, 33), dtype))
+
+
+@pytest.mark.parametrize("operation", [
+    lambda image_filter: image_filter.average_filter(),
+    lambda image_filter: image_filter.gaussian_filter(sigma=1.5),
+])
+def test_linear_filter_batch_equals_per_image(operation):
+    assert_batch_equals_per_image(lambda images, batch: operation(Filter(images, 5, batch=batch)),
+                                  random_stack((4, 21, 33, 3)))
+
+
+@pytest.mark.parametrize("method", ["mean", "niblack", "sauvola"])
+@pytest.mark.parametrize("window_size", [3, 15, 41])
+def test_local_thresholding_batch_equals_per_image(method, window_size):
+    assert_batch_equals_per_image(
+        lambda images, batch: thresholding(images, batch=batch).local_thresholding(method, window_size),
+        random_stack((5, 24, 40)))
+
+
+def test_global_thresholding_batch_equals_per_image():
+    assert_batch_equals_per_image(lambda images, batch: thresholding(images, batch=batch).global_thresholding(),
+                                  random_stack((5, 24, 40)))
+
+
+@pytest.mark.parametrize("operation", [
+    lambda detector: detector.sobel_detector(),
+    lambda detector: detector.roberts_detector(),
+    lambda detector: detector.prewitt_detector(),
+    lambda detector: detector.canny_detector(),
+])
+def test_edge_detector_batch_equals_per_image(operation):
+    assert_batch_equals_per_image(lambda images, batch: operation(EdgeDetector(images, batch=batch)),
+                                  random_stack((4, 24, 40)))
@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from src.Thresholding import thresholding
+
+
+@pytest.mark.parametrize("method", ["mean", "niblack", "sauvola"])
+def test_local_thresholding_colour_thresholds_each_channel(method):
+    image = np.random.default_rng(0).integers(0, 256, (64, 48, 3), dtype=np.uint8)
+
+    result = thresholding(image).local_thresholding(method, 15)
+
+    expected = np.stack([thresholding(np.ascontiguousarray(image[..., channel])).local_thresholding(method, 15)
+                         for channel in range(3)], axis=-1)
+    assert result.dtype == np.uint8
+    assert np.array_equal(result, expected)
+
+
+def test_local_thresholding_rejects_even_window():
+    image = np.zeros((16, 16), dtype=np.uint8)
+
+    with pytest.raises(ValueError):
+        thresholding(image).local_thresholding("mean", 10)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+from src.Kernels import FFT_KERNEL_SIZE
+from src.Operators import OPERATORS
+from src.Tiling import TILE_OPERATORS, BandExecutor, TileExecutor
+
+# Arguments every tileable operator is checked with, kernels wider than a tile's halo included
+TILE_CASES = [
+    ("median", (3,)), ("median", (9,)),
+    ("average", (5,)), ("average", (15,)),
+    ("gaussian", (5, 1)), ("gaussian", (21, 4)),
+    ("roberts", ()), ("prewitt", ()), ("sobel", ()),
+    ("local_threshold", (11, "mean")), ("local_threshold", (25, "sauvola")),
+]
+
+
+def test_every_tile_operator_is_covered():
+    assert {name for name, _ in TILE_CASES} == set(TILE_OPERATORS)
+
+
+@pytest.fixture(scope="module")
+def image():
+    return np.random.default_rng(0).integers(0, 256, (150, 130), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("name, args", TILE_CASES)
+def test_tiled_output_equals_whole_image_output(image, name, args):
+    tiled = TileExecutor(tile_size=32).run(name, image, args)
+
+    assert np.array_equal(tiled, OPERATORS[name](image, *args))
+
+
+def test_tiled_memory_mapped_run_writes_whole_image_output(image, tmp_path):
+    np.save(tmp_path / "input.npy", image)
+    source = np.load(tmp_path / "input.npy", mmap_mode="r")
+
+    TileExecutor(tile_size=48).run("sobel", source, output_path=str(tmp_path / "output.npy"))
+
+    assert np.array_equal(np.load(tmp_path / "output.npy"), OPERATORS["sobel"](image))
+
+
+def test_tiled_fft_gaussian_equals_whole_image_output():
+    image = np.random.default_rng(1).integers(0, 256, (420, 380), dtype=np.uint8)
+    kernel_size = FFT_KERNEL_SIZE + 2
+
+    tiled = TileExecutor(tile_size=160).run("gaussian", image, (kernel_size, 40))
+
+    assert np.array_equal(tiled, OPERATORS["gaussian"](image, kernel_size, 40))
+
+
+@pytest.mark.parametrize("name, args", TILE_CASES)
+def test_banded_output_equals_whole_image_output(image, name, args):
+    banded = BandExecutor(threads=3, band_rows=16).run(name, image, args)
+
+    assert np.array_equal(banded, OPERATORS[name](image, *args))
+
+
+def test_banded_memory_mapped_run_writes_whole_image_output(image, tmp_path):
+    np.save(tmp_path / "input.npy", image)
+    source = np.load(tmp_path / "input.npy", mmap_mode="r")
+
+    BandExecutor(threads=2, band_rows=40).run("median", source, (9,), output_path=str(tmp_path / "output.npy"))
+
+    assert np.array_equal(np.load(tmp_path / "output.npy"), OPERATORS["median"](image, 9))
+
+
+def test_banded_fft_gaussian_equals_whole_image_output():
+    image = np.random.default_rng(1).integers(0, 256, (420, 380), dtype=np.uint8)
+    kernel_size = FFT_KERNEL_SIZE + 2
+
+    banded = BandExecutor(threads=2, band_rows=150).run("gaussian", image, (kernel_size, 40))
+
+    assert np.array_equal(banded, OPERATORS["gaussian"](image, kernel_size, 40))